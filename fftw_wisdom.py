@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+FFTW wisdom of the solvers, loaded at startup and saved at exit, so that
+expensive planning is only done once per machine.
+
+The wisdom file is fftw_wisdom.dat in the working directory, or the file given
+by the FFTW_WISDOM environment variable (e.g. one file shared by all runs of a
+sweep of sweep_runner.py). The file is written through a temporary file and a
+rename, so that a crash never leaves a partial file. The module is shared by
+the spectral solver and its tune_fft.py (spectral_LES_solver) and the finite
+difference solver (finite_diff_LES_solver), which put the repository folder on
+sys.path to import it.
+
+"""
+
+import os
+import pickle
+import pyfftw
+
+wisdom_file = os.environ.get('FFTW_WISDOM', 'fftw_wisdom.dat')
+
+#%%
+def load_wisdom(filename=None):
+
+    '''
+    import FFTW wisdom saved by save_wisdom (default: wisdom_file), return
+    False if the file does not exist
+    '''
+
+    if filename is None:
+        filename = wisdom_file
+
+    if not os.path.exists(filename):
+        return False
+
+    with open(filename, 'rb') as f:
+        pyfftw.import_wisdom(pickle.load(f))
+
+    return True
+
+#%%
+def save_wisdom(filename=None):
+
+    '''
+    export the FFTW wisdom accumulated so far (including imported wisdom) to
+    filename (default: wisdom_file), through a temporary file of this process
+    and a rename. The wisdom saved to the file by other runs in the meantime
+    is imported first, so that runs sharing the file keep each other's plans.
+    '''
+
+    if filename is None:
+        filename = wisdom_file
+
+    load_wisdom(filename)
+
+    tmp = filename+'.'+str(os.getpid())+'.tmp'
+    with open(tmp, 'wb') as f:
+        pickle.dump(pyfftw.export_wisdom(), f)
+    os.replace(tmp, filename)
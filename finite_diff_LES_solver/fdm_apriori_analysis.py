@@ -16,6 +16,10 @@ from scipy import linalg
 import matplotlib.pyplot as plt 
 import time as tm
 import matplotlib.ticker as ticker
+import os
+import sys
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from snapshot_archive import ArchiveReader
 
 font = {'family' : 'Times New Roman',
         'size'   : 14}    
@@ -362,9 +366,18 @@ dy = ly/np.float64(ny)
 dxc = lx/np.float64(nxc)
 dyc = ly/np.float64(nyc)
 #%%
+# the streamfunction is read from the memory-mapped archive if the solver
+# wrote one (iout = 1), else from the .csv files
+archive = None
+if os.path.exists("fdm/data/archive/index.npy"):
+    archive = ArchiveReader("fdm/data")
+
 for n in range(1,51):
-    file_input = "fdm/data/05_streamfunction/s_"+str(n)+".csv"
-    s = np.genfromtxt(file_input, delimiter=',')
+    if archive is not None:
+        s = archive.get('s', output=n)
+    else:
+        file_input = "fdm/data/05_streamfunction/s_"+str(n)+".csv"
+        s = np.genfromtxt(file_input, delimiter=',')
     #u,v = compute_velocity(nx,ny,dx,dy,s)
     sx,sy = grad_spectral(nx,ny,s)
     u = sy
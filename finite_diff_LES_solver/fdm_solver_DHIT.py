@@ -20,6 +20,13 @@ from scipy import linalg
 import matplotlib.pyplot as plt 
 import time as tm
 import matplotlib.ticker as ticker
+import os
+import sys
+import atexit
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from snapshot_archive import write_archive
+from spectrum import shell_spectrum
+from fftw_wisdom import load_wisdom, save_wisdom
 
 font = {'family' : 'Times New Roman',
         'size'   : 14}    
@@ -54,8 +61,8 @@ def fps(nx, ny, dx, dy, f):
     a = pyfftw.empty_aligned((nx,ny),dtype= 'complex128')
     b = pyfftw.empty_aligned((nx,ny),dtype= 'complex128')
     
-    fft_object = pyfftw.FFTW(a, b, axes = (0,1), direction = 'FFTW_FORWARD')
-    fft_object_inv = pyfftw.FFTW(a, b,axes = (0,1), direction = 'FFTW_BACKWARD')
+    fft_object = pyfftw.FFTW(a, b, axes = (0,1), direction = 'FFTW_FORWARD', threads = nthreads)
+    fft_object_inv = pyfftw.FFTW(a, b,axes = (0,1), direction = 'FFTW_BACKWARD', threads = nthreads)
     
     e = fft_object(data)
     #e = pyfftw.interfaces.scipy_fftpack.fft2(data)
@@ -245,7 +252,7 @@ def decay_ic(nx,ny,dx,dy):
     a = pyfftw.empty_aligned((nx,ny),dtype= 'complex128')
     b = pyfftw.empty_aligned((nx,ny),dtype= 'complex128')
     
-    fft_object_inv = pyfftw.FFTW(a, b,axes = (0,1), direction = 'FFTW_BACKWARD')
+    fft_object_inv = pyfftw.FFTW(a, b,axes = (0,1), direction = 'FFTW_BACKWARD', threads = nthreads)
     ut = np.real(fft_object_inv(wf)) 
     
     #w = np.zeros((nx+3,ny+3))
@@ -281,54 +288,15 @@ def vm_ic(nx,ny,x,y):
 #%%
 # compute the energy spectrum numerically
 def energy_spectrum(nx,ny,w):
-    epsilon = 1.0e-6
-
-    kx = np.empty(nx)
-    ky = np.empty(ny)
-    
-    kx[0:int(nx/2)] = 2*np.pi/(np.float64(nx)*dx)*np.float64(np.arange(0,int(nx/2)))
-    kx[int(nx/2):nx] = 2*np.pi/(np.float64(nx)*dx)*np.float64(np.arange(-int(nx/2),0))
-
-    ky[0:ny] = kx[0:ny]
-    
-    kx[0] = epsilon
-    ky[0] = epsilon
+    # half spectrum of the real field, the shell average is done by
+    # shell_spectrum
+    a = pyfftw.empty_aligned((nx,ny),dtype= 'float64')
+    b = pyfftw.empty_aligned((nx,int(ny/2)+1),dtype= 'complex128')
 
-    kx, ky = np.meshgrid(kx, ky, indexing='ij')
-    
-    a = pyfftw.empty_aligned((nx,ny),dtype= 'complex128')
-    b = pyfftw.empty_aligned((nx,ny),dtype= 'complex128')
-
-    fft_object = pyfftw.FFTW(a, b, axes = (0,1), direction = 'FFTW_FORWARD')
+    fft_object = pyfftw.FFTW(a, b, axes = (0,1), direction = 'FFTW_FORWARD', threads = nthreads)
     wf = fft_object(w[1:nx+1,1:ny+1]) 
     
-    es =  np.empty((nx,ny))
-    
-    kk = np.sqrt(kx[:,:]**2 + ky[:,:]**2)
-    es[:,:] = np.pi*((np.abs(wf[:,:])/(nx*ny))**2)/kk
-    
-    n = int(np.sqrt(nx*nx + ny*ny)/2.0)-1
-    
-    en = np.zeros(n+1)
-    
-    for k in range(1,n+1):
-        en[k] = 0.0
-        ic = 0
-        ii,jj = np.where((kk[1:,1:]>(k-0.5)) & (kk[1:,1:]<(k+0.5)))
-        ic = ii.size
-        ii = ii+1
-        jj = jj+1
-        en[k] = np.sum(es[ii,jj])
-#        for i in range(1,nx):
-#            for j in range(1,ny):          
-#                kk1 = np.sqrt(kx[i,j]**2 + ky[i,j]**2)
-#                if ( kk1>(k-0.5) and kk1<(k+0.5) ):
-#                    ic = ic+1
-#                    en[k] = en[k] + es[i,j]
-                    
-        en[k] = en[k]/ic
-        
-    return en, n
+    return shell_spectrum(nx,ny,wf)
 
 #%%
 def plotimage(x,y):
@@ -387,6 +355,22 @@ isc = np.int64(l1[6][0])
 ich = np.int64(l1[7][0])
 ipr = np.int64(l1[8][0])
 ndc = np.int64(l1[9][0])
+nthreads = int(l1[12][0]) if len(l1) > 12 else 0
+iseed = int(l1[13][0]) if len(l1) > 13 else 1
+iout = int(l1[14][0]) if len(l1) > 14 else 0
+
+# seed of the random initial field of the decay problem
+seed(iseed)
+
+# FFTW threads used in fps, decay_ic and energy_spectrum, nthreads = 0 takes
+# PYFFTW_NUM_THREADS from the environment
+if nthreads <= 0:
+    nthreads = pyfftw.config.NUM_THREADS
+
+# FFTW wisdom from previous runs (or tune_fft.py), saved again at exit
+# (temporary file and rename, so that a crash never leaves a partial file)
+load_wisdom()
+atexit.register(save_wisdom)
 
 freq = int(nt/ns)
 
@@ -443,7 +427,7 @@ s = fps(nx, ny, dx, dy, -w)
 s = bc(nx,ny,s)
 
 #%% coarsening
-def write_data(nx,ny,dx,dy,nxc,nyc,dxc,dyc,w,s,k,freq):
+def write_data(nx,ny,dx,dy,nxc,nyc,dxc,dyc,w,s,k,freq,iout=0):
     wc = np.zeros((nxc+3,nyc+3))
     sc = np.zeros((nxc+3,nyc+3))
     
@@ -463,6 +447,13 @@ def write_data(nx,ny,dx,dy,nxc,nyc,dxc,dyc,w,s,k,freq):
         
     sgs = jc - jcoarse
     
+    # iout = 1: memory-mapped archive fdm/data/archive of the ns outputs (the
+    # fields with the ghost points as in the .csv files)
+    if iout == 1:
+        write_archive("fdm/data", int(k/freq), k, dt*k, re,
+                      {'jc': jc, 'jcoarse': jcoarse, 'sgs': sgs, 'w': w, 's': s}, ns)
+        return
+    
     filename = "fdm/data/01_coarsened_jacobian_field/J_fourier_"+str(int(k/freq))+".csv"
     np.savetxt(filename, jc, delimiter=",")    
     filename = "fdm/data/02_jacobian_coarsened_field/J_coarsen_"+str(int(k/freq))+".csv"
@@ -515,7 +506,7 @@ for k in range(1,nt+1):
     if (k%freq == 0):
         #u,v = compute_velocity(nx,ny,dx,dy,s)
         #compute_stress(nx,ny,nxc,nyc,dxc,dyc,u,v,k,freq)
-        write_data(nx,ny,dx,dy,nxc,nyc,dxc,dyc,w,s,k,freq)
+        write_data(nx,ny,dx,dy,nxc,nyc,dxc,dyc,w,s,k,freq,iout)
         print(k, " ", time)
 
 total_clock_time = tm.time() - clock_time_init
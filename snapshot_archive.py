@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Memory-mapped archive of the solver output with random access by time.
+
+Every field (w, s, jc, jcoarse, sgs) is one .npy file holding all snapshots of
+the run as a (T,nx+1,ny+1) array (the finite difference solver writes its
+fields with the ghost points, (T,nx+3,ny+3)), allocated with
+np.lib.format.open_memmap when the first snapshot is written (T = number of
+outputs ns). A snapshot is written to its slot (output number - 1) of the
+mapped file, so writing an output only touches the pages of that snapshot.
+The index index.npy holds the output number, time step, time and Reynolds
+number of every slot (step = -1 for slots not written yet) and is updated
+after the fields are flushed, so a snapshot is in the index only once it is
+complete. Like the snapshot store, a snapshot written to a slot drops the
+later slots from the index (a run restarted from an earlier output). A run
+restarted with more outputs grows the files, the snapshots already written
+are copied into the larger files; files of another grid or data type are not
+touched (ValueError).
+
+    <folder>/archive/w.npy, s.npy, ... : (T,nx+1,ny+1) fields
+    <folder>/archive/index.npy         : (T,) output, step, time, re
+
+ArchiveReader maps the files read-only and returns views of the mapped
+arrays, so a snapshot or a sub-region of it is read from disk only when it is
+used, without parsing or copying the rest of the run. The module is shared
+by the spectral solvers (spectral_LES_solver), the finite difference solver
+(finite_diff_LES_solver) and their a priori analyses, which put the
+repository folder on sys.path to import it.
+
+"""
+
+import os
+import numpy as np
+from numpy.lib.format import open_memmap
+
+index_dtype = np.dtype([('output', np.int64), ('step', np.int64), ('time', np.float64),
+                        ('re', np.float64)])
+
+#%%
+def open_field(filename, shape, dtype):
+
+    '''
+    map an archive file for writing, creating it with the shape (T,...) if it
+    does not exist, or growing it to T snapshots if it holds fewer (the
+    snapshots of the file are kept)
+
+    Output
+    ------
+    field : mapped array of at least T snapshots
+    nold : number of snapshots of the existing file (0 if it was created)
+    '''
+
+    if not os.path.exists(filename):
+        return open_memmap(filename, mode='w+', dtype=dtype, shape=shape), 0
+
+    field = open_memmap(filename, mode='r+')
+    if field.shape[1:] != shape[1:] or field.dtype != dtype:
+        raise ValueError('the archive file '+filename+' holds '+str(field.dtype)+' snapshots of '+
+                         str(field.shape[1:])+', not '+str(np.dtype(dtype))+' of '+str(shape[1:]))
+
+    nold = field.shape[0]
+    if nold >= shape[0]:
+        return field, nold
+
+    # grow the file: copy the snapshots into a larger file one at a time and
+    # replace the file with it
+    grown = open_memmap(filename+'.tmp', mode='w+', dtype=dtype, shape=shape)
+    for i in range(nold):
+        grown[i] = field[i]
+    grown.flush()
+    del field
+    os.replace(filename+'.tmp', filename)
+
+    return grown, nold
+
+#%%
+def write_archive(folder, output, step, time, re, data, nsnap):
+
+    '''
+    write a snapshot to the archive in folder/archive
+
+    Inputs
+    ------
+    folder : output folder of the run
+    output : output number (1 to nsnap), the snapshot is written to slot output-1
+    step : time step of the snapshot
+    time : time of the snapshot
+    re : Reynolds number
+    data : dictionary {name: field} of the fields, e.g. jc, jcoarse, sgs, w, s
+    nsnap : number of snapshots T the files are allocated for (files of an
+            earlier run with fewer snapshots are grown to nsnap)
+    '''
+
+    folder = os.path.join(folder, 'archive')
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+
+    nsnap = int(nsnap)
+    slot = int(output) - 1
+    if slot < 0 or slot >= nsnap:
+        raise IndexError('output '+str(output)+' is outside the archive of '+str(nsnap)+' snapshots')
+
+    # the files are never shrunk, the snapshots of a longer earlier run stay
+    filename = os.path.join(folder, 'index.npy')
+    if os.path.exists(filename):
+        nsnap = max(nsnap, np.load(filename, mmap_mode='r').shape[0])
+
+    for name, field in data.items():
+        field = np.asarray(field)
+        mapped = open_field(os.path.join(folder, name+'.npy'), (nsnap,)+field.shape, field.dtype)[0]
+        mapped[slot] = field
+        mapped.flush()
+        del mapped
+
+    index, nold = open_field(filename, (nsnap,), index_dtype)
+    index['step'][nold:] = -1
+    index['step'][slot+1:] = -1
+    index[slot] = (output, step, time, re)
+    index.flush()
+    del index
+
+#%%
+class ArchiveReader(object):
+
+    '''
+    read-only access to the archive in folder/archive
+
+    Inputs
+    ------
+    folder : output folder of the run
+
+    Attributes
+    ----------
+    outputs, steps, times, re : output number, time step, time and Reynolds
+                                number of the snapshots written so far
+    '''
+
+    def __init__(self, folder):
+        self.folder = os.path.join(folder, 'archive')
+        index = np.load(os.path.join(self.folder, 'index.npy'))
+        self.slots = np.flatnonzero(index['step'] >= 0)
+        self.outputs = index['output'][self.slots]
+        self.steps = index['step'][self.slots]
+        self.times = index['time'][self.slots]
+        self.re = index['re'][self.slots]
+        self.fields = {}
+
+    def __len__(self):
+        return self.slots.size
+
+    def field(self, name):
+
+        '''
+        return the mapped (T,...) array of the field name
+        '''
+
+        if name not in self.fields:
+            self.fields[name] = np.load(os.path.join(self.folder, name+'.npy'), mmap_mode='r')
+
+        return self.fields[name]
+
+    def find(self, output=None, time=None):
+
+        '''
+        return the index of the snapshot with the output number output, or of
+        the snapshot closest to time
+        '''
+
+        if output is not None:
+            index = np.flatnonzero(self.outputs == output)
+            if index.size == 0:
+                raise KeyError('output '+str(output)+' is not in the archive '+self.folder)
+            return int(index[0])
+
+        return int(np.argmin(np.abs(self.times - time)))
+
+    def get(self, name, index=None, output=None, time=None):
+
+        '''
+        return a view of the field name of a snapshot, selected by its index,
+        its output number or the time closest to time (no data is copied, the
+        pages are read when the view is used)
+        '''
+
+        if index is None:
+            index = self.find(output, time)
+
+        return self.field(name)[self.slots[index]]
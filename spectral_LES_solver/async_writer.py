@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Background writer for the output of the spectral solver.
+
+write_data computes the derived fields (streamfunction, Jacobians, coarsened
+fields) and writes them (text files, snapshot store or archive), during which
+the time loop would stop; the figures are drawn from the written output by
+render_frames.py in a separate process. AsyncWriter runs write_data in a worker thread
+instead: the time loop puts the arguments (with a copy of wnf) into a bounded
+queue and continues. When the queue is full, submit waits until the worker has
+taken an output (backpressure), so at most maxsize copies of the field are
+held. close waits until the queue is drained and the last output is written.
+
+The worker thread uses its own FFTW plans and Jacobian workspaces (the caches
+of fft_plans and nonlinear_terms are per thread), the FFTs and the NumPy array
+operations release the GIL, so most of the output overlaps with the time loop.
+The workspaces of the worker use NumPy instead of the Numba kernels, which may
+not run in two threads at the same time.
+An exception in the worker is raised again by the next submit or by close.
+
+"""
+
+import queue
+import threading
+import time as tm
+
+#%%
+class AsyncWriter(object):
+
+    '''
+    run function(*args) for every submitted output in a worker thread
+
+    Inputs
+    ------
+    function : output function, e.g. write_data
+    maxsize : number of outputs the queue holds before submit waits
+    '''
+
+    def __init__(self, function, maxsize=2):
+        self.function = function
+        self.queue = queue.Queue(maxsize=max(1, int(maxsize)))
+        self.error = None
+        self.wait_time = 0.0
+        self.noutputs = 0
+
+        self.worker = threading.Thread(target=self.run, name='AsyncWriter', daemon=True)
+        self.worker.start()
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                self.queue.task_done()
+                break
+            args, kwargs = item
+            try:
+                if self.error is None:
+                    self.function(*args, **kwargs)
+            except BaseException as e:
+                self.error = e
+            self.queue.task_done()
+
+    def check(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise RuntimeError('output failed in the background writer') from error
+
+    def submit(self, *args, **kwargs):
+
+        '''
+        queue an output, waiting while the queue is full; arrays changed by
+        the caller afterwards (wnf) have to be passed as copies
+        '''
+
+        self.check()
+        t0 = tm.time()
+        self.queue.put((args, kwargs))
+        self.wait_time += tm.time() - t0
+        self.noutputs += 1
+
+    def close(self):
+
+        '''
+        wait until all queued outputs are written and stop the worker
+
+        Output
+        ------
+        drain_time : time in seconds waited for the queue to be drained
+        '''
+
+        t0 = tm.time()
+        self.queue.put(None)
+        self.worker.join()
+        drain_time = tm.time() - t0
+        self.check()
+
+        return drain_time
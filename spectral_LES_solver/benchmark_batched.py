@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the batched inverse FFT of the dealiased Jacobian.
+
+The dealiased Jacobian in nonlinear_terms.py pads the four derivative fields
+into one (4,nxe,nye) buffer and transforms them with a single batched inverse
+plan. This script compares it with the previous path, which allocated four
+padded arrays and called the (nxe,nye) inverse plan four times, and checks that
+both give the same Jacobian.
+
+usage: python benchmark_batched.py [-n 1024 2048 4096] [-p 1.5] [-r 5]
+
+"""
+
+import argparse
+import time as tm
+import numpy as np
+from fft_plans import clear_plans, get_plan, padded_size
+from nonlinear_terms import nonlineardealiased
+from benchmark_padding import random_field
+
+#%%
+def nonlineardealiased_unbatched(nx,ny,kx,ky,k2,wf,pad=1.5):    
+    
+    '''
+    compute the Jacobian with 3/2 dealiasing using four separate inverse
+    transforms (reference for the batched nonlineardealiased)
+    
+    Inputs
+    ------
+    nx,ny : number of grid points in x and y direction on fine grid
+    kx,ky : wavenumber in x and y direction
+    k2 : absolute wave number over 2D domain
+    wf : vorticity field in frequency domain (excluding periodic boundaries)
+    pad : padding factor, at least 3/2 for the product to be free of aliasing
+    
+    Output
+    ------
+    jf : jacobian in frequency domain (excluding periodic boundaries)
+         (d(psi)/dy*d(omega)/dx - d(psi)/dx*d(omega)/dy)
+    '''
+    
+    j1f = -1.0j*kx*wf/k2
+    j2f = 1.0j*ky*wf
+    j3f = -1.0j*ky*wf/k2
+    j4f = 1.0j*kx*wf
+    
+    nxe = padded_size(nx,pad)
+    nye = padded_size(ny,pad)
+    
+    j1f_padded = np.zeros((nxe,nye),dtype='complex128')
+    j2f_padded = np.zeros((nxe,nye),dtype='complex128')
+    j3f_padded = np.zeros((nxe,nye),dtype='complex128')
+    j4f_padded = np.zeros((nxe,nye),dtype='complex128')
+    
+    j1f_padded[0:int(nx/2),0:int(ny/2)] = j1f[0:int(nx/2),0:int(ny/2)]
+    j1f_padded[int(nxe-nx/2):,0:int(ny/2)] = j1f[int(nx/2):,0:int(ny/2)]    
+    j1f_padded[0:int(nx/2),int(nye-ny/2):] = j1f[0:int(nx/2),int(ny/2):]    
+    j1f_padded[int(nxe-nx/2):,int(nye-ny/2):] =  j1f[int(nx/2):,int(ny/2):] 
+    
+    j2f_padded[0:int(nx/2),0:int(ny/2)] = j2f[0:int(nx/2),0:int(ny/2)]
+    j2f_padded[int(nxe-nx/2):,0:int(ny/2)] = j2f[int(nx/2):,0:int(ny/2)]    
+    j2f_padded[0:int(nx/2),int(nye-ny/2):] = j2f[0:int(nx/2),int(ny/2):]    
+    j2f_padded[int(nxe-nx/2):,int(nye-ny/2):] =  j2f[int(nx/2):,int(ny/2):] 
+    
+    j3f_padded[0:int(nx/2),0:int(ny/2)] = j3f[0:int(nx/2),0:int(ny/2)]
+    j3f_padded[int(nxe-nx/2):,0:int(ny/2)] = j3f[int(nx/2):,0:int(ny/2)]    
+    j3f_padded[0:int(nx/2),int(nye-ny/2):] = j3f[0:int(nx/2),int(ny/2):]    
+    j3f_padded[int(nxe-nx/2):,int(nye-ny/2):] =  j3f[int(nx/2):,int(ny/2):] 
+    
+    j4f_padded[0:int(nx/2),0:int(ny/2)] = j4f[0:int(nx/2),0:int(ny/2)]
+    j4f_padded[int(nxe-nx/2):,0:int(ny/2)] = j4f[int(nx/2):,0:int(ny/2)]    
+    j4f_padded[0:int(nx/2),int(nye-ny/2):] = j4f[0:int(nx/2),int(ny/2):]    
+    j4f_padded[int(nxe-nx/2):,int(nye-ny/2):] =  j4f[int(nx/2):,int(ny/2):] 
+    
+    j1f_padded = j1f_padded*(nxe*nye)/(nx*ny)
+    j2f_padded = j2f_padded*(nxe*nye)/(nx*ny)
+    j3f_padded = j3f_padded*(nxe*nye)/(nx*ny)
+    j4f_padded = j4f_padded*(nxe*nye)/(nx*ny)
+    
+    
+    fft_object = get_plan((nxe,nye), 'complex128', 'FFTW_FORWARD')
+    fft_object_inv = get_plan((nxe,nye), 'complex128', 'FFTW_BACKWARD')
+    
+    # the cached plan reuses its output array, so keep copies of j1, j2, j3
+    j1 = np.copy(np.real(fft_object_inv(j1f_padded)))
+    j2 = np.copy(np.real(fft_object_inv(j2f_padded)))
+    j3 = np.copy(np.real(fft_object_inv(j3f_padded)))
+    j4 = np.real(fft_object_inv(j4f_padded))
+    
+    jacp = j1*j2 - j3*j4
+    
+    jacpf = fft_object(jacp)
+    
+    jf = np.zeros((nx,ny),dtype='complex128')
+    
+    jf[0:int(nx/2),0:int(ny/2)] = jacpf[0:int(nx/2),0:int(ny/2)]
+    jf[int(nx/2):,0:int(ny/2)] = jacpf[int(nxe-nx/2):,0:int(ny/2)]    
+    jf[0:int(nx/2),int(ny/2):] = jacpf[0:int(nx/2),int(nye-ny/2):]    
+    jf[int(nx/2):,int(ny/2):] =  jacpf[int(nxe-nx/2):,int(nye-ny/2):]
+    
+    jf = jf*(nx*ny)/(nxe*nye)
+    
+    return jf
+
+#%%
+def benchmark(jacobian,n,pad,nrep):
+    
+    '''
+    time one Jacobian evaluation
+    
+    Output
+    ------
+    t : wall time per evaluation in seconds
+    jf : jacobian of the random field in frequency domain
+    '''
+    
+    np.random.seed(0)
+    kx, ky, k2, wf = random_field(n,n)
+    
+    # the first call plans the transforms
+    jf = jacobian(n,n,kx,ky,k2,wf,pad)
+    
+    t0 = tm.time()
+    for i in range(nrep):
+        jacobian(n,n,kx,ky,k2,wf,pad)
+    t = (tm.time() - t0)/nrep
+    
+    return t, jf
+
+#%%
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='batched versus separate inverse FFTs of the dealiased Jacobian')
+    parser.add_argument('-n', type=int, nargs='+', default=[1024,2048,4096], help='grid sizes')
+    parser.add_argument('-p', type=float, default=1.5, help='padding factor')
+    parser.add_argument('-r', type=int, default=5, help='number of repetitions')
+    args = parser.parse_args()
+    
+    print('%6s %6s %14s %14s %8s %12s' % ('n', 'nxe', 'separate [s]', 'batched [s]', 'speedup',
+                                         'rel. diff'))
+    for n in args.n:
+        clear_plans()
+        t1, jf1 = benchmark(nonlineardealiased_unbatched,n,args.p,args.r)
+        clear_plans()
+        t2, jf2 = benchmark(nonlineardealiased,n,args.p,args.r)
+        diff = np.abs(jf2 - jf1).max()/np.abs(jf1).max()
+        print('%6d %6d %14.4f %14.4f %8.2f %12.2e' % (n, padded_size(n,args.p), t1, t2, t1/t2, diff))
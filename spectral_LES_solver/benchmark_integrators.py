@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Cost versus accuracy of the time integrators of the spectral solver.
+
+Every integrator (RK3-CN, IF-RK3, IF-RK4, ETDRK4) is run to the final time
+with a sequence of time steps on two cases:
+
+    tgv   : Taylor-Green vortex, error with respect to the exact solution
+            (exact_tgv of spectral_solver_DHIT_v2.py)
+    decay : decaying turbulence from a random field with the initial spectrum
+            of the solver, error with respect to an ETDRK4 solution with a
+            four times smaller time step than the smallest one tested
+
+The wall time and the relative error of the final vorticity are printed for
+every run, so the integrators can be compared at equal cost or equal error.
+
+usage: python benchmark_integrators.py [-n 128] [--re 1000] [-T 1.0]
+                                       [--dt 0.04 0.02 0.01 0.005]
+
+"""
+
+import argparse
+import time as tm
+import numpy as np
+from nonlinear_terms import get_nonlinear
+from integrators import get_integrator
+
+names = ['RK3-CN', 'IF-RK3', 'IF-RK4', 'ETDRK4']
+
+#%%
+def exact_tgv(nx,ny,time,re):
+
+    '''
+    exact vorticity of the TGV problem (as in spectral_solver_DHIT_v2.py)
+    without the periodic boundaries
+    '''
+
+    x = np.linspace(0.0,2.0*np.pi,nx+1)[0:nx]
+    y = np.linspace(0.0,2.0*np.pi,ny+1)[0:ny]
+    x, y = np.meshgrid(x, y, indexing='ij')
+
+    nq = 4.0
+    ue = 2.0*nq*np.cos(nq*x)*np.cos(nq*y)*np.exp(-2.0*nq*nq*time/re)
+
+    return ue
+
+#%%
+def decay_field(nx,ny):
+
+    '''
+    random vorticity field in frequency domain with the energy spectrum
+    E(k) = c*k^4*exp(-(k/k0)^2), k0 = 10 of the decay case
+    '''
+
+    kx = np.fft.fftfreq(nx,1/nx).reshape(nx,1)
+    ky = np.fft.fftfreq(ny,1/ny).reshape(1,ny)
+    kk = np.sqrt(kx*kx + ky*ky)
+    kk[0,0] = 1.0e-6
+
+    k0 = 10.0
+    c = 4.0/(3.0*np.sqrt(np.pi)*(k0**5))
+    es = c*(kk**4)*np.exp(-(kk/k0)**2)
+
+    # random phases of a real field
+    phase = np.fft.fft2(np.random.random_sample((nx,ny)))
+    phase = phase/np.abs(phase)
+
+    wf = np.sqrt(kk*es/np.pi)*phase*(nx*ny)
+    wf[0,0] = 0.0
+
+    return wf
+
+#%%
+def run(itint,wf0,re,dt,tmax):
+
+    '''
+    integrate wf0 to tmax with the selected integrator
+
+    Output
+    ------
+    wf : vorticity in frequency domain at tmax
+    t : wall time in seconds
+    nsteps : number of time steps
+    '''
+
+    nx, ny = wf0.shape
+    kx = np.fft.fftfreq(nx,1/nx).reshape(nx,1)
+    ky = np.fft.fftfreq(ny,1/ny).reshape(1,ny)
+    k2 = kx*kx + ky*ky
+    k2[0,0] = 1.0e-12
+
+    jacobian = get_nonlinear(2)
+    rhs = lambda wf,jf: jacobian(nx,ny,kx,ky,k2,wf,jf)
+
+    wf = np.copy(wf0)
+    nsteps = int(round(tmax/dt))
+    integrator = get_integrator(itint,k2,re,tmax/nsteps,wf.dtype)
+
+    # plans and workspaces are created before the timing
+    rhs(wf,integrator.jnf)
+
+    t0 = tm.time()
+    for n in range(nsteps):
+        integrator.step(wf,rhs)
+    t = tm.time() - t0
+
+    return wf, t, nsteps
+
+#%%
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='cost versus accuracy of the time integrators')
+    parser.add_argument('-n', type=int, default=128, help='grid size')
+    parser.add_argument('--re', type=float, default=1000.0, help='Reynolds number')
+    parser.add_argument('-T', type=float, default=1.0, help='final time')
+    parser.add_argument('--dt', type=float, nargs='+', default=[0.04,0.02,0.01,0.005],
+                        help='time steps')
+    parser.add_argument('-i', type=int, nargs='+', default=[0,1,2,3], help='integrators')
+    args = parser.parse_args()
+
+    n = args.n
+    np.random.seed(1)
+
+    wf_tgv = np.fft.fft2(exact_tgv(n,n,0.0,args.re))
+    we = exact_tgv(n,n,args.T,args.re)
+
+    wf_decay = decay_field(n,n)
+    wf_ref, t, nsteps = run(3,wf_decay,args.re,min(args.dt)/4.0,args.T)
+    w_ref = np.real(np.fft.ifft2(wf_ref))
+
+    print('%6s %8s %10s %8s %10s %12s' % ('case', 'scheme', 'dt', 'steps', 'time [s]', 'error'))
+    for case, wf0, wref in [('tgv', wf_tgv, we), ('decay', wf_decay, w_ref)]:
+        for itint in args.i:
+            for dt in args.dt:
+                wf, t, nsteps = run(itint,wf0,args.re,dt,args.T)
+                w = np.real(np.fft.ifft2(wf))
+                error = np.linalg.norm(w - wref)/np.linalg.norm(wref)
+                print('%6s %8s %10.4g %8d %10.3f %12.4e' % (case, names[itint], dt, nsteps, t,
+                                                            error))
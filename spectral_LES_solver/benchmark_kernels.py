@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Memory traffic of the dealiased Jacobian with the NumPy and the fused Numba
+kernels (jit_kernels).
+
+Every RK stage evaluates one Jacobian. For every grid size and spectrum
+layout the time per Jacobian of the SpectralWorkspace is measured with the
+NumPy version and with the Numba kernels, and the time of the two batched
+transforms alone is subtracted, which leaves the time of the padding, the
+product and the truncation. The bytes these phases read and write are counted
+from the passes over the arrays each version makes (traffic), which gives the
+memory bandwidth used per RK stage.
+
+usage: python benchmark_kernels.py [-n 256 512 1024] [-r 20] [-t 1] [--half]
+
+"""
+
+import argparse
+import time as tm
+import numpy as np
+from fft_plans import set_threads, get_threads
+from nonlinear_terms import SpectralWorkspace
+import jit_kernels
+
+#%%
+def traffic(workspace, jit):
+
+    '''
+    return the bytes read and written by the padding, product and truncation
+    phases of one Jacobian, counted from the passes over the arrays
+
+    Inputs
+    ------
+    workspace : SpectralWorkspace
+    jit : count the passes of the Numba kernels (else of the NumPy version)
+    '''
+
+    nx, ny, nxe, nye = workspace.nx, workspace.ny, workspace.nxe, workspace.nye
+    r = workspace.dtype.itemsize
+    c = 2*r
+    if workspace.half:
+        n, ne, pe = nx*(int(ny/2)+1), nxe*(int(nye/2)+1), r
+    else:
+        n, ne, pe = nx*ny, nxe*nye, c
+    npx = nxe*nye
+
+    if jit:
+        # the zero padding is only written for the half spectrum
+        pad = (c + r)*n + 4*c*(ne if workspace.half else n)
+        product = 4*pe*npx + pe*npx
+    else:
+        # streamfunction (divide, negate) and one multiplication per block and
+        # field, the half spectrum padding is zeroed in every call
+        pad = (4*c + r)*n + 8*c*n
+        if workspace.half:
+            pad += 4*c*(ne - n)
+        # two products and a subtraction
+        product = 2*(2*pe + r)*npx + 3*r*npx
+    truncate = 2*c*n
+
+    return pad + product + truncate
+
+#%%
+def time_jacobian(workspace, wf, repeat):
+
+    '''
+    return the time per Jacobian and of its two transforms alone (minimum
+    over the repetitions, which is less affected by other processes than the
+    mean)
+    '''
+
+    jf = np.empty_like(wf)
+    workspace.jacobian(wf,jf)
+
+    t, tfft = np.inf, np.inf
+    for i in range(repeat):
+        t0 = tm.perf_counter()
+        workspace.jacobian(wf,jf)
+        t = min(t, tm.perf_counter() - t0)
+
+        t0 = tm.perf_counter()
+        workspace.fft_object_inv()
+        workspace.fft_object()
+        tfft = min(tfft, tm.perf_counter() - t0)
+
+    return t, tfft
+
+#%%
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='memory traffic of the NumPy and Numba Jacobian')
+    parser.add_argument('-n', type=int, nargs='+', default=[256,512,1024], help='grid sizes')
+    parser.add_argument('-r', type=int, default=20, help='repetitions')
+    parser.add_argument('-t', type=int, default=1, help='FFTW and Numba threads')
+    parser.add_argument('--half', action='store_true', help='half spectrum (irfft = 1)')
+    parser.add_argument('--dtype', default='float64', help='precision of the Jacobian')
+    args = parser.parse_args()
+
+    set_threads(args.t)
+    jit_kernels.set_threads(get_threads())
+    if not jit_kernels.available:
+        print('Numba is not installed, only the NumPy version is timed')
+
+    versions = [False, True] if jit_kernels.available else [False]
+
+    print('%6s %7s %12s %12s %12s %10s' % ('n', 'kernels', 'stage [ms]', 'no FFT [ms]',
+                                           'MB/stage', 'GB/s'))
+    for n in args.n:
+        kx = np.fft.fftfreq(n,1/n).reshape(n,1)
+        if args.half:
+            ky = np.fft.rfftfreq(n,1/n).reshape(1,int(n/2)+1)
+        else:
+            ky = np.fft.fftfreq(n,1/n).reshape(1,n)
+        k2 = kx*kx + ky*ky
+        k2[0,0] = 1.0e-12
+
+        np.random.seed(1)
+        w = np.random.random_sample((n,n))
+        wf = np.fft.rfft2(w) if args.half else np.fft.fft2(w)
+        wf = wf.astype(np.result_type(args.dtype, np.complex64))
+
+        for jit in versions:
+            workspace = SpectralWorkspace(n,n,kx,ky,k2,1.5,args.dtype,(),jit)
+            t, tfft = time_jacobian(workspace, wf, args.r)
+            nbytes = traffic(workspace, jit)
+            tk = max(t - tfft, 1.0e-12)
+            print('%6d %7s %12.3f %12.3f %12.1f %10.2f' % (n, 'numba' if jit else 'numpy', 1.0e3*t,
+                                                          1.0e3*tk, nbytes/1.0e6, nbytes/tk/1.0e9))
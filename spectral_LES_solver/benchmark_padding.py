@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the dealiased Jacobian for different padding factors.
+
+For every grid size the time of one Jacobian evaluation (one RK stage) and the
+memory it needs are measured for 2x padding and the 3/2 rule. The memory is
+split into the cached FFTW buffers and the peak of the temporary arrays
+allocated during one evaluation.
+
+usage: python benchmark_padding.py [-n 1024 2048 4096] [-p 2.0 1.5] [-r 5]
+
+"""
+
+import argparse
+import time as tm
+import tracemalloc
+import numpy as np
+from fft_plans import clear_plans, plan_stats, padded_size
+from nonlinear_terms import nonlineardealiased
+
+#%%
+def random_field(nx,ny):
+    
+    '''
+    return wavenumbers and a random vorticity field in frequency domain
+    '''
+    
+    kx = np.fft.fftfreq(nx,1/nx).reshape(nx,1)
+    ky = np.fft.fftfreq(ny,1/ny).reshape(1,ny)
+    
+    k2 = kx*kx + ky*ky
+    k2[0,0] = 1.0e-12
+    
+    wf = np.fft.fft2(np.random.random_sample((nx,ny)))
+    wf[0,0] = 0.0
+    
+    return kx, ky, k2, wf
+
+#%%
+def benchmark(n,pad,nrep):
+    
+    '''
+    time one dealiased Jacobian evaluation and measure its memory use
+    
+    Output
+    ------
+    t : wall time per evaluation in seconds
+    mb_plans : memory held by the cached FFTW buffers in MB
+    mb_peak : peak memory of the temporaries of one evaluation in MB
+    '''
+    
+    clear_plans()
+    kx, ky, k2, wf = random_field(n,n)
+    
+    # the first call plans the transforms
+    nonlineardealiased(n,n,kx,ky,k2,wf,pad)
+    mb_plans = plan_stats()['nbytes']/1.0e6
+    
+    tracemalloc.start()
+    nonlineardealiased(n,n,kx,ky,k2,wf,pad)
+    mb_peak = tracemalloc.get_traced_memory()[1]/1.0e6
+    tracemalloc.stop()
+    
+    t0 = tm.time()
+    for i in range(nrep):
+        nonlineardealiased(n,n,kx,ky,k2,wf,pad)
+    t = (tm.time() - t0)/nrep
+    
+    return t, mb_plans, mb_peak
+
+#%%
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='time and memory of the dealiased Jacobian per RK stage')
+    parser.add_argument('-n', type=int, nargs='+', default=[1024,2048,4096], help='grid sizes')
+    parser.add_argument('-p', type=float, nargs='+', default=[2.0,1.5], help='padding factors')
+    parser.add_argument('-r', type=int, default=5, help='number of repetitions')
+    args = parser.parse_args()
+    
+    print('%6s %5s %6s %12s %12s %12s %8s %8s' % ('n', 'pad', 'nxe', 'time [s]', 'plans [MB]',
+                                                 'peak [MB]', 'speedup', 'memory'))
+    for n in args.n:
+        ref = None
+        for pad in args.p:
+            t, mb_plans, mb_peak = benchmark(n,pad,args.r)
+            if ref is None:
+                ref = (t, mb_plans + mb_peak)
+            print('%6d %5.2f %6d %12.4f %12.1f %12.1f %8.2f %8.2f' % (n, pad, padded_size(n,pad), t,
+                  mb_plans, mb_peak, ref[0]/t, (mb_plans + mb_peak)/ref[1]))
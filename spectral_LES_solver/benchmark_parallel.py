@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Strong scaling of the slab-decomposed parallel spectral solver.
+
+The decay case is run for a fixed grid and number of time steps with the
+serial time loop (nonlineardealiased, as in spectral_solver_DHIT_v2.py) and
+with spectral_solver_parallel.py on 1, 2, 4, ... processes of this node. The
+wall time of the time integration, the speedup and parallel efficiency with
+respect to one process and the largest difference of the final vorticity
+spectrum from the serial one are printed.
+
+usage: python benchmark_parallel.py [-n 1024] [--nt 20] [-np 1 2 4 8] [-t 1]
+
+"""
+
+import argparse
+import time as tm
+import numpy as np
+from numpy.random import seed
+from fft_plans import get_plan, set_threads
+from nonlinear_terms import nonlineardealiased
+from integrators import get_integrator
+from spectral_solver_parallel import decay_ic, run_shared
+
+#%%
+def run_serial(params):
+
+    '''
+    run the serial time loop of spectral_solver_DHIT_v2.py (full complex
+    spectrum, dealiasing by padding) for the decay case
+
+    Output
+    ------
+    wf : final vorticity spectrum
+    clock_time : wall time of the time integration
+    '''
+
+    nx = ny = params['nd']
+    dx, dy = 2.0*np.pi/nx, 2.0*np.pi/ny
+
+    seed(params['iseed'])
+    w0 = decay_ic(nx,ny,dx,dy)
+
+    kx = np.fft.fftfreq(nx,1/nx).reshape(nx,1)
+    ky = np.fft.fftfreq(ny,1/ny).reshape(1,ny)
+    k2 = kx*kx + ky*ky
+    k2[0,0] = 1.0e-12
+
+    fft_object = get_plan((nx,ny), 'complex128', 'FFTW_FORWARD')
+    wnf = np.copy(fft_object(w0[0:nx,0:ny]))
+
+    pad = params['pad']
+    rhs = lambda wf,jf: nonlineardealiased(nx,ny,kx,ky,k2,wf,pad,jf)
+    integrator = get_integrator(params['itint'],k2,params['re'],params['dt'],wnf.dtype)
+
+    # plans and workspaces are created before the timing
+    rhs(wnf,integrator.jnf)
+
+    clock_time_init = tm.time()
+    for n in range(params['nt']):
+        integrator.step(wnf,rhs)
+    clock_time = tm.time() - clock_time_init
+
+    return wnf, clock_time
+
+#%%
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='strong scaling of the slab-decomposed solver')
+    parser.add_argument('-n', type=int, default=1024, help='grid size')
+    parser.add_argument('--nt', type=int, default=20, help='number of time steps')
+    parser.add_argument('--dt', type=float, default=5.0e-4, help='time step')
+    parser.add_argument('--re', type=float, default=4000.0, help='Reynolds number')
+    parser.add_argument('-np', type=int, nargs='+', default=[1,2,4,8], help='numbers of processes')
+    parser.add_argument('-t', type=int, default=1, help='FFTW threads per process')
+    args = parser.parse_args()
+
+    params = {'nd': args.n, 'nt': args.nt, 'ns': 1, 're': args.re, 'dt': args.dt, 'ipr': 3,
+              'pad': 1.5, 'itint': 0, 'iseed': 1}
+
+    set_threads(args.t)
+    wf_serial, t_serial = run_serial(params)
+
+    print('%10s %12s %10s %12s %12s' % ('processes', 'time [s]', 'speedup', 'efficiency',
+                                        'rel. diff'))
+    print('%10s %12.3f %10s %12s %12s' % ('serial', t_serial, '-', '-', '-'))
+
+    t1 = None
+    for nprocs in args.np:
+        wf, t = run_shared(nprocs,params,write=False,threads=args.t)
+        if t1 is None:
+            t1 = t*args.np[0]
+        diff = np.abs(wf - wf_serial).max()/np.abs(wf_serial).max()
+        print('%10d %12.3f %10.2f %12.2f %12.2e' % (nprocs, t, t1/t, t1/t/nprocs, diff))
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Thread scaling of the FFTW transforms used by the spectral solver.
+
+For every grid size and number of FFTW threads the time of one dealiased
+Jacobian evaluation (nonlineardealiased) and of one Poisson solve (the inverse
+transform of fps) is measured. Speedup and parallel efficiency are given with
+respect to the first number of threads, so the number of threads beyond which a node stops
+scaling can be read off the report.
+
+usage: python benchmark_threads.py [-n 512 1024 2048] [-t 1 2 4 8 16 32] [-r 5]
+
+"""
+
+import argparse
+import os
+import time as tm
+import numpy as np
+from fft_plans import get_plan, clear_plans, set_threads
+from nonlinear_terms import nonlineardealiased
+
+#%%
+def timeit(f,nrep):
+    
+    '''
+    return the mean wall time of f() over nrep calls after one warm-up call
+    '''
+    
+    f()
+    t0 = tm.time()
+    for i in range(nrep):
+        f()
+    
+    return (tm.time() - t0)/nrep
+
+#%%
+def benchmark(n,threads,nrep,pad):
+    
+    '''
+    time the dealiased Jacobian and the Poisson solve with the given threads
+    '''
+    
+    clear_plans()
+    set_threads(threads)
+    
+    kx = np.fft.fftfreq(n,1/n).reshape(n,1)
+    ky = np.fft.fftfreq(n,1/n).reshape(1,n)
+    k2 = kx*kx + ky*ky
+    k2[0,0] = 1.0e-12
+    
+    wf = np.fft.fft2(np.random.random_sample((n,n)))
+    wf[0,0] = 0.0
+    
+    t_jac = timeit(lambda: nonlineardealiased(n,n,kx,ky,k2,wf,pad), nrep)
+    
+    fft_object_inv = get_plan((n,n), 'complex128', 'FFTW_BACKWARD')
+    t_fps = timeit(lambda: np.real(fft_object_inv(wf/(-k2))), nrep)
+    
+    return t_jac, t_fps
+
+#%%
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='FFTW thread scaling of nonlineardealiased and fps')
+    parser.add_argument('-n', type=int, nargs='+', default=[512,1024,2048], help='grid sizes')
+    parser.add_argument('-t', type=int, nargs='+', default=None,
+                        help='numbers of threads (default: powers of two up to the number of cores)')
+    parser.add_argument('-r', type=int, default=5, help='number of repetitions')
+    parser.add_argument('-p', type=float, default=1.5, help='padding factor')
+    args = parser.parse_args()
+    
+    if args.t is None:
+        ncores = os.cpu_count()
+        args.t = [2**i for i in range(int(np.log2(ncores))+1)]
+        if args.t[-1] != ncores:
+            args.t.append(ncores)
+    
+    print('%6s %8s %12s %8s %8s %12s %8s %8s' % ('n', 'threads', 'jacobian [s]', 'speedup', 'eff.',
+                                                 'fps [s]', 'speedup', 'eff.'))
+    for n in args.n:
+        ref = None
+        for threads in args.t:
+            t_jac, t_fps = benchmark(n,threads,args.r,args.p)
+            if ref is None:
+                ref = (t_jac, t_fps, threads)
+            s_jac = ref[0]/t_jac
+            s_fps = ref[1]/t_fps
+            print('%6d %8d %12.4f %8.2f %8.2f %12.4f %8.2f %8.2f' % (n, threads, t_jac, s_jac,
+                  s_jac*ref[2]/threads, t_fps, s_fps, s_fps*ref[2]/threads))
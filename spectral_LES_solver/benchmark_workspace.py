@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Memory benchmark of the preallocated SpectralWorkspace.
+
+For every grid size a few RK3 stages of the dealiased Jacobian are run in a
+fresh process, once with the previous implementation that allocates the padded
+arrays on every call (nonlineardealiased_unbatched in benchmark_batched.py) and
+once with the workspace writing to a preallocated array. The heap memory
+allocated per stage is measured with tracemalloc and the peak resident memory
+of the process before and after the stages with getrusage.
+
+usage: python benchmark_workspace.py [-n 1024 2048] [-p 1.5] [-r 3]
+
+"""
+
+import argparse
+import multiprocessing
+import resource
+import time as tm
+import tracemalloc
+import numpy as np
+from nonlinear_terms import nonlineardealiased
+from benchmark_padding import random_field
+from benchmark_batched import nonlineardealiased_unbatched
+
+#%%
+def peak_rss():
+    
+    '''
+    return the peak resident memory of the process in MB
+    '''
+    
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024.0
+
+#%%
+def run_stages(method,n,pad,nrep):
+    
+    '''
+    run nrep Jacobian evaluations with the selected method
+    
+    Output
+    ------
+    t : wall time per evaluation in seconds
+    mb_stage : heap memory allocated during one evaluation in MB
+    rss_before, rss_after : peak resident memory in MB before and after the
+                            evaluations (plans are created before)
+    '''
+    
+    np.random.seed(0)
+    kx, ky, k2, wf = random_field(n,n)
+    jf = np.empty((n,n), dtype='complex128')
+    
+    if method == 'workspace':
+        jacobian = lambda: nonlineardealiased(n,n,kx,ky,k2,wf,pad,jf)
+    else:
+        jacobian = lambda: nonlineardealiased_unbatched(n,n,kx,ky,k2,wf,pad)
+    
+    # the first call plans the transforms
+    jacobian()
+    rss_before = peak_rss()
+    
+    tracemalloc.start()
+    jacobian()
+    mb_stage = tracemalloc.get_traced_memory()[1]/1.0e6
+    tracemalloc.stop()
+    
+    t0 = tm.time()
+    for i in range(nrep):
+        jacobian()
+    t = (tm.time() - t0)/nrep
+    
+    return t, mb_stage, rss_before, peak_rss()
+
+#%%
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='heap allocation and peak RSS of the dealiased Jacobian')
+    parser.add_argument('-n', type=int, nargs='+', default=[1024,2048], help='grid sizes')
+    parser.add_argument('-p', type=float, default=1.5, help='padding factor')
+    parser.add_argument('-r', type=int, default=3, help='number of repetitions')
+    args = parser.parse_args()
+    
+    print('%6s %10s %10s %12s %12s %12s' % ('n', 'method', 'time [s]', 'stage [MB]',
+                                           'RSS 0 [MB]', 'RSS 1 [MB]'))
+    for n in args.n:
+        for method in ['allocate', 'workspace']:
+            # a new process for every run, the peak RSS never decreases
+            with multiprocessing.Pool(1) as pool:
+                t, mb_stage, rss_before, rss_after = pool.apply(run_stages, (method,n,args.p,args.r))
+            print('%6d %10s %10.4f %12.2f %12.1f %12.1f' % (n, method, t, mb_stage, rss_before,
+                                                           rss_after))
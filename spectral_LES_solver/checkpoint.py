@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Binary checkpoint of the spectral solver for an exact restart.
+
+A checkpoint is one .npz file (uncompressed, no pickled objects) holding the
+vorticity field in frequency domain wnf as it is in the time loop, the state
+of the time loop (time, step, dt, output counter and time step of the CFL
+controller), the state of the NumPy random generator and the parameters of
+input.txt. A SHA-256 checksum over all of it is checked when the file is read.
+
+The file is written to a temporary file in the same folder, flushed to disk
+and renamed to the checkpoint, so a crash during the write leaves the
+previous checkpoint intact. Restarting from it continues the run bit for bit,
+unlike the restart from 04_vorticity/w_<istart>.csv (ichkp = 1), which reads
+the text output and transforms it again. Bit for bit also needs the same FFTW
+plans, i.e. the same number of threads and the wisdom (fftw_wisdom.dat) saved
+by the run that wrote the checkpoint, since FFTW_MEASURE can choose another
+algorithm in a new process.
+
+"""
+
+import hashlib
+import json
+import os
+import numpy as np
+
+#%%
+def checksum(wnf, rng_keys, header):
+
+    '''
+    return the SHA-256 checksum of the field, the random generator keys and
+    the header (JSON string)
+    '''
+
+    h = hashlib.sha256()
+    h.update(np.ascontiguousarray(wnf).tobytes())
+    h.update(np.ascontiguousarray(rng_keys).tobytes())
+    h.update(header.encode('utf-8'))
+
+    return h.hexdigest()
+
+#%%
+def save_checkpoint(filename, wnf, state, config):
+
+    '''
+    write a checkpoint atomically (temporary file, fsync and rename)
+
+    Inputs
+    ------
+    filename : checkpoint file (.npz)
+    wnf : vorticity field in frequency domain (any layout, precision or batch)
+    state : dictionary of the state of the time loop, e.g. time, step, dt
+    config : dictionary of the parameters of input.txt
+    '''
+
+    folder = os.path.dirname(filename)
+    if folder and not os.path.exists(folder):
+        os.makedirs(folder)
+
+    name, rng_keys, pos, has_gauss, cached_gaussian = np.random.get_state()
+    header = json.dumps({'state': state, 'config': config,
+                         'rng': {'name': name, 'pos': int(pos), 'has_gauss': int(has_gauss),
+                                 'cached_gaussian': float(cached_gaussian)}}, sort_keys=True)
+
+    tmp = filename + '.tmp'
+    with open(tmp, 'wb') as f:
+        np.savez(f, wnf=wnf, rng_keys=rng_keys, header=np.array(header),
+                 checksum=np.array(checksum(wnf, rng_keys, header)))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, filename)
+
+#%%
+def load_checkpoint(filename):
+
+    '''
+    read a checkpoint and verify its checksum
+
+    Output
+    ------
+    wnf : vorticity field in frequency domain
+    state : state of the time loop
+    config : parameters of input.txt of the run that wrote the checkpoint
+    rng : state of the random generator for np.random.set_state
+    '''
+
+    with np.load(filename, allow_pickle=False) as data:
+        wnf = data['wnf']
+        rng_keys = data['rng_keys']
+        header = str(data['header'])
+        stored = str(data['checksum'])
+
+    if checksum(wnf, rng_keys, header) != stored:
+        raise ValueError('checksum of the checkpoint '+filename+' does not match')
+
+    header = json.loads(header)
+    r = header['rng']
+    rng = (r['name'], rng_keys, r['pos'], r['has_gauss'], r['cached_gaussian'])
+
+    return wnf, header['state'], header['config'], rng
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Time series of global diagnostics of the spectral solver, recorded in the
+time loop.
+
+Every ndiag time steps the recorder computes from the vorticity field in
+frequency domain wnf (Parseval, <f^2> = sum |f_k|^2/(nx*ny)^2 over the full
+spectrum)
+
+    energy       E = 1/2 <u^2 + v^2> = 1/2 sum |wf|^2/|k|^2/(nx*ny)^2
+    enstrophy    Z = 1/2 <w^2>       = 1/2 sum |wf|^2/(nx*ny)^2
+    palinstrophy P = 1/2 <|grad w|^2> = 1/2 sum |k|^2 |wf|^2/(nx*ny)^2
+    dissipation  eps = 2 Z/re (= -dE/dt)
+
+The three sums are one pass over wnf: the real and imaginary parts of wnf are
+squared into a kept buffer and multiplied by a (modes,3) matrix of weights
+computed once (a matrix product, one row per member of an ensemble). In the
+half spectrum (nx,ny/2+1) the modes 0 < ky < ny/2 have the weight 2, since
+they stand for the modes of -ky too. The solver records every ndiag = 10
+time steps by default, since the pass costs about 1% of a time step.
+
+The maximum norms need the fields in physical space and are computed every
+mdiag time steps only (nan in the other records): w, u and v from one
+batched inverse transform, giving
+
+    wmax = max |w|
+    cfl  = dt*(max|u|/dx + max|v|/dy)
+
+The records are kept in a buffer in memory and appended to the file when the
+buffer is full and at every output of the solver (flush), as text
+(diagnostics.csv, with a header) or as raw float64 records of the columns
+(diagnostics.bin, read with read_diagnostics). A restarted run drops the
+records at and after its start time.
+
+"""
+
+import os
+import time as tm
+import numpy as np
+
+from fft_plans import get_plan
+
+columns = ['step', 'time', 'dt', 'member', 'energy', 'enstrophy', 'palinstrophy',
+           'dissipation', 'wmax', 'cfl']
+formats = ['%d', '%.10e', '%.10e', '%d'] + ['%.10e']*6
+
+#%%
+def read_diagnostics(filename):
+
+    '''
+    read the records of a diagnostics file (.csv or .bin)
+
+    Output
+    ------
+    data : dictionary {column: array} of the records
+    '''
+
+    if filename.endswith('.bin'):
+        records = np.fromfile(filename, dtype=np.float64).reshape(-1, len(columns))
+    else:
+        records = np.loadtxt(filename, delimiter=',', skiprows=1, ndmin=2)
+
+    return {name: records[:,i] for i, name in enumerate(columns)}
+
+#%%
+class DiagnosticsRecorder(object):
+
+    '''
+    global diagnostics of the vorticity field in frequency domain
+
+    Inputs
+    ------
+    filename : .csv (text) or .bin (float64 records) file of the time series
+    nx,ny : number of grid points in x and y direction
+    dx,dy : grid spacing in x and y direction
+    kx,ky : wavenumber in x and y direction (ky = 0,1,...,ny/2 for the half spectrum)
+    re : Reynolds number, or the (nens,1,1) Reynolds numbers of an ensemble
+    dtype : complex data type of the vorticity field in frequency domain
+    shape : shape of the vorticity field, (nens,nx,ny) or (nens,nx,ny/2+1) for
+            an ensemble
+    mdiag : number of time steps between two computations of the maximum norms
+    nbuf : number of records kept in memory before they are written
+    start : time of the first record, the records of the file from start on
+            are dropped (restart), all of them for start = None
+    '''
+
+    def __init__(self, filename, nx, ny, dx, dy, kx, ky, re, dtype, shape, mdiag=50,
+                 nbuf=1024, start=None):
+        self.filename = filename
+        self.binary = filename.endswith('.bin')
+        self.dx, self.dy = dx, dy
+        self.mdiag = max(1, int(mdiag))
+        self.nrecords = 0
+        self.wall_time = 0.0
+
+        self.nmembers = int(np.prod(shape[:-2]))
+        self.re = np.broadcast_to(np.asarray(re, dtype=np.float64).ravel(), (self.nmembers,))
+
+        kx = np.asarray(kx, dtype=np.float64).reshape(nx,1)
+        ky = np.asarray(ky, dtype=np.float64).reshape(1,-1)
+        k2 = kx*kx + ky*ky
+
+        # weights of |wf|^2 for E, Z and P, every weight twice for the squared
+        # real and imaginary part
+        multiplicity = np.ones(k2.shape)
+        if ky.size == int(ny/2)+1:
+            multiplicity[:,1:int((ny+1)/2)] = 2.0
+        scale = 0.5*multiplicity/((nx*ny)**2)
+        k2[0,0] = 1.0
+        weights = np.stack([scale/k2, scale, scale*k2], axis=-1)
+        weights[0,0,0] = 0.0
+        weights[0,0,2] = 0.0
+
+        real_dtype = np.zeros(0, dtype=dtype).real.dtype
+        self.weights = np.repeat(weights.reshape(-1,3), 2, axis=0).astype(real_dtype)
+        self.squares = np.empty((self.nmembers, 2*k2.size), dtype=real_dtype)
+
+        # w, u = d(psi)/dy and v = -d(psi)/dx from one batched inverse transform
+        self.dudw = (1.0j*ky/k2).astype(dtype)
+        self.dvdw = (-1.0j*kx/k2).astype(dtype)
+        batch = tuple(shape[:-2])
+        if ky.size == int(ny/2)+1:
+            # d/dx of the Nyquist row kx = -nx/2 is not seen on the grid (the
+            # full spectrum drops it with the imaginary part)
+            self.dvdw[int(nx/2),:] = 0.0
+            self.fft_object_inv = get_plan((3,)+batch+(nx,ny), real_dtype, 'FFTW_BACKWARD')
+        else:
+            self.fft_object_inv = get_plan((3,)+batch+(nx,ny), dtype, 'FFTW_BACKWARD')
+
+        self.buffer = np.empty((max(1, int(nbuf))*self.nmembers, len(columns)))
+        self.nbuffer = 0
+
+        self.open(start)
+
+    def open(self, start):
+
+        '''
+        create the file, or keep the records before start of an earlier run
+        '''
+
+        folder = os.path.dirname(self.filename)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+
+        records = np.empty((0, len(columns)))
+        if start is not None and os.path.exists(self.filename):
+            records = np.stack(list(read_diagnostics(self.filename).values()), axis=-1)
+            records = records[records[:,1] < start - 1.0e-9*max(abs(start), 1.0)]
+
+        if self.binary:
+            records.tofile(self.filename)
+        else:
+            with open(self.filename, 'w') as f:
+                f.write(','.join(columns)+'\n')
+                np.savetxt(f, records, fmt=formats, delimiter=',')
+
+    def max_norms(self, wf, dt):
+
+        '''
+        return max|w| and the CFL number of every member in physical space
+        '''
+
+        wuvf = self.fft_object_inv.input_array
+        wuvf[0] = wf
+        np.multiply(self.dudw, wf, out=wuvf[1])
+        np.multiply(self.dvdw, wf, out=wuvf[2])
+
+        wuv = self.fft_object_inv()
+        if np.iscomplexobj(wuv):
+            wuv = wuv.real
+        wuv = wuv.reshape(3, self.nmembers, -1)
+
+        wmax = np.abs(wuv[0]).max(axis=-1)
+        cfl = dt*(np.abs(wuv[1]).max(axis=-1)/self.dx + np.abs(wuv[2]).max(axis=-1)/self.dy)
+
+        return wmax, cfl
+
+    def record(self, n, time, dt, wf):
+
+        '''
+        record the diagnostics of the vorticity field wf after time step n
+        '''
+
+        t0 = tm.time()
+
+        wr = np.ascontiguousarray(wf).view(self.squares.dtype).reshape(self.squares.shape)
+        np.multiply(wr, wr, out=self.squares)
+        energy, enstrophy, palinstrophy = np.dot(self.squares, self.weights).T
+
+        if n%self.mdiag == 0:
+            wmax, cfl = self.max_norms(wf, dt)
+        else:
+            wmax = cfl = np.nan
+
+        rows = self.buffer[self.nbuffer:self.nbuffer+self.nmembers]
+        rows[:,0] = n
+        rows[:,1] = time
+        rows[:,2] = dt
+        rows[:,3] = np.arange(self.nmembers)
+        rows[:,4] = energy
+        rows[:,5] = enstrophy
+        rows[:,6] = palinstrophy
+        rows[:,7] = 2.0*enstrophy/self.re
+        rows[:,8] = wmax
+        rows[:,9] = cfl
+        self.nbuffer += self.nmembers
+        self.nrecords += 1
+
+        self.wall_time += tm.time() - t0
+
+        if self.nbuffer == self.buffer.shape[0]:
+            self.flush()
+
+    def flush(self):
+
+        '''
+        append the records in memory to the file
+        '''
+
+        t0 = tm.time()
+
+        if self.nbuffer > 0:
+            if self.binary:
+                with open(self.filename, 'ab') as f:
+                    self.buffer[0:self.nbuffer].tofile(f)
+            else:
+                with open(self.filename, 'a') as f:
+                    np.savetxt(f, self.buffer[0:self.nbuffer], fmt=formats, delimiter=',')
+            self.nbuffer = 0
+
+        self.wall_time += tm.time() - t0
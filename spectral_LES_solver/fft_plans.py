@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Cache of pyfftw plans and aligned buffers shared by the spectral solver.
+
+Building a pyfftw.FFTW object plans the transform and allocates aligned input
+and output arrays, which is expensive compared to executing it. Every plan is
+therefore built once per (shape, dtype, direction, threads) and reused for the
+rest of the run. The number of cache hits and misses is recorded so that the
+reuse can be checked at the end of a run.
+
+A real dtype selects the real-to-complex (forward) or complex-to-real
+(backward) transform, for which the spectral array only holds the half
+spectrum (nx, ny/2+1) of the real field.
+
+The number of FFTW threads defaults to the PYFFTW_NUM_THREADS (or
+OMP_NUM_THREADS) environment variable and can be changed for the whole run
+with set_threads, e.g. from the nthreads entry of input.txt.
+
+Plans use the FFTW planner effort set with set_effort (FFTW_MEASURE by
+default), the FFTW wisdom of earlier runs is loaded and saved by fftw_wisdom.py
+in the repository folder.
+The result of tune_fft.py is read with load_tuning and selects the planner
+effort and the backend (pyfftw, scipy or numpy) for each grid size; the scipy
+and numpy backends are wrapped to behave like the pyfftw plans.
+
+Calling a cached plan copies the argument into the plan's own input array,
+so the caller's array is never swapped into the plan or destroyed by a
+complex-to-real transform. The returned array is the plan's output array. It
+is overwritten by the next call of the same plan and has to be copied if it is
+kept beyond that.
+
+For the same reason the plans are cached per thread: a thread other than the
+one running the time loop (e.g. the background writer of async_writer.py)
+gets its own plans and arrays. Planning is serialized with a lock, since the
+FFTW planner is not thread safe.
+
+"""
+
+import json
+import os
+import threading
+import numpy as np
+import pyfftw
+import scipy.fft
+
+#%%
+_plans = {}
+_stats = {'hits': 0, 'misses': 0}
+_config = {'threads': pyfftw.config.NUM_THREADS, 'effort': 'FFTW_MEASURE', 'backend': 'pyfftw'}
+_tuning = {}
+_lock = threading.Lock()
+
+#%%
+class Plan(object):
+    
+    '''
+    FFTW object that always transforms its own aligned input array
+    '''
+    
+    def __init__(self, fft_object):
+        self.fft_object = fft_object
+        self.input_array = fft_object.input_array
+        self.output_array = fft_object.output_array
+    
+    def __call__(self, input_array=None):
+        if input_array is not None:
+            self.input_array[...] = input_array
+        return self.fft_object()
+
+#%%
+class NumpyPlan(object):
+    
+    '''
+    scipy.fft or numpy.fft transform with the same interface as Plan
+    '''
+    
+    def __init__(self, a, b, direction, backend='scipy', threads=1, axes=(-2,-1)):
+        self.input_array = a
+        self.output_array = b
+        self.threads = threads
+        self.axes = axes
+        
+        real = np.dtype(a.dtype).kind == 'f' or np.dtype(b.dtype).kind == 'f'
+        if backend == 'scipy':
+            if real:
+                self.fft = scipy.fft.rfftn if direction == 'FFTW_FORWARD' else scipy.fft.irfftn
+            else:
+                self.fft = scipy.fft.fftn if direction == 'FFTW_FORWARD' else scipy.fft.ifftn
+            self.kwargs = {'workers': threads}
+        else:
+            if real:
+                self.fft = np.fft.rfftn if direction == 'FFTW_FORWARD' else np.fft.irfftn
+            else:
+                self.fft = np.fft.fftn if direction == 'FFTW_FORWARD' else np.fft.ifftn
+            self.kwargs = {}
+        if real and direction == 'FFTW_BACKWARD':
+            self.kwargs['s'] = [b.shape[i] for i in axes]
+    
+    def __call__(self, input_array=None):
+        if input_array is not None:
+            self.input_array[...] = input_array
+        self.output_array[...] = self.fft(self.input_array, axes=self.axes, **self.kwargs)
+        return self.output_array
+
+#%%
+def set_threads(threads):
+
+    '''
+    set the number of FFTW threads used by all plans created afterwards,
+    threads <= 0 keeps the value from the environment
+    '''
+
+    if threads > 0:
+        _config['threads'] = int(threads)
+
+#%%
+def get_threads():
+
+    '''
+    return the number of FFTW threads used for new plans
+    '''
+
+    return _config['threads']
+
+#%%
+def set_effort(effort):
+
+    '''
+    set the FFTW planner effort ('FFTW_ESTIMATE', 'FFTW_MEASURE',
+    'FFTW_PATIENT' or 'FFTW_EXHAUSTIVE') used for new plans
+    '''
+
+    _config['effort'] = effort
+
+#%%
+def set_backend(backend):
+
+    '''
+    set the FFT backend ('pyfftw', 'scipy' or 'numpy') used for new plans
+    '''
+
+    _config['backend'] = backend
+
+#%%
+def tuning_key(shape, dtype):
+
+    '''
+    return the key of a transform in the tuning file, e.g. '2048x2048/complex128'
+    '''
+
+    return str(shape[-2])+'x'+str(shape[-1])+'/'+np.dtype(dtype).name
+
+#%%
+def load_tuning(filename='fft_tuning.json'):
+
+    '''
+    read the best backend and planner effort per transform written by
+    tune_fft.py, return False if the file does not exist
+    '''
+
+    if not os.path.exists(filename):
+        return False
+
+    with open(filename) as f:
+        _tuning.update(json.load(f))
+
+    return True
+
+#%%
+def get_plan(shape, dtype='complex128', direction='FFTW_FORWARD', threads=None, axes=(-2,-1)):
+
+    '''
+    return the cached FFTW object for the transform over the last two axes
+    (or over the given axes)
+
+    Inputs
+    ------
+    shape : shape of the arrays to be transformed (shape of the real field
+            for real transforms)
+    dtype : data type of the arrays ('float64' for real transforms)
+    direction : 'FFTW_FORWARD' or 'FFTW_BACKWARD'
+    threads : number of threads used by FFTW (default: get_threads())
+    axes : axes of the transform, for real transforms the half spectrum is
+           stored along the last axis, which has to be transformed
+
+    Output
+    ------
+    fft_object : Plan (or NumpyPlan for the scipy and numpy backends) with its
+                 own aligned input and output arrays
+    '''
+
+    if threads is None:
+        threads = _config['threads']
+
+    axes = tuple(axes)
+    key = (tuple(shape), np.dtype(dtype).name, direction, threads, axes, threading.get_ident())
+
+    fft_object = _plans.get(key)
+    if fft_object is not None:
+        _stats['hits'] += 1
+        return fft_object
+
+    _stats['misses'] += 1
+
+    if np.dtype(dtype).kind == 'f':
+        # real field and its half spectrum along the last axis
+        shapef = tuple(shape[:-1]) + (int(shape[-1]/2)+1,)
+        dtypef = np.result_type(dtype, np.complex64)
+        if direction == 'FFTW_FORWARD':
+            a = pyfftw.empty_aligned(shape, dtype=dtype)
+            b = pyfftw.empty_aligned(shapef, dtype=dtypef)
+        else:
+            a = pyfftw.empty_aligned(shapef, dtype=dtypef)
+            b = pyfftw.empty_aligned(shape, dtype=dtype)
+    else:
+        a = pyfftw.empty_aligned(shape, dtype=dtype)
+        b = pyfftw.empty_aligned(shape, dtype=dtype)
+
+    # the tuning file only covers the two-dimensional transforms
+    tuning = _tuning.get(tuning_key(shape, dtype), {}) if axes == (-2,-1) else {}
+    backend = tuning.get('backend', _config['backend'])
+    effort = tuning.get('effort', _config['effort'])
+
+    if backend == 'pyfftw':
+        with _lock:
+            fft_object = Plan(pyfftw.FFTW(a, b, axes=axes, direction=direction, flags=(effort,),
+                                          threads=threads))
+    else:
+        fft_object = NumpyPlan(a, b, direction, backend, threads, axes)
+    _plans[key] = fft_object
+
+    return fft_object
+
+#%%
+def padded_size(n, pad=1.5, multiple=2):
+
+    '''
+    return the size of the padded grid used for dealiasing
+
+    Inputs
+    ------
+    n : number of grid points
+    pad : padding factor (3/2 for the 3/2 rule)
+    multiple : the padded size is a multiple of this number (even by default,
+               a multiple of the number of slabs for the slab decomposition)
+
+    Output
+    ------
+    ne : smallest size of at least pad*n that FFTW transforms efficiently
+    '''
+
+    ne = pyfftw.next_fast_len(int(np.ceil(pad*n)))
+    while ne%multiple != 0:
+        ne = pyfftw.next_fast_len(ne+1)
+
+    return ne
+
+#%%
+def plan_stats():
+
+    '''
+    return the number of plan cache hits, misses, cached plans and the memory
+    held by their input and output arrays in bytes
+    '''
+
+    nbytes = 0
+    for fft_object in _plans.values():
+        nbytes += fft_object.input_array.nbytes + fft_object.output_array.nbytes
+
+    return {'hits': _stats['hits'], 'misses': _stats['misses'], 'plans': len(_plans),
+            'nbytes': nbytes}
+
+#%%
+def clear_plans():
+
+    '''
+    remove all cached plans and reset the hit/miss counter
+    '''
+
+    _plans.clear()
+    _stats['hits'] = 0
+    _stats['misses'] = 0
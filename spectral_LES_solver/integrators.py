@@ -0,0 +1,572 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Time integration of the vorticity equation in frequency domain.
+
+RK3CN is the hybrid third-order Runge-Kutta implicit Crank-Nicolson scheme
+(Orlandi: Fluid flow phenomenon). The nonlinear term is integrated with the
+low-storage RK3 scheme and the viscous term with Crank-Nicolson, which in
+frequency domain is a multiplication of every mode by a factor depending on
+dt*k2/re. These factor arrays are computed once and only again when dt
+changes. The stage arrays are allocated once and every stage update is done in
+place with out=, so a time step does not allocate any array.
+
+The integrating-factor schemes IFRK3 and IFRK4 and the exponential time
+differencing scheme ETDRK4 integrate the viscous term exactly, so the time
+step is only limited by the nonlinear term. They use the same k2 array and
+interface (set_dt, step) as RK3CN and are selected with get_integrator.
+
+CFLController adapts the time step to a target CFL number computed from the
+maximum velocity of the spectral solution. The time step is rounded down to
+one of ndt values per factor of two, so that it only changes (and the factors
+of the integrator are only computed again) when the velocity has changed by
+more than that step of the grid.
+
+For an ensemble the field has the shape (B,nx,ny) (shape argument) and all
+members are advanced by every step, re can then be an array (B,1,1) of the
+Reynolds numbers of the members, so the factor arrays are (B,nx,ny).
+
+"""
+
+import numpy as np
+from fft_plans import get_plan
+
+#%%
+def mean_mode(k2):
+
+    '''
+    return the index of the mean (k = 0) mode, which is set to zero after every
+    stage, in the last two axes of the field (empty if the spectrum, e.g. a
+    slab of it, does not contain the mean mode)
+    '''
+
+    k2 = k2.reshape(k2.shape[-2:])
+
+    return (Ellipsis,) + np.nonzero(k2 < 0.5)
+
+#%%
+class RK3CN(object):
+
+    '''
+    hybrid third-order Runge-Kutta implicit Crank-Nicolson scheme
+
+    Inputs
+    ------
+    k2 : absolute wave number over the (full or half) spectrum
+    re : Reynolds number
+    dt : time step
+    dtype : complex data type of the vorticity field in frequency domain
+    shape : shape of the vorticity field (default: k2.shape), (B,)+k2.shape
+            for an ensemble of B fields
+    '''
+
+    a = (8.0/15.0, 2.0/15.0, 1.0/3.0)
+    g = (8.0/15.0, 5.0/12.0, 3.0/4.0)
+    r = (0.0, -17.0/60.0, -5.0/12.0)
+
+    def __init__(self, k2, re, dt, dtype='complex128', shape=None):
+        self.k2 = k2
+        self.re = re
+        self.mean = mean_mode(k2)
+        self.dt = None
+        self.nfactors = 0
+
+        dtype = np.dtype(dtype)
+        rdtype = np.zeros(0, dtype=dtype).real.dtype
+        shape = k2.shape if shape is None else tuple(shape)
+        fshape = np.broadcast(k2, re).shape
+
+        # (1 - d)/(1 + d) and 1/(1 + d) of the three stages, d = a*dt*k2/(2*re)
+        self.cf = np.empty((3,)+fshape, dtype=rdtype)
+        self.bf = np.empty((3,)+fshape, dtype=rdtype)
+
+        # stage solutions and Jacobians
+        self.w1f = np.empty(shape, dtype=dtype)
+        self.w2f = np.empty(shape, dtype=dtype)
+        self.jnf = np.empty(shape, dtype=dtype)
+        self.j1f = np.empty(shape, dtype=dtype)
+        self.j2f = np.empty(shape, dtype=dtype)
+        self.tmp = np.empty(shape, dtype=dtype)
+
+        self.set_dt(dt)
+
+    def set_dt(self, dt):
+
+        '''
+        compute the Crank-Nicolson factors for a new time step
+        '''
+
+        if dt == self.dt:
+            return
+
+        self.dt = float(dt)
+        self.nfactors += 1
+        z = 0.5*dt*self.k2/self.re
+        for i in range(3):
+            d = self.a[i]*z
+            np.divide(1.0, 1.0 + d, out=self.bf[i])
+            np.multiply(1.0 - d, self.bf[i], out=self.cf[i])
+
+    def stage(self, i, wf, jf, jpf, wsf):
+
+        '''
+        stage update wsf = cf*wf + bf*dt*(g*jf + r*jpf) in place, with the
+        Jacobian jf of the stage and jpf of the previous stage
+        '''
+
+        dt, tmp = self.dt, self.tmp
+
+        np.multiply(jf, self.g[i]*dt, out=wsf)
+        if i > 0:
+            np.multiply(jpf, self.r[i]*dt, out=tmp)
+            np.add(wsf, tmp, out=wsf)
+        np.multiply(wsf, self.bf[i], out=wsf)
+        np.multiply(wf, self.cf[i], out=tmp)
+        np.add(wsf, tmp, out=wsf)
+        wsf[self.mean] = 0.0
+
+    def step(self, wnf, jacobian):
+
+        '''
+        advance wnf by one time step in place
+
+        Inputs
+        ------
+        wnf : vorticity field in frequency domain
+        jacobian : function jacobian(wf,jf) writing the Jacobian of wf to jf
+        '''
+
+        w1f, w2f = self.w1f, self.w2f
+        jnf, j1f, j2f = self.jnf, self.j1f, self.j2f
+
+        # 1st step
+        jacobian(wnf,jnf)
+        self.stage(0,wnf,jnf,None,w1f)
+
+        # 2nd step
+        jacobian(w1f,j1f)
+        self.stage(1,w1f,j1f,jnf,w2f)
+
+        # 3rd step
+        jacobian(w2f,j2f)
+        self.stage(2,w2f,j2f,j1f,wnf)
+
+#%%
+class IFRK3(object):
+
+    '''
+    integrating-factor third-order Runge-Kutta scheme (Kutta's RK3)
+
+    The viscous term is integrated exactly with the factors exp(-k2/re*dt)
+    and exp(-k2/re*dt/2), the nonlinear term with RK3.
+
+    Inputs
+    ------
+    k2 : absolute wave number over the (full or half) spectrum
+    re : Reynolds number
+    dt : time step
+    dtype : complex data type of the vorticity field in frequency domain
+    shape : shape of the vorticity field (default: k2.shape)
+    '''
+
+    def __init__(self, k2, re, dt, dtype='complex128', shape=None):
+        self.k2 = k2
+        self.re = re
+        self.mean = mean_mode(k2)
+        self.dt = None
+        self.nfactors = 0
+
+        dtype = np.dtype(dtype)
+        rdtype = np.zeros(0, dtype=dtype).real.dtype
+        shape = k2.shape if shape is None else tuple(shape)
+        fshape = np.broadcast(k2, re).shape
+
+        # exp(-k2/re*dt) and exp(-k2/re*dt/2)
+        self.e = np.empty(fshape, dtype=rdtype)
+        self.e2 = np.empty(fshape, dtype=rdtype)
+
+        # stage solution and Jacobians
+        self.wsf = np.empty(shape, dtype=dtype)
+        self.jnf = np.empty(shape, dtype=dtype)
+        self.j1f = np.empty(shape, dtype=dtype)
+        self.j2f = np.empty(shape, dtype=dtype)
+        self.tmp = np.empty(shape, dtype=dtype)
+
+        self.set_dt(dt)
+
+    def set_dt(self, dt):
+
+        '''
+        compute the integrating factors for a new time step
+        '''
+
+        if dt == self.dt:
+            return
+
+        self.dt = float(dt)
+        self.nfactors += 1
+        np.exp(-dt*self.k2/self.re, out=self.e)
+        np.exp(-0.5*dt*self.k2/self.re, out=self.e2)
+
+    def step(self, wnf, jacobian):
+
+        '''
+        advance wnf by one time step in place
+
+        Inputs
+        ------
+        wnf : vorticity field in frequency domain
+        jacobian : function jacobian(wf,jf) writing the Jacobian of wf to jf
+        '''
+
+        dt, e, e2 = self.dt, self.e, self.e2
+        wsf, tmp = self.wsf, self.tmp
+        jnf, j1f, j2f = self.jnf, self.j1f, self.j2f
+
+        # 1st step: w1 = e2*(w + dt/2*jn)
+        jacobian(wnf,jnf)
+        np.multiply(jnf, 0.5*dt, out=wsf)
+        np.add(wsf, wnf, out=wsf)
+        np.multiply(wsf, e2, out=wsf)
+        wsf[self.mean] = 0.0
+
+        # 2nd step: w2 = e*(w - dt*jn) + 2*dt*e2*j1
+        jacobian(wsf,j1f)
+        np.multiply(jnf, -dt, out=wsf)
+        np.add(wsf, wnf, out=wsf)
+        np.multiply(wsf, e, out=wsf)
+        np.multiply(j1f, e2, out=tmp)
+        np.multiply(tmp, 2.0*dt, out=tmp)
+        np.add(wsf, tmp, out=wsf)
+        wsf[self.mean] = 0.0
+
+        # 3rd step: w = e*w + dt/6*(e*jn + 4*e2*j1 + j2)
+        jacobian(wsf,j2f)
+        np.multiply(jnf, e, out=wsf)
+        np.multiply(j1f, e2, out=tmp)
+        np.multiply(tmp, 4.0, out=tmp)
+        np.add(wsf, tmp, out=wsf)
+        np.add(wsf, j2f, out=wsf)
+        np.multiply(wsf, dt/6.0, out=wsf)
+        np.multiply(wnf, e, out=wnf)
+        np.add(wnf, wsf, out=wnf)
+        wnf[self.mean] = 0.0
+
+#%%
+class IFRK4(IFRK3):
+
+    '''
+    integrating-factor classical fourth-order Runge-Kutta scheme
+
+    Inputs
+    ------
+    k2 : absolute wave number over the (full or half) spectrum
+    re : Reynolds number
+    dt : time step
+    dtype : complex data type of the vorticity field in frequency domain
+    shape : shape of the vorticity field (default: k2.shape)
+    '''
+
+    def __init__(self, k2, re, dt, dtype='complex128', shape=None):
+        IFRK3.__init__(self, k2, re, dt, dtype, shape)
+        self.j3f = np.empty(self.jnf.shape, dtype=dtype)
+
+    def step(self, wnf, jacobian):
+
+        '''
+        advance wnf by one time step in place
+
+        Inputs
+        ------
+        wnf : vorticity field in frequency domain
+        jacobian : function jacobian(wf,jf) writing the Jacobian of wf to jf
+        '''
+
+        dt, e, e2 = self.dt, self.e, self.e2
+        wsf, tmp = self.wsf, self.tmp
+        jnf, j1f, j2f, j3f = self.jnf, self.j1f, self.j2f, self.j3f
+
+        # 1st step: w1 = e2*(w + dt/2*jn)
+        jacobian(wnf,jnf)
+        np.multiply(jnf, 0.5*dt, out=wsf)
+        np.add(wsf, wnf, out=wsf)
+        np.multiply(wsf, e2, out=wsf)
+        wsf[self.mean] = 0.0
+
+        # 2nd step: w2 = e2*w + dt/2*j1
+        jacobian(wsf,j1f)
+        np.multiply(j1f, 0.5*dt, out=wsf)
+        np.multiply(wnf, e2, out=tmp)
+        np.add(wsf, tmp, out=wsf)
+        wsf[self.mean] = 0.0
+
+        # 3rd step: w3 = e*w + dt*e2*j2
+        jacobian(wsf,j2f)
+        np.multiply(j2f, e2, out=wsf)
+        np.multiply(wsf, dt, out=wsf)
+        np.multiply(wnf, e, out=tmp)
+        np.add(wsf, tmp, out=wsf)
+        wsf[self.mean] = 0.0
+
+        # 4th step: w = e*w + dt/6*(e*jn + 2*e2*(j1 + j2) + j3)
+        jacobian(wsf,j3f)
+        np.add(j1f, j2f, out=tmp)
+        np.multiply(tmp, e2, out=tmp)
+        np.multiply(tmp, 2.0, out=tmp)
+        np.multiply(jnf, e, out=wsf)
+        np.add(wsf, tmp, out=wsf)
+        np.add(wsf, j3f, out=wsf)
+        np.multiply(wsf, dt/6.0, out=wsf)
+        np.multiply(wnf, e, out=wnf)
+        np.add(wnf, wsf, out=wnf)
+        wnf[self.mean] = 0.0
+
+#%%
+class ETDRK4(object):
+
+    '''
+    fourth-order exponential time differencing Runge-Kutta scheme (Cox and
+    Matthews 2002)
+
+    The phi-function coefficients are evaluated with the contour integral of
+    Kassam and Trefethen (2005) over m points of a circle of radius 1 around
+    every -dt*k2/re, which avoids the cancellation error for small dt*k2/re.
+
+    Inputs
+    ------
+    k2 : absolute wave number over the (full or half) spectrum
+    re : Reynolds number
+    dt : time step
+    dtype : complex data type of the vorticity field in frequency domain
+    shape : shape of the vorticity field (default: k2.shape)
+    m : number of points of the contour integral
+    '''
+
+    def __init__(self, k2, re, dt, dtype='complex128', shape=None, m=32):
+        self.k2 = k2
+        self.re = re
+        self.mean = mean_mode(k2)
+        self.m = m
+        self.dt = None
+        self.nfactors = 0
+
+        dtype = np.dtype(dtype)
+        rdtype = np.zeros(0, dtype=dtype).real.dtype
+        shape = k2.shape if shape is None else tuple(shape)
+        fshape = np.broadcast(k2, re).shape
+
+        # exp(L*dt), exp(L*dt/2) and the coefficients q, f1, 2*f2, f3
+        self.e = np.empty(fshape, dtype=rdtype)
+        self.e2 = np.empty(fshape, dtype=rdtype)
+        self.q = np.empty(fshape, dtype=rdtype)
+        self.f1 = np.empty(fshape, dtype=rdtype)
+        self.f2 = np.empty(fshape, dtype=rdtype)
+        self.f3 = np.empty(fshape, dtype=rdtype)
+
+        # stage solutions and Jacobians
+        self.waf = np.empty(shape, dtype=dtype)
+        self.wbf = np.empty(shape, dtype=dtype)
+        self.wcf = np.empty(shape, dtype=dtype)
+        self.jnf = np.empty(shape, dtype=dtype)
+        self.j1f = np.empty(shape, dtype=dtype)
+        self.j2f = np.empty(shape, dtype=dtype)
+        self.j3f = np.empty(shape, dtype=dtype)
+        self.tmp = np.empty(shape, dtype=dtype)
+
+        self.set_dt(dt)
+
+    def set_dt(self, dt):
+
+        '''
+        compute the exponentials and phi-function coefficients for a new time
+        step
+        '''
+
+        if dt == self.dt:
+            return
+
+        self.dt = float(dt)
+        self.nfactors += 1
+
+        # linear operator of the viscous term times dt
+        lh = -dt*self.k2/self.re
+
+        np.exp(lh, out=self.e)
+        np.exp(0.5*lh, out=self.e2)
+
+        # mean over the points of the upper half circle, the lower half gives
+        # the complex conjugate since lh is real
+        q = np.zeros(lh.shape)
+        f1 = np.zeros(lh.shape)
+        f2 = np.zeros(lh.shape)
+        f3 = np.zeros(lh.shape)
+        for j in range(self.m):
+            r = np.exp(1.0j*np.pi*(j + 0.5)/self.m)
+            z = lh + r
+            ez = np.exp(z)
+            q += np.real((np.exp(0.5*z) - 1.0)/z)
+            f1 += np.real((-4.0 - z + ez*(4.0 - 3.0*z + z*z))/z**3)
+            f2 += np.real((2.0 + z + ez*(-2.0 + z))/z**3)
+            f3 += np.real((-4.0 - 3.0*z - z*z + ez*(4.0 - z))/z**3)
+
+        self.q[...] = dt*q/self.m
+        self.f1[...] = dt*f1/self.m
+        self.f2[...] = 2.0*dt*f2/self.m
+        self.f3[...] = dt*f3/self.m
+
+    def step(self, wnf, jacobian):
+
+        '''
+        advance wnf by one time step in place
+
+        Inputs
+        ------
+        wnf : vorticity field in frequency domain
+        jacobian : function jacobian(wf,jf) writing the Jacobian of wf to jf
+        '''
+
+        e, e2 = self.e, self.e2
+        waf, wbf, wcf, tmp = self.waf, self.wbf, self.wcf, self.tmp
+        jnf, j1f, j2f, j3f = self.jnf, self.j1f, self.j2f, self.j3f
+
+        # a = e2*w + q*jn, e2*w is kept in wcf for b
+        jacobian(wnf,jnf)
+        np.multiply(wnf, e2, out=wcf)
+        np.multiply(jnf, self.q, out=waf)
+        np.add(waf, wcf, out=waf)
+        waf[self.mean] = 0.0
+
+        # b = e2*w + q*ja
+        jacobian(waf,j1f)
+        np.multiply(j1f, self.q, out=wbf)
+        np.add(wbf, wcf, out=wbf)
+        wbf[self.mean] = 0.0
+
+        # c = e2*a + q*(2*jb - jn)
+        jacobian(wbf,j2f)
+        np.multiply(j2f, 2.0, out=tmp)
+        np.subtract(tmp, jnf, out=tmp)
+        np.multiply(tmp, self.q, out=tmp)
+        np.multiply(waf, e2, out=wcf)
+        np.add(wcf, tmp, out=wcf)
+        wcf[self.mean] = 0.0
+
+        # w = e*w + f1*jn + 2*f2*(ja + jb) + f3*jc
+        jacobian(wcf,j3f)
+        np.multiply(wnf, e, out=wnf)
+        np.add(j1f, j2f, out=tmp)
+        np.multiply(tmp, self.f2, out=tmp)
+        np.add(wnf, tmp, out=wnf)
+        np.multiply(jnf, self.f1, out=tmp)
+        np.add(wnf, tmp, out=wnf)
+        np.multiply(j3f, self.f3, out=tmp)
+        np.add(wnf, tmp, out=wnf)
+        wnf[self.mean] = 0.0
+
+#%%
+def get_integrator(itint, k2, re, dt, dtype='complex128', shape=None):
+
+    '''
+    return the time integrator selected in input.txt
+
+    Inputs
+    ------
+    itint : [0] RK3-CN, [1] IF-RK3, [2] IF-RK4, [3] ETDRK4
+    k2 : absolute wave number over the (full or half) spectrum
+    re : Reynolds number, or an array (B,1,1) of the members of an ensemble
+    dt : time step
+    dtype : complex data type of the vorticity field in frequency domain
+    shape : shape of the vorticity field (default: k2.shape)
+
+    Output
+    ------
+    integrator : object with set_dt(dt) and step(wnf,jacobian)
+    '''
+
+    if itint == 0:
+        return RK3CN(k2, re, dt, dtype, shape)
+    elif itint == 1:
+        return IFRK3(k2, re, dt, dtype, shape)
+    elif itint == 2:
+        return IFRK4(k2, re, dt, dtype, shape)
+    elif itint == 3:
+        return ETDRK4(k2, re, dt, dtype, shape)
+    else:
+        raise ValueError('unknown time integrator: '+str(itint))
+
+#%%
+class CFLController(object):
+
+    '''
+    time step for a target CFL number, dt = cfl/(max|u|/dx + max|v|/dy)
+
+    Inputs
+    ------
+    nx,ny : number of grid points in x and y direction
+    dx,dy : grid spacing in x and y direction
+    kx,ky : wavenumber in x and y direction (ky = 0,1,...,ny/2 for the half spectrum)
+    k2 : absolute wave number over the (full or half) spectrum
+    cfl : target CFL number
+    ncfl : number of time steps between two updates of the time step
+    dtype : complex data type of the vorticity field in frequency domain
+    shape : shape of the vorticity field (default: k2.shape), the time step of
+            an ensemble is set by the maximum velocity over all members
+    ndt : number of values of the time step per factor of two, the time step
+          is rounded down to 2**(i/ndt) (CFL number between 2**(-1/ndt)*cfl
+          and cfl)
+    '''
+
+    def __init__(self, nx, ny, dx, dy, kx, ky, k2, cfl, ncfl=1, dtype='complex128', shape=None,
+                 ndt=16):
+        self.dx = dx
+        self.dy = dy
+        self.cfl = cfl
+        self.ncfl = ncfl
+        self.ndt = ndt
+        self.dt = None
+
+        # u = d(psi)/dy and v = -d(psi)/dx with psi = wf/k2 in frequency domain
+        self.dudw = (1.0j*ky/k2).astype(dtype)
+        self.dvdw = (-1.0j*kx/k2).astype(dtype)
+
+        # u and v from one batched inverse transform
+        batch = () if shape is None else tuple(shape[:-2])
+        if ky.size == int(ny/2)+1:
+            # d/dx of the Nyquist row kx = -nx/2 is not seen on the grid (the
+            # full spectrum drops it with the imaginary part)
+            self.dvdw[int(nx/2),:] = 0.0
+            self.fft_object_inv = get_plan((2,)+batch+(nx,ny), np.zeros(0, dtype=dtype).real.dtype,
+                                           'FFTW_BACKWARD')
+        else:
+            self.fft_object_inv = get_plan((2,)+batch+(nx,ny), dtype, 'FFTW_BACKWARD')
+
+    def max_velocity(self, wf):
+
+        '''
+        return the maximum of |u| and |v| in physical space
+        '''
+
+        uvf = self.fft_object_inv.input_array
+        np.multiply(self.dudw, wf, out=uvf[0])
+        np.multiply(self.dvdw, wf, out=uvf[1])
+
+        uv = self.fft_object_inv()
+        if np.iscomplexobj(uv):
+            uv = uv.real
+
+        return np.abs(uv[0]).max(), np.abs(uv[1]).max()
+
+    def __call__(self, n, wf):
+
+        '''
+        return the time step for time step n, updated every ncfl steps
+        '''
+
+        if self.dt is None or n%self.ncfl == 0:
+            umax, vmax = self.max_velocity(wf)
+            rate = umax/self.dx + vmax/self.dy
+            self.dt = self.cfl/rate if rate > 0.0 else np.inf
+            if np.isfinite(self.dt):
+                self.dt = 2.0**(np.floor(self.ndt*np.log2(self.dt))/self.ndt)
+
+        return self.dt
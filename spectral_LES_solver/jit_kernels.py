@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Fused kernels of the dealiased Jacobian compiled with Numba.
+
+The NumPy version of SpectralWorkspace.jacobian makes several passes over the
+arrays in every phase (streamfunction, negation, one multiplication per block
+and derivative field, two products and a subtraction, one scaling per block).
+Each kernel here does one pass per phase, parallel over the rows with prange:
+
+    pad_derivatives : streamfunction -wf/k2, the four derivative fields with
+                      the scaling of the padded transform and the zero padding,
+                      written to the input of the batched inverse plan
+    product         : j1*j2 - j3*j4 on the padded grid, written to the input
+                      of the forward plan
+    truncate        : the modes of the nx X ny spectrum taken from the padded
+                      spectrum and scaled, converted to the type of jf
+
+The copies between the spectra use index maps (index_maps), so the full and
+the half spectrum and a batch of fields (B,nx,ny) are handled by the same
+kernels. All arrays are passed with a leading batch axis.
+
+Numba is optional: without it available is False and SpectralWorkspace uses
+the NumPy version.
+
+"""
+
+import numpy as np
+
+try:
+    import numba
+    from numba import njit, prange
+    available = True
+except ImportError:
+    available = False
+
+#%%
+def set_threads(threads):
+
+    '''
+    set the number of threads of the kernels (at most NUMBA_NUM_THREADS), e.g.
+    to the number of FFTW threads
+    '''
+
+    if available:
+        numba.set_num_threads(max(1, min(int(threads), numba.config.NUMBA_NUM_THREADS)))
+
+#%%
+def index_maps(n, ne, onesided=False, nyquist=True):
+
+    '''
+    return the maps between the modes of the spectrum of n points and of the
+    padded spectrum of ne points along one axis
+
+    Inputs
+    ------
+    n : number of points
+    ne : number of points of the padded grid
+    onesided : the axis holds the half spectrum (n/2+1 modes) of a real field
+    nyquist : the Nyquist mode -n/2 is kept (for the half spectrum it is
+              written by SpectralWorkspace.pad_nyquist)
+
+    Output
+    ------
+    emap : index in the n spectrum of every mode of the padded spectrum, -1 for
+           the zero padding
+    tmap : index in the padded spectrum of every mode of the n spectrum, -1 for
+           the modes set to zero
+    '''
+
+    h = int(n/2)
+    if onesided:
+        emap = -np.ones(int(ne/2)+1, dtype=np.int64)
+        tmap = -np.ones(h+1, dtype=np.int64)
+        emap[0:h] = np.arange(0,h)
+        tmap[0:h] = np.arange(0,h)
+    else:
+        emap = -np.ones(ne, dtype=np.int64)
+        tmap = -np.ones(n, dtype=np.int64)
+        emap[0:h] = np.arange(0,h)
+        tmap[0:h] = np.arange(0,h)
+        start = h if nyquist else h+1
+        emap[ne-n+start:ne] = np.arange(start,n)
+        tmap[start:n] = np.arange(ne-n+start,ne)
+
+    return emap, tmap
+
+#%%
+if available:
+    @njit(parallel=True, cache=True)
+    def pad_derivatives(wf, k2, ikx, iky, xmap, ymap, zero, out):
+
+        '''
+        out[:,b] = (ikx*sf, iky*wf, iky*sf, ikx*wf) padded, sf = -wf/k2
+
+        Inputs
+        ------
+        wf : vorticity fields in frequency domain (B,nx,nyk)
+        k2 : absolute wave number (nx,nyk)
+        ikx,iky : 1j*kx and 1j*ky times the scaling of the padded transform
+        xmap,ymap : emap of index_maps for the x and y axis
+        zero : write the zero padding (needed if the inverse transform
+               overwrites its input, else it is left from the first call)
+        out : input of the batched inverse plan (4,B,nxe,nyek)
+        '''
+
+        nb, nr, nc = out.shape[1], out.shape[2], out.shape[3]
+        for r in prange(nb*nr):
+            b = r//nr
+            i = r%nr
+            si = xmap[i]
+            if si < 0:
+                if not zero:
+                    continue
+                for j in range(nc):
+                    out[0,b,i,j] = 0.0
+                    out[1,b,i,j] = 0.0
+                    out[2,b,i,j] = 0.0
+                    out[3,b,i,j] = 0.0
+            else:
+                kx = ikx[si]
+                for j in range(nc):
+                    sj = ymap[j]
+                    if sj < 0:
+                        if not zero:
+                            continue
+                        out[0,b,i,j] = 0.0
+                        out[1,b,i,j] = 0.0
+                        out[2,b,i,j] = 0.0
+                        out[3,b,i,j] = 0.0
+                    else:
+                        w = wf[b,si,sj]
+                        s = -(w/k2[si,sj])
+                        ky = iky[sj]
+                        out[0,b,i,j] = kx*s
+                        out[1,b,i,j] = ky*w
+                        out[2,b,i,j] = ky*s
+                        out[3,b,i,j] = kx*w
+
+    @njit(parallel=True, cache=True)
+    def product(j, out):
+
+        '''
+        out = j[0]*j[1] - j[2]*j[3] with the real parts of the derivative
+        fields j (4,B,nxe,nye) on the padded grid, out (B,nxe,nye)
+        '''
+
+        nb, nr, nc = out.shape[0], out.shape[1], out.shape[2]
+        for r in prange(nb*nr):
+            b = r//nr
+            i = r%nr
+            for jj in range(nc):
+                out[b,i,jj] = (j[0,b,i,jj].real*j[1,b,i,jj].real -
+                               j[2,b,i,jj].real*j[3,b,i,jj].real)
+
+    @njit(parallel=True, cache=True)
+    def truncate(jpf, xmap, ymap, scale, jf):
+
+        '''
+        jf = scale*jpf at the modes of the nx X ny spectrum, zero for the modes
+        without a padded mode (Nyquist modes of the half spectrum, written
+        by SpectralWorkspace.truncate_nyquist)
+
+        Inputs
+        ------
+        jpf : padded spectrum of the product (B,nxe,nyek)
+        xmap,ymap : tmap of index_maps for the x and y axis
+        scale : (nx*ny)/(nxe*nye)
+        jf : Jacobian in frequency domain (B,nx,nyk)
+        '''
+
+        nb, nr, nc = jf.shape[0], jf.shape[1], jf.shape[2]
+        for r in prange(nb*nr):
+            b = r//nr
+            i = r%nr
+            ei = xmap[i]
+            for j in range(nc):
+                ej = ymap[j]
+                if ei < 0 or ej < 0:
+                    jf[b,i,j] = 0.0
+                else:
+                    jf[b,i,j] = jpf[b,ei,ej]*scale
@@ -0,0 +1,615 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Jacobian (nonlinear term) of the vorticity-streamfunction equation computed
+with the pseudo-spectral method.
+
+The dealiased Jacobian pads the spectral derivatives to nxe X nye points, forms
+the product in physical space and truncates the result back to nx X ny modes.
+The padded size is pad*n rounded up to a size FFTW transforms efficiently, so
+pad = 3/2 gives the 3/2 rule at 2.25 times the number of points instead of the
+4 times of pad = 2.
+
+The cheaper alternatives work on the nx X ny grid: the 2/3 rule truncates the
+modes above 2/3 of the maximum wavenumber, and phase-shift dealiasing averages
+the Jacobian over two shifted grids. get_nonlinear selects the strategy, so the
+time integration and the output only call one function.
+
+The scratch arrays and plans of the dealiased Jacobian are owned by a
+SpectralWorkspace, built once per grid, padding factor and precision and reused
+for the rest of the run. Together with the jf argument for the result, a
+Jacobian evaluation in the time loop does not allocate any array.
+
+The Jacobian can be computed in a lower precision than the field it is applied
+to (mixed precision): with dtype = 'float32' the padded transforms and the
+product are done in float32/complex64 and only the result is converted to the
+precision of the field.
+
+All functions also take a batch of fields (B,nx,ny) (ensemble mode), the
+transforms are then done over the last two axes for all fields at once.
+
+The full spectrum keeps the Nyquist modes kx = -nx/2 and ky = -ny/2 as
+one-sided modes of the padded transform, of which the real part is taken. The
+half spectrum gives the same Jacobian for a real field: its Nyquist modes are
+split in half between the modes -n/2 and +n/2 of the padded grid (padding),
+and the Nyquist modes of the Jacobian are the part of the one-sided modes of
+the full spectrum seen on the nx X ny grid (truncation), e.g. the mean of the
+modes -nx/2 and +nx/2 of the padded product for kx = -nx/2.
+
+With Numba installed the padding, the product and the truncation of the
+dealiased Jacobian are done by the fused kernels of jit_kernels (set_jit), else
+by NumPy. The parallel kernels may not be run by two threads at the same time
+(the workqueue threading layer of Numba aborts the run), so only the workspaces
+of the main thread use them; the workspaces of other threads (the background
+writer of async_writer.py) use NumPy.
+
+"""
+
+import threading
+import numpy as np
+from fft_plans import get_plan, get_threads, padded_size
+import jit_kernels
+
+_config = {'jit': jit_kernels.available}
+
+#%%
+class SpectralWorkspace(object):
+    
+    '''
+    scratch arrays and FFTW plans of the dealiased Jacobian for one grid
+    
+    All arrays are allocated once, the padded derivative fields are written
+    directly into the input array of the batched inverse plan and the product
+    into the input array of the forward plan, so that jacobian does not
+    allocate any array.
+    
+    Inputs
+    ------
+    nx,ny : number of grid points in x and y direction
+    kx,ky : wavenumber in x and y direction (ky = 0,1,...,ny/2 for the half spectrum)
+    k2 : absolute wave number over the (full or half) spectrum
+    pad : padding factor, at least 3/2 for the product to be free of aliasing
+    dtype : real data type of the fields
+    batch : leading dimensions of a batch of fields, e.g. (B,) for an ensemble
+    jit : use the Numba kernels of jit_kernels
+    '''
+    
+    def __init__(self, nx, ny, kx, ky, k2, pad=1.5, dtype='float64', batch=(), jit=False):
+        self.nx = nx
+        self.ny = ny
+        self.nxe = nxe = padded_size(nx,pad)
+        self.nye = nye = padded_size(ny,pad)
+        self.half = ky.size == int(ny/2)+1
+        self.dtype = np.dtype(dtype)
+        self.cdtype = np.result_type(dtype, np.complex64)
+        self.k2 = k2.astype(self.dtype)
+        self.batch = batch = tuple(batch)
+        
+        # the scaling of the padded transform is folded into the derivatives
+        scale = (nxe*nye)/(nx*ny)
+        self.ikx = (1.0j*scale*kx).astype(self.cdtype)
+        self.iky = (1.0j*scale*ky).astype(self.cdtype)
+        self.scale = (nx*ny)/(nxe*nye)
+        
+        # (source, destination) slices of the blocks of modes copied from the
+        # nx X ny spectrum to the padded spectrum, the Nyquist modes of the
+        # half spectrum are written by pad_nyquist
+        hx, hy = int(nx/2), int(ny/2)
+        if self.half:
+            self.blocks = [((slice(0,hx), slice(0,hy)), (slice(0,hx), slice(0,hy))),
+                           ((slice(hx+1,nx), slice(0,hy)), (slice(nxe-hx+1,nxe), slice(0,hy)))]
+            real = self.dtype
+            # half of the derivatives for the Nyquist modes split between two
+            # padded modes, and the padded rows of -kx for the rows of the
+            # Nyquist column (kx = 0,...,nx/2-1 and -nx/2+1,...,-1)
+            self.ikx2 = 0.5*self.ikx
+            self.iky2 = 0.5*self.iky
+            self.mirror = [(-np.arange(0,hx))%nxe, nx - np.arange(hx+1,nx)]
+        else:
+            self.blocks = [((slice(0,hx), slice(0,hy)), (slice(0,hx), slice(0,hy))),
+                           ((slice(hx,nx), slice(0,hy)), (slice(nxe-hx,nxe), slice(0,hy))),
+                           ((slice(0,hx), slice(hy,ny)), (slice(0,hx), slice(nye-hy,nye))),
+                           ((slice(hx,nx), slice(hy,ny)), (slice(nxe-hx,nxe), slice(nye-hy,nye)))]
+            real = self.cdtype
+        
+        self.fft_object = get_plan(batch+(nxe,nye), real, 'FFTW_FORWARD')
+        self.fft_object_inv = get_plan((4,)+batch+(nxe,nye), real, 'FFTW_BACKWARD')
+        
+        self.sf = np.empty(batch+k2.shape, dtype=self.cdtype)
+        self.wc = np.empty(batch+k2.shape, dtype=self.cdtype)
+        self.jf = np.zeros(batch+k2.shape, dtype=self.cdtype)
+        self.jq = np.empty(batch+(nxe,nye), dtype=self.dtype)
+        
+        self.fft_object_inv.input_array[...] = 0.0
+        self.fft_object.input_array[...] = 0.0
+        if self.half:
+            self.jacp = self.fft_object.input_array
+        else:
+            self.jacp = self.fft_object.input_array.real
+        
+        self.jit = jit and jit_kernels.available
+        if self.jit:
+            self.xemap, self.xtmap = jit_kernels.index_maps(nx,nxe,nyquist=not self.half)
+            self.yemap, self.ytmap = jit_kernels.index_maps(ny,nye,onesided=self.half)
+            self.ikx1 = self.ikx.ravel()
+            self.iky1 = self.iky.ravel()
+    
+    def jacobian(self, wf, jf=None):
+        
+        '''
+        compute the dealiased Jacobian of wf, written to jf (default: the
+        workspace's own output array, overwritten by the next call)
+        '''
+        
+        if jf is None:
+            jf = self.jf
+        
+        nx, ny, nxe, nye = self.nx, self.ny, self.nxe, self.nye
+        ikx, iky = self.ikx, self.iky
+        
+        if self.jit:
+            return self.jacobian_jit(wf,jf)
+        
+        # a field of higher precision is converted once (mixed precision)
+        if wf.dtype != self.cdtype:
+            np.copyto(self.wc, wf, casting='same_kind')
+            wf = self.wc
+        
+        # streamfunction -wf/k2
+        sf = self.sf
+        np.divide(wf, self.k2, out=sf)
+        np.negative(sf, out=sf)
+        
+        j4f_padded = self.fft_object_inv.input_array
+        if self.half:
+            # the complex-to-real transform overwrites its input
+            j4f_padded[...,int(nx/2):int(nxe-nx/2+1),:] = 0.0
+            j4f_padded[...,int(ny/2):] = 0.0
+        
+        # the blocks index the last two axes, so a batch of fields is
+        # copied with the same slices
+        for src, dst in self.blocks:
+            src, dst = (Ellipsis,)+src, (Ellipsis,)+dst
+            np.multiply(ikx[src[1],:], sf[src], out=j4f_padded[(0,)+dst])
+            np.multiply(iky[:,src[2]], wf[src], out=j4f_padded[(1,)+dst])
+            np.multiply(iky[:,src[2]], sf[src], out=j4f_padded[(2,)+dst])
+            np.multiply(ikx[src[1],:], wf[src], out=j4f_padded[(3,)+dst])
+        if self.half:
+            self.pad_nyquist(wf, j4f_padded)
+        
+        j = self.fft_object_inv()
+        if not self.half:
+            j = j.real
+        
+        np.multiply(j[0], j[1], out=self.jacp)
+        np.multiply(j[2], j[3], out=self.jq)
+        np.subtract(self.jacp, self.jq, out=self.jacp)
+        
+        jacpf = self.fft_object()
+        
+        for src, dst in self.blocks:
+            np.multiply(jacpf[(Ellipsis,)+dst], self.scale, out=jf[(Ellipsis,)+src])
+        if self.half:
+            self.truncate_nyquist(jacpf, jf)
+        
+        return jf
+    
+    def pad_nyquist(self, wf, out):
+        
+        '''
+        write the padded derivative fields of the Nyquist modes of the half
+        spectrum to out (4,...,nxe,nye/2+1), like the one-sided Nyquist modes
+        of the full spectrum: the row kx = -nx/2 is split in half between the
+        rows -nx/2 and +nx/2 of the padded grid, the column ky = ny/2 is put
+        in half at the column +ny/2 (-ny/2 follows from the symmetry of the
+        half spectrum) and the corner in half at (+nx/2,+ny/2)
+        '''
+        
+        nx, nxe = self.nx, self.nxe
+        hx, hy = int(self.nx/2), int(self.ny/2)
+        ikx, iky, k2 = self.ikx2, self.iky2, self.k2
+        
+        w = wf[...,hx,0:hy]
+        s = -w/k2[hx,0:hy]
+        for row, kx in ((nxe-hx, ikx[hx,0]), (hx, -ikx[hx,0])):
+            out[0][...,row,0:hy] = kx*s
+            out[1][...,row,0:hy] = iky[0,0:hy]*w
+            out[2][...,row,0:hy] = iky[0,0:hy]*s
+            out[3][...,row,0:hy] = kx*w
+        
+        for src, dst in ((slice(0,hx), slice(0,hx)), (slice(hx+1,nx), slice(nxe-hx+1,nxe))):
+            w = wf[...,src,hy]
+            s = -w/k2[src,hy]
+            out[0][...,dst,hy] = ikx[src,0]*s
+            out[1][...,dst,hy] = iky[0,hy]*w
+            out[2][...,dst,hy] = iky[0,hy]*s
+            out[3][...,dst,hy] = ikx[src,0]*w
+        
+        w = wf[...,hx,hy]
+        s = -w/k2[hx,hy]
+        out[0][...,hx,hy] = -ikx[hx,0]*s
+        out[1][...,hx,hy] = iky[0,hy]*w
+        out[2][...,hx,hy] = iky[0,hy]*s
+        out[3][...,hx,hy] = -ikx[hx,0]*w
+    
+    def truncate_nyquist(self, jpf, jf):
+        
+        '''
+        write the Nyquist modes of the half spectrum of the Jacobian from the
+        padded spectrum jpf of the product, the part of the one-sided Nyquist
+        modes of the full spectrum seen on the nx X ny grid
+        '''
+        
+        nx, nxe = self.nx, self.nxe
+        hx, hy = int(self.nx/2), int(self.ny/2)
+        scale = 0.5*self.scale
+        
+        # (P(-nx/2,ky) + P(+nx/2,ky))/2
+        jf[...,hx,0:hy] = scale*(jpf[...,nxe-hx,0:hy] + jpf[...,hx,0:hy])
+        
+        # (P(kx,ny/2) + conj(P(-kx,ny/2)))/2
+        for src, dst, mirror in ((slice(0,hx), slice(0,hx), self.mirror[0]),
+                                 (slice(hx+1,nx), slice(nxe-hx+1,nxe), self.mirror[1])):
+            jf[...,src,hy] = scale*(jpf[...,dst,hy] + np.conj(jpf[...,mirror,hy]))
+        
+        jf[...,hx,hy] = 2.0*scale*jpf[...,hx,hy].real
+    
+    def jacobian_jit(self, wf, jf):
+        
+        '''
+        jacobian with the fused kernels, one pass over the arrays for the
+        padding, the product and the truncation (a field of higher precision
+        is converted in the padding kernel)
+        '''
+        
+        def batched(a):
+            return a.reshape((-1,)+a.shape[-2:])
+        
+        j4f_padded = self.fft_object_inv.input_array
+        # the complex-to-real transform of the half spectrum overwrites its
+        # input, so the zero padding is written again
+        jit_kernels.pad_derivatives(batched(wf), self.k2, self.ikx1, self.iky1, self.xemap,
+                                    self.yemap, self.half,
+                                    j4f_padded.reshape((4,-1)+j4f_padded.shape[-2:]))
+        if self.half:
+            self.pad_nyquist(wf, j4f_padded)
+        
+        j = self.fft_object_inv()
+        jit_kernels.product(j.reshape((4,-1)+j.shape[-2:]), batched(self.fft_object.input_array))
+        
+        jacpf = self.fft_object()
+        jit_kernels.truncate(batched(jacpf), self.xtmap, self.ytmap, self.scale, batched(jf))
+        if self.half:
+            self.truncate_nyquist(jacpf, jf)
+        
+        return jf
+
+#%%
+_workspaces = {}
+
+#%%
+def get_workspace(nx,ny,kx,ky,k2,pad=1.5,dtype='float64',batch=()):
+    
+    '''
+    return the cached SpectralWorkspace for the grid, layout, padding factor,
+    precision, batch dimensions, number of FFTW threads and kernels (one per
+    thread, like the plans)
+    '''
+    
+    # the Numba kernels are only run by the main thread
+    jit = _config['jit'] and threading.current_thread() is threading.main_thread()
+    key = (nx, ny, ky.size, pad, np.dtype(dtype).name, tuple(batch), get_threads(), jit,
+           threading.get_ident())
+    
+    workspace = _workspaces.get(key)
+    if workspace is None:
+        workspace = SpectralWorkspace(nx,ny,kx,ky,k2,pad,dtype,batch,jit)
+        _workspaces[key] = workspace
+    
+    return workspace
+
+#%%
+def set_jit(jit):
+    
+    '''
+    use the Numba kernels (jit = True, only if Numba is installed) or NumPy
+    (jit = False) in the workspaces of the main thread created from now on
+    '''
+    
+    _config['jit'] = bool(jit) and jit_kernels.available
+
+#%%
+def get_jit():
+    
+    '''
+    return True if new workspaces use the Numba kernels
+    '''
+    
+    return _config['jit']
+
+#%%
+def clear_workspaces():
+    
+    '''
+    remove all cached workspaces
+    '''
+    
+    _workspaces.clear()
+
+#%%
+def nonlineardealiased(nx,ny,kx,ky,k2,wf,pad=1.5,jf=None,dtype=None):    
+    
+    '''
+    compute the Jacobian with 3/2 dealiasing 
+    
+    Inputs
+    ------
+    nx,ny : number of grid points in x and y direction on fine grid
+    kx,ky : wavenumber in x and y direction (ky = 0,1,...,ny/2 for the half spectrum)
+    k2 : absolute wave number over 2D domain
+    wf : vorticity field in frequency domain (excluding periodic boundaries),
+         either the full (nx,ny) or the half (nx,ny/2+1) spectrum, or a batch
+         (B,nx,ny) of fields
+    pad : padding factor, at least 3/2 for the product to be free of aliasing
+    jf : array the Jacobian is written to (default: a new array of the type of wf)
+    dtype : real data type the Jacobian is computed in (default: the
+            precision of wf), 'float32' with a complex128 wf gives the mixed
+            precision Jacobian
+    
+    Output
+    ------
+    jf : jacobian in frequency domain (excluding periodic boundaries)
+         (d(psi)/dy*d(omega)/dx - d(psi)/dx*d(omega)/dy)
+         the half spectrum of the Jacobian of the full spectrum of a real field
+    '''
+    
+    if dtype is None:
+        dtype = wf.real.dtype
+    
+    workspace = get_workspace(nx,ny,kx,ky,k2,pad,dtype,wf.shape[:-2])
+    
+    if jf is None:
+        jf = np.empty(wf.shape, dtype=wf.dtype)
+    
+    return workspace.jacobian(wf,jf)
+
+#%%
+def jacobian_product(nx,ny,j1f,j2f,j3f,j4f):
+    
+    '''
+    compute j1*j2 - j3*j4 in physical space on the nx X ny grid
+    
+    Inputs
+    ------
+    nx,ny : number of grid points in x and y direction
+    j1f,j2f,j3f,j4f : derivative fields in frequency domain, either the full
+                      (nx,ny) or the half (nx,ny/2+1) spectrum, or a batch of them
+    
+    Output
+    ------
+    jf : product in frequency domain in the same layout as the inputs
+    '''
+    
+    # the precision of the plans follows the precision of the inputs
+    shape = j1f.shape[:-2]+(nx,ny)
+    if j1f.shape[-1] == int(ny/2)+1:
+        fft_object = get_plan(shape, j1f.real.dtype, 'FFTW_FORWARD')
+        fft_object_inv = get_plan(shape, j1f.real.dtype, 'FFTW_BACKWARD')
+    else:
+        fft_object = get_plan(shape, j1f.dtype, 'FFTW_FORWARD')
+        fft_object_inv = get_plan(shape, j1f.dtype, 'FFTW_BACKWARD')
+    
+    # the cached plan reuses its output array, so keep copies of j1, j2, j3
+    j1 = np.copy(np.real(fft_object_inv(j1f)))
+    j2 = np.copy(np.real(fft_object_inv(j2f)))
+    j3 = np.copy(np.real(fft_object_inv(j3f)))
+    j4 = np.real(fft_object_inv(j4f))
+    
+    jac = j1*j2 - j3*j4
+    
+    jf = np.copy(fft_object(jac))
+    
+    return jf
+
+#%%
+def nonlinear(nx,ny,kx,ky,k2,wf):  
+    
+    '''
+    compute the Jacobian without dealiasing 
+    
+    Inputs
+    ------
+    nx,ny : number of grid points in x and y direction on fine grid
+    kx,ky : wavenumber in x and y direction
+    k2 : absolute wave number over 2D domain
+    wf : vorticity field in frequency domain (excluding periodic boundaries)
+    
+    Output
+    ------
+    jf : jacobian in frequency domain (excluding periodic boundaries)
+         (d(psi)/dy*d(omega)/dx - d(psi)/dx*d(omega)/dy)
+    '''
+    
+    if wf.shape[-1] == int(ny/2)+1:
+        # d/dx of the Nyquist row kx = -nx/2 is not seen on the grid (the
+        # full spectrum drops it with the imaginary part)
+        kx = np.where(np.arange(nx).reshape(nx,1) == int(nx/2), 0.0, kx)
+    
+    j1f = -1.0j*kx*wf/k2
+    j2f = 1.0j*ky*wf
+    j3f = -1.0j*ky*wf/k2
+    j4f = 1.0j*kx*wf
+    
+    jf = jacobian_product(nx,ny,j1f,j2f,j3f,j4f)
+    
+    return jf
+
+#%%
+def nonlineartruncated(nx,ny,kx,ky,k2,wf):  
+    
+    '''
+    compute the Jacobian with 2/3 dealiasing (no padding), only the modes with
+    |kx| < nx/3 and |ky| < ny/3 are kept in the input and in the product
+    
+    Inputs
+    ------
+    nx,ny : number of grid points in x and y direction on fine grid
+    kx,ky : wavenumber in x and y direction
+    k2 : absolute wave number over 2D domain
+    wf : vorticity field in frequency domain (excluding periodic boundaries)
+    
+    Output
+    ------
+    jf : jacobian in frequency domain (excluding periodic boundaries)
+         (d(psi)/dy*d(omega)/dx - d(psi)/dx*d(omega)/dy)
+    '''
+    
+    mask = (np.abs(kx) < nx/3.0) & (np.abs(ky) < ny/3.0)
+    
+    jf = nonlinear(nx,ny,kx,ky,k2,wf*mask)
+    jf = jf*mask
+    
+    return jf
+
+#%%
+def nonlinearphaseshift(nx,ny,kx,ky,k2,wf):  
+    
+    '''
+    compute the Jacobian with phase-shift dealiasing (no padding)
+    
+    The Jacobian is averaged over the grid and the grid shifted by half a grid
+    spacing in both directions, which cancels the aliases shifted by nx or ny
+    in one direction. The remaining aliases are removed by keeping only the
+    modes with |k| < sqrt(2)/3*nx in the input and in the product.
+    
+    Inputs
+    ------
+    nx,ny : number of grid points in x and y direction on fine grid
+    kx,ky : wavenumber in x and y direction
+    k2 : absolute wave number over 2D domain
+    wf : vorticity field in frequency domain (excluding periodic boundaries)
+    
+    Output
+    ------
+    jf : jacobian in frequency domain (excluding periodic boundaries)
+         (d(psi)/dy*d(omega)/dx - d(psi)/dx*d(omega)/dy)
+    '''
+    
+    mask = (kx*kx/(nx*nx) + ky*ky/(ny*ny)) < 2.0/9.0
+    
+    wfm = wf*mask
+    
+    j1f = -1.0j*kx*wfm/k2
+    j2f = 1.0j*ky*wfm
+    j3f = -1.0j*ky*wfm/k2
+    j4f = 1.0j*kx*wfm
+    
+    # shift by dx/2 and dy/2, dx = 2*pi/nx
+    shift = np.exp(1.0j*np.pi*(kx/nx + ky/ny))
+    
+    jf = jacobian_product(nx,ny,j1f,j2f,j3f,j4f)
+    jfs = jacobian_product(nx,ny,j1f*shift,j2f*shift,j3f*shift,j4f*shift)
+    
+    jf = 0.5*(jf + jfs/shift)*mask
+    
+    return jf
+
+#%%
+def get_nonlinear(idealias,pad=1.5,dtype=None):
+    
+    '''
+    return the function computing the Jacobian for the selected dealiasing
+    
+    Inputs
+    ------
+    idealias : [0] none, [1] 2/3 truncation, [2] padding, [3] phase shift
+    pad : padding factor for idealias = 2
+    dtype : real data type the Jacobian is computed in (default: the
+            precision of wf), the result has the type of wf
+    
+    Output
+    ------
+    jacobian : function jacobian(nx,ny,kx,ky,k2,wf,jf=None) returning the
+               Jacobian in frequency domain, written to jf if it is given
+    '''
+    
+    if idealias == 2:
+        return lambda nx,ny,kx,ky,k2,wf,jf=None: nonlineardealiased(nx,ny,kx,ky,k2,wf,pad,jf,dtype)
+    
+    if idealias == 0:
+        nonlinear_function = nonlinear
+    elif idealias == 1:
+        nonlinear_function = nonlineartruncated
+    elif idealias == 3:
+        nonlinear_function = nonlinearphaseshift
+    else:
+        raise ValueError('unknown dealiasing strategy: '+str(idealias))
+    
+    def jacobian(nx,ny,kx,ky,k2,wf,jf=None):
+        if jf is None:
+            jf = np.empty(wf.shape, dtype=wf.dtype)
+        if dtype is None:
+            jf[...] = nonlinear_function(nx,ny,kx,ky,k2,wf)
+        else:
+            cdtype = np.result_type(dtype, np.complex64)
+            jf[...] = nonlinear_function(nx,ny,kx.astype(dtype),ky.astype(dtype),k2.astype(dtype),
+                                         wf.astype(cdtype))
+        return jf
+    
+    return jacobian
+
+#%%
+class StepJacobian(object):
+    
+    '''
+    Jacobian function jacobian(wf,jf) of the time integrators that remembers
+    the Jacobian of the state of the time loop, so that the output and the
+    first stage of the next time step share it
+    
+    Every integrator starts a time step with jacobian(wnf,jnf). If the
+    Jacobian of the state wnf at step n is already in jnf (computed by
+    state_jacobian for the output), this call returns without computing it.
+    
+    Inputs
+    ------
+    rhs : function rhs(wf,jf) writing the Jacobian of wf to jf
+    wnf : vorticity field in frequency domain of the time loop
+    jnf : Jacobian of the first stage of the integrator (integrator.jnf)
+    n : time step of the state wnf
+    '''
+    
+    def __init__(self, rhs, wnf, jnf, n=0):
+        self.rhs = rhs
+        self.wnf = wnf
+        self.jnf = jnf
+        self.n = n
+        self.step = None
+        self.hits = 0
+    
+    def __call__(self, wf, jf):
+        if wf is self.wnf and jf is self.jnf and self.step == self.n:
+            self.hits += 1
+            return
+        
+        self.rhs(wf,jf)
+        if jf is self.jnf:
+            self.step = self.n if wf is self.wnf else None
+    
+    def set_step(self, n):
+        
+        '''
+        set the time step of the state wnf (after it is advanced)
+        '''
+        
+        self.n = n
+    
+    def state_jacobian(self):
+        
+        '''
+        return the Jacobian of the state wnf at the current step (jnf, valid
+        until the next time step)
+        '''
+        
+        self(self.wnf,self.jnf)
+        
+        return self.jnf
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Frames and movies of the output of the spectral solver, rendered outside of
+the time loop.
+
+The renderer reads the snapshots written by write_data from the snapshot store
+(snapshots.h5, iout = 1 or 2), the archive (archive/, iout = 3) or the .csv
+files (iout = 0) of an output folder, downsamples every field to at most
+--points X --points points (the contour plot of a 2049^2 field takes seconds
+and shows no more detail at the resolution of the image) and draws a contour
+plot per snapshot into <folder>/frames/<field>_<output>.png. The frames of
+several snapshots are drawn in parallel by -j processes, frames already drawn
+are skipped. With --movie the frames are put together into a movie (.gif with
+Pillow, other formats with ffmpeg).
+
+The solver starts the renderer as a background process with irender > 0
+(--follow), which draws the frames of every irender-th output while the run
+goes on and ends when the last frame is drawn or the solver is no longer
+running.
+
+usage:
+    python render_frames.py spectral/data_2048_v2 [--field w] [--every 50] [--points 512]
+                                                  [-j 4] [--movie w.gif --fps 10]
+
+"""
+
+import argparse
+import glob
+import multiprocessing
+import os
+import sys
+import shutil
+import subprocess
+import time as tm
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from snapshot_archive import ArchiveReader
+import snapshot_store
+
+# .csv files of the fields written by write_data with iout = 0
+csv_files = {'jc': '01_coarsened_jacobian_field/J_fourier_',
+             'jcoarse': '02_jacobian_coarsened_field/J_coarsen_',
+             'sgs': '03_subgrid_scale_term/sgs_',
+             'w': '04_vorticity/w_',
+             's': '05_streamfunction/s_'}
+
+#%%
+def snapshot_index(folder, tout=None):
+
+    '''
+    return the output numbers and times of the complete snapshots of folder,
+    from the snapshot store, the archive or the .csv files (times output*tout,
+    None without tout)
+    '''
+
+    filename = os.path.join(folder,'snapshots.h5')
+    if os.path.exists(filename):
+        outputs, times, attrs = snapshot_store.read_index(filename)
+        return outputs, times
+
+    if os.path.exists(os.path.join(folder,'archive','index.npy')):
+        archive = ArchiveReader(folder)
+        return archive.outputs, archive.times
+
+    # the streamfunction is the last file written by write_data
+    files = glob.glob(os.path.join(folder,'05_streamfunction','s_*.csv'))
+    outputs = np.array(sorted(int(os.path.basename(f)[2:-4]) for f in files), dtype=np.int64)
+    times = outputs*tout if tout is not None else None
+
+    return outputs, times
+
+#%%
+def read_field(folder, name, output, points):
+
+    '''
+    read the field name of the snapshot output, keeping every stride-th point
+    so that the field has at most points points in every direction (only the
+    kept points are read from the store and the archive)
+    '''
+
+    filename = os.path.join(folder,'snapshots.h5')
+    if os.path.exists(filename):
+        with snapshot_store.open_store(filename) as f:
+            shape = f[name].shape[1:]
+        stride = max(1, int(np.ceil(max(shape)/points)))
+        box = (slice(None,None,stride), slice(None,None,stride))
+        index = snapshot_store.find_snapshot(filename, output=output)
+        return snapshot_store.read_snapshot(filename, name, index, box)
+
+    if os.path.exists(os.path.join(folder,'archive','index.npy')):
+        field = ArchiveReader(folder).get(name, output=output)
+    else:
+        field = np.loadtxt(os.path.join(folder,csv_files[name]+str(output)+'.csv'), delimiter=',')
+    stride = max(1, int(np.ceil(max(field.shape)/points)))
+
+    return np.array(field[::stride,::stride])
+
+#%%
+def frame_name(folder, name, output):
+    return os.path.join(folder,'frames',name+'_'+'%05d' % output+'.png')
+
+#%%
+def render_frame(job):
+
+    '''
+    draw the contour plot of one snapshot
+
+    Inputs
+    ------
+    job : (folder, field name, output number, time, number of levels, points)
+    '''
+
+    folder, name, output, time, levels, points = job
+    field = read_field(folder, name, output, points)
+
+    fig, ax = plt.subplots(figsize=(5,5.6))
+    cs = ax.contourf(field.T, levels, cmap='jet')
+    label = '$t = '+'%g' % time+'$' if time is not None else 'output '+str(output)
+    ax.set_title(label, fontsize=16, fontweight='bold')
+    ax.set_xticks([])
+    ax.set_yticks([])
+    fig.colorbar(cs, ax=ax, orientation='horizontal', fraction=0.05, pad=0.04)
+    fig.tight_layout()
+
+    filename = frame_name(folder, name, output)
+    fig.savefig(filename+'.tmp.png', dpi=100)
+    plt.close(fig)
+    os.replace(filename+'.tmp.png', filename)
+
+    return filename
+
+#%%
+def render_frames(folder, name='w', every=1, points=512, levels=120, processes=1, tout=None):
+
+    '''
+    draw the frames of every every-th output of folder that are not drawn yet
+
+    Inputs
+    ------
+    folder : output folder of the solver, e.g. spectral/data_2048_v2
+    name : field, one of w, s, jc, jcoarse, sgs
+    every : draw the outputs that are multiples of every
+    points : maximum number of points in every direction of the drawn field
+    levels : number of contour levels
+    processes : number of processes drawing frames at the same time
+    tout : time between two outputs, for the .csv files without times
+
+    Output
+    ------
+    filenames : frames drawn
+    '''
+
+    if not os.path.exists(os.path.join(folder,'frames')):
+        os.makedirs(os.path.join(folder,'frames'))
+
+    outputs, times = snapshot_index(folder, tout)
+    jobs = []
+    for i, output in enumerate(outputs):
+        if output%every == 0 and not os.path.exists(frame_name(folder, name, output)):
+            time = float(times[i]) if times is not None else None
+            jobs.append((folder, name, int(output), time, levels, points))
+
+    if processes > 1 and len(jobs) > 1:
+        with multiprocessing.Pool(processes) as pool:
+            return pool.map(render_frame, jobs)
+
+    return [render_frame(job) for job in jobs]
+
+#%%
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+#%%
+def follow_run(folder, pid, ns, poll=5.0, **kwargs):
+
+    '''
+    draw the frames of a running solver as its outputs are written, until the
+    frames of all ns outputs are drawn or the solver pid has ended
+    '''
+
+    name, every = kwargs.get('name','w'), kwargs.get('every',1)
+    last = [output for output in range(1,ns+1) if output%every == 0]
+    while True:
+        alive = pid_alive(pid)
+        try:
+            render_frames(folder, **kwargs)
+        except (OSError, KeyError, ValueError):
+            # the solver is writing the snapshot, it is read at the next poll
+            pass
+        if not alive or all(os.path.exists(frame_name(folder, name, o)) for o in last):
+            break
+        tm.sleep(poll)
+
+#%%
+def write_movie(folder, name, filename, fps=10):
+
+    '''
+    put the frames of the field name together into a movie, a .gif is written
+    with Pillow, any other format with ffmpeg
+    '''
+
+    frames = sorted(glob.glob(os.path.join(folder,'frames',name+'_*.png')))
+    frames = [f for f in frames if not f.endswith('.tmp.png')]
+    if not frames:
+        raise FileNotFoundError('no frames of '+name+' in '+os.path.join(folder,'frames'))
+
+    if filename.endswith('.gif'):
+        from PIL import Image
+        images = [Image.open(f).convert('RGB') for f in frames]
+        images[0].save(filename, save_all=True, append_images=images[1:], duration=int(1000/fps),
+                       loop=0)
+        return
+
+    ffmpeg = shutil.which('ffmpeg')
+    if ffmpeg is None:
+        raise RuntimeError('ffmpeg is not installed, write the movie as .gif')
+    subprocess.run([ffmpeg, '-y', '-framerate', str(fps), '-pattern_type', 'glob', '-i',
+                    os.path.join(folder,'frames',name+'_[0-9]*.png'), '-pix_fmt', 'yuv420p',
+                    '-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2', filename], check=True)
+
+#%%
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='frames and movies of the solver output')
+    parser.add_argument('folder', help='output folder, e.g. spectral/data_2048_v2')
+    parser.add_argument('--field', default='w', choices=list(csv_files), help='field to draw')
+    parser.add_argument('--every', type=int, default=1, help='draw every n-th output')
+    parser.add_argument('--points', type=int, default=512, help='maximum points per direction')
+    parser.add_argument('--levels', type=int, default=120, help='contour levels')
+    parser.add_argument('-j', type=int, default=1, help='processes drawing frames')
+    parser.add_argument('--tout', type=float, default=None, help='time between outputs (.csv files)')
+    parser.add_argument('--follow', type=int, default=None, metavar='PID',
+                        help='draw the frames while the solver PID is running')
+    parser.add_argument('--ns', type=int, default=None, help='number of outputs of the run (--follow)')
+    parser.add_argument('--poll', type=float, default=5.0, help='seconds between checks (--follow)')
+    parser.add_argument('--movie', default=None, help='movie file (.gif, or .mp4 with ffmpeg)')
+    parser.add_argument('--fps', type=float, default=10, help='frames per second of the movie')
+    args = parser.parse_args()
+    if args.follow is not None and args.ns is None:
+        parser.error('--follow needs the number of outputs --ns')
+
+    kwargs = {'name': args.field, 'every': args.every, 'points': args.points,
+              'levels': args.levels, 'processes': args.j, 'tout': args.tout}
+
+    clock_time_init = tm.time()
+    if args.follow is not None:
+        follow_run(args.folder, args.follow, args.ns, args.poll, **kwargs)
+    else:
+        filenames = render_frames(args.folder, **kwargs)
+        print('frames drawn: ', len(filenames), ' in [s] ', tm.time() - clock_time_init)
+
+    if args.movie is not None:
+        write_movie(args.folder, args.field, args.movie, args.fps)
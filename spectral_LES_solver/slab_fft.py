@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Slab-decomposed two-dimensional FFT and dealiased Jacobian for several
+processes.
+
+The physical field is split into P slabs of nx/P rows (x direction) and the
+spectral field into P slabs of ny/P columns (ky), each process (rank) holding
+one slab. A two-dimensional transform is a one-dimensional transform along the
+local axis, a transpose in which every rank exchanges one block with every
+other rank (all-to-all), and a one-dimensional transform along the other axis.
+
+The dealiased Jacobian is padded in the same way: the four derivative fields
+are padded along x and transformed, transposed, padded along y and transformed
+to the padded physical grid, which is split into slabs of nxe/P rows. Every
+rank only holds 1/P of the padded arrays.
+
+The all-to-all exchange is done by a communicator:
+
+    SharedComm : processes on one node started by multiprocessing, exchanging
+                 the blocks through one shared memory buffer
+    MPIComm    : mpi4py (optional), e.g. mpiexec -n 4 python spectral_solver_parallel.py --mpi
+
+The results agree with the serial transforms to rounding, not bitwise, since
+the two-dimensional transforms are done as two one-dimensional ones.
+
+"""
+
+import numpy as np
+from multiprocessing import shared_memory
+from fft_plans import get_plan, padded_size
+
+try:
+    from mpi4py import MPI
+except ImportError:
+    MPI = None
+
+#%%
+class SharedComm(object):
+
+    '''
+    communicator of processes on one node using a shared memory buffer
+
+    Inputs
+    ------
+    rank : number of this process (0,...,size-1)
+    size : number of processes
+    name : name of the shared memory block created by the parent process
+    barrier : multiprocessing.Barrier for the size processes
+    '''
+
+    def __init__(self, rank, size, name, barrier):
+        self.rank = rank
+        self.size = size
+        self.barrier = barrier
+        self.shm = shared_memory.SharedMemory(name=name)
+
+    def buffer(self, shape, dtype):
+
+        '''
+        return a view of the shared buffer
+        '''
+
+        return np.ndarray(shape, dtype=dtype, buffer=self.shm.buf)
+
+    def alltoall(self, send, recv):
+
+        '''
+        send[d] is sent to rank d, recv[s] is received from rank s
+        '''
+
+        buf = self.buffer((self.size,)+send.shape, send.dtype)
+        buf[self.rank] = send
+        self.barrier.wait()
+        recv[...] = buf[:,self.rank]
+        self.barrier.wait()
+
+    def gather(self, local):
+
+        '''
+        return the array of the local arrays of all ranks on rank 0 (None on
+        the other ranks)
+        '''
+
+        buf = self.buffer((self.size,)+local.shape, local.dtype)
+        buf[self.rank] = local
+        self.barrier.wait()
+        result = np.copy(buf) if self.rank == 0 else None
+        self.barrier.wait()
+
+        return result
+
+    def bcast(self, a):
+
+        '''
+        broadcast the array a of rank 0 to all ranks
+        '''
+
+        buf = self.buffer(a.shape, a.dtype)
+        if self.rank == 0:
+            buf[...] = a
+        self.barrier.wait()
+        a[...] = buf
+        self.barrier.wait()
+
+        return a
+
+    def scatter(self, a, local):
+
+        '''
+        send a[r] of the array a of rank 0 (None on the other ranks) to rank r,
+        written to local
+        '''
+
+        buf = self.buffer((self.size,)+local.shape, local.dtype)
+        if self.rank == 0:
+            buf[...] = a
+        self.barrier.wait()
+        local[...] = buf[self.rank]
+        self.barrier.wait()
+
+        return local
+
+    def wait(self):
+        self.barrier.wait()
+
+    def close(self):
+        self.shm.close()
+
+#%%
+class MPIComm(object):
+
+    '''
+    communicator of MPI processes (requires mpi4py)
+    '''
+
+    def __init__(self):
+        if MPI is None:
+            raise ImportError('mpi4py is required for MPIComm')
+        self.comm = MPI.COMM_WORLD
+        self.rank = self.comm.Get_rank()
+        self.size = self.comm.Get_size()
+
+    def alltoall(self, send, recv):
+        self.comm.Alltoall(np.ascontiguousarray(send), recv)
+
+    def gather(self, local):
+        result = np.empty((self.size,)+local.shape, dtype=local.dtype) if self.rank == 0 else None
+        self.comm.Gather(np.ascontiguousarray(local), result, root=0)
+        return result
+
+    def bcast(self, a):
+        self.comm.Bcast(a, root=0)
+        return a
+
+    def scatter(self, a, local):
+        self.comm.Scatter(None if a is None else np.ascontiguousarray(a), local, root=0)
+        return local
+
+    def wait(self):
+        self.comm.Barrier()
+
+    def close(self):
+        pass
+
+#%%
+def buffer_size(nx,ny,size,pad=1.5):
+
+    '''
+    return the size in bytes of the shared buffer needed by SlabFFT for
+    complex128 fields (the four padded derivative fields, distributed)
+    '''
+
+    nxe = padded_size(nx,pad,np.lcm(2,size))
+
+    return max(4*nxe*ny, (nx+1)*(ny+1))*16
+
+#%%
+class SlabFFT(object):
+
+    '''
+    slab-decomposed FFT and dealiased Jacobian of one rank
+
+    Inputs
+    ------
+    comm : SharedComm or MPIComm
+    nx,ny : number of grid points in x and y direction (multiples of comm.size)
+    pad : padding factor of the dealiased Jacobian
+
+    The rank holds the rows x[nxl*rank:nxl*(rank+1)] in physical space and
+    the columns ky[nyl*rank:nyl*(rank+1)] (in the order of np.fft.fftfreq)
+    in frequency domain, nxl = nx/P, nyl = ny/P.
+    '''
+
+    def __init__(self, comm, nx, ny, pad=1.5):
+        size, rank = comm.size, comm.rank
+        if nx%size != 0 or ny%size != 0:
+            raise ValueError('nx and ny have to be multiples of the number of processes')
+
+        self.comm = comm
+        self.nx, self.ny = nx, ny
+        self.nxl, self.nyl = int(nx/size), int(ny/size)
+        self.nxe = padded_size(nx,pad,np.lcm(2,size))
+        self.nye = padded_size(ny,pad,np.lcm(2,size))
+        self.nxel = int(self.nxe/size)
+
+        nxl, nyl, nxe, nye, nxel = self.nxl, self.nyl, self.nxe, self.nye, self.nxel
+
+        # local wavenumbers
+        self.kx = np.fft.fftfreq(nx,1/nx).reshape(nx,1)
+        self.ky = np.fft.fftfreq(ny,1/ny)[nyl*rank:nyl*(rank+1)].reshape(1,nyl)
+        self.k2 = self.kx*self.kx + self.ky*self.ky
+        if rank == 0:
+            self.k2[0,0] = 1.0e-12
+
+        # plans of the unpadded transforms
+        self.fft_y = get_plan((nxl,ny), 'complex128', 'FFTW_FORWARD', axes=(-1,))
+        self.fft_x = get_plan((nx,nyl), 'complex128', 'FFTW_FORWARD', axes=(-2,))
+        self.ifft_y = get_plan((nxl,ny), 'complex128', 'FFTW_BACKWARD', axes=(-1,))
+        self.ifft_x = get_plan((nx,nyl), 'complex128', 'FFTW_BACKWARD', axes=(-2,))
+
+        # plans and buffers of the dealiased Jacobian
+        self.ifft_xe = get_plan((4,nxe,nyl), 'complex128', 'FFTW_BACKWARD', axes=(-2,))
+        self.ifft_ye = get_plan((4,nxel,nye), 'complex128', 'FFTW_BACKWARD', axes=(-1,))
+        self.fft_ye = get_plan((nxel,nye), 'complex128', 'FFTW_FORWARD', axes=(-1,))
+        self.fft_xe = get_plan((nxe,nyl), 'complex128', 'FFTW_FORWARD', axes=(-2,))
+
+        self.send4 = np.empty((size,4,nxel,nyl), dtype='complex128')
+        self.recv4 = np.empty((size,4,nxel,nyl), dtype='complex128')
+        self.send1 = np.empty((size,nxel,nyl), dtype='complex128')
+        self.recv1 = np.empty((size,nxel,nyl), dtype='complex128')
+        self.sendu = np.empty((size,nxl,nyl), dtype='complex128')
+        self.recvu = np.empty((size,nxl,nyl), dtype='complex128')
+        self.sf = np.empty((nx,nyl), dtype='complex128')
+        self.jq = np.empty((nxel,nye))
+        self.jt = np.empty((nxel,ny), dtype='complex128')
+
+        self.ifft_xe.input_array[...] = 0.0
+        self.ifft_ye.input_array[...] = 0.0
+        self.scale = (nxe*nye)/(nx*ny)
+
+    def forward(self, u):
+
+        '''
+        transform the local rows u (nxl,ny) of a physical field to the local
+        columns (nx,nyl) of its spectrum
+        '''
+
+        size, nxl, nyl = self.comm.size, self.nxl, self.nyl
+
+        a = self.fft_y(u)
+        self.sendu[...] = a.reshape(nxl,size,nyl).transpose(1,0,2)
+        self.comm.alltoall(self.sendu, self.recvu)
+
+        return np.copy(self.fft_x(self.recvu.reshape(self.nx,nyl)))
+
+    def backward(self, uf):
+
+        '''
+        transform the local columns uf (nx,nyl) of a spectrum to the local
+        rows (nxl,ny) of the physical field (complex)
+        '''
+
+        size, nxl, nyl = self.comm.size, self.nxl, self.nyl
+
+        a = self.ifft_x(uf)
+        self.sendu[...] = a.reshape(size,nxl,nyl)
+        self.comm.alltoall(self.sendu, self.recvu)
+
+        return np.copy(self.ifft_y(self.recvu.transpose(1,0,2).reshape(nxl,self.ny)))
+
+    def jacobian(self, wf, jf):
+
+        '''
+        compute the dealiased Jacobian of the local columns wf (nx,nyl) of
+        the vorticity spectrum, written to jf (same as nonlineardealiased)
+        '''
+
+        size = self.comm.size
+        nx, ny, nyl, nxe, nye, nxel = self.nx, self.ny, self.nyl, self.nxe, self.nye, self.nxel
+        hx, hy = int(nx/2), int(ny/2)
+        kx, ky = self.kx, self.ky
+
+        # streamfunction -wf/k2 scaled for the padded transforms
+        sf = self.sf
+        np.divide(wf, self.k2, out=sf)
+        np.multiply(sf, -self.scale, out=sf)
+        scale = self.scale
+
+        # derivative fields padded along x and transformed along x
+        xe = self.ifft_xe.input_array
+        for src, dst in [(slice(0,hx), slice(0,hx)), (slice(hx,nx), slice(nxe-hx,nxe))]:
+            np.multiply(1.0j*kx[src], sf[src], out=xe[0,dst])
+            np.multiply(1.0j*scale*ky, wf[src], out=xe[1,dst])
+            np.multiply(1.0j*ky, sf[src], out=xe[2,dst])
+            np.multiply(1.0j*scale*kx[src], wf[src], out=xe[3,dst])
+        a = self.ifft_xe()
+
+        # transpose: rows of the padded x grid to the ranks, all columns here
+        self.send4[...] = a.reshape(4,size,nxel,nyl).transpose(1,0,2,3)
+        self.comm.alltoall(self.send4, self.recv4)
+        b = self.recv4.transpose(1,2,0,3).reshape(4,nxel,ny)
+
+        # padded along y and transformed along y to the padded physical grid
+        ye = self.ifft_ye.input_array
+        ye[:,:,0:hy] = b[:,:,0:hy]
+        ye[:,:,nye-hy:] = b[:,:,hy:]
+        j = self.ifft_ye().real
+
+        jacp = self.fft_ye.input_array
+        np.multiply(j[0], j[1], out=self.jq)
+        jacp[...] = self.jq
+        np.multiply(j[2], j[3], out=self.jq)
+        np.subtract(jacp, self.jq, out=jacp)
+
+        # forward along y, truncated to ny modes, transposed back and forward
+        # along x, truncated to nx modes
+        c = self.fft_ye()
+        jt = self.jt
+        jt[:,0:hy] = c[:,0:hy]
+        jt[:,hy:] = c[:,nye-hy:]
+        self.send1[...] = jt.reshape(nxel,size,nyl).transpose(1,0,2)
+        self.comm.alltoall(self.send1, self.recv1)
+
+        e = self.fft_xe(self.recv1.reshape(nxe,nyl))
+        np.multiply(e[0:hx], 1.0/scale, out=jf[0:hx])
+        np.multiply(e[nxe-hx:], 1.0/scale, out=jf[hx:])
+
+        return jf
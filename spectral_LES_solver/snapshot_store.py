@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Chunked, compressed HDF5 store of the output of the spectral solver.
+
+Instead of five text files per output, write_data can append the fields to one
+HDF5 file per run (spectral/data_<nx>_v2/snapshots.h5). Every field is a
+dataset with a time dimension, extended by one snapshot per output:
+
+    jc, jcoarse, sgs : (T,nxc+1,nyc+1) fields on the coarse grid
+    w, s             : (T,nx+1,ny+1) vorticity and streamfunction
+    output, time     : (T,) output number (n/freq) and time of the snapshots
+
+The datasets are split into chunks of one snapshot and at most chunk X chunk
+points, compressed with gzip (and the shuffle filter), so one time slice or a
+sub-box of it is read without reading or decompressing the rest of the run.
+The parameters of the run (input.txt) are stored as attributes of the file.
+
+The file is opened for every output and closed again, so it is complete
+between two outputs and can be read while the run is going on (a file locked
+by a reader or the writer is opened again after a short wait). A snapshot
+with an output number that is already stored (a run restarted from an earlier
+output) replaces it and the snapshots after it.
+
+h5py is optional, it is only imported when the store is used.
+
+"""
+
+import os
+import time as tm
+import numpy as np
+
+try:
+    import h5py
+    available = True
+except ImportError:
+    available = False
+
+fields = ['jc', 'jcoarse', 'sgs', 'w', 's']
+
+#%%
+def check_available():
+    if not available:
+        raise ImportError('the snapshot store needs h5py (pip install h5py)')
+
+#%%
+def open_store(filename, mode='r', wait=30.0):
+
+    '''
+    open the HDF5 file, waiting up to wait seconds while it is locked by
+    another process (the solver appending a snapshot, or a reader)
+    '''
+
+    check_available()
+
+    t0 = tm.time()
+    while True:
+        try:
+            return h5py.File(filename, mode)
+        except BlockingIOError:
+            if tm.time() - t0 > wait:
+                raise
+            tm.sleep(0.05)
+
+#%%
+def write_snapshot(filename, output, time, data, attrs=None, chunk=256, level=4):
+
+    '''
+    append a snapshot to the store, creating the file and its datasets with
+    the first snapshot
+
+    Inputs
+    ------
+    filename : HDF5 file of the store
+    output : output number of the snapshot (n/freq)
+    time : time of the snapshot
+    data : dictionary {name: field} of the fields, e.g. jc, jcoarse, sgs, w, s
+    attrs : dictionary of the parameters of the run, stored as attributes of
+            the file when it is created
+    chunk : maximum number of points of a chunk in x and y direction
+    level : gzip compression level (0-9)
+    '''
+
+    check_available()
+
+    folder = os.path.dirname(filename)
+    if folder and not os.path.exists(folder):
+        os.makedirs(folder)
+
+    with open_store(filename, 'a') as f:
+        if 'output' not in f:
+            f.create_dataset('output', shape=(0,), maxshape=(None,), dtype=np.int64, chunks=(1024,))
+            f.create_dataset('time', shape=(0,), maxshape=(None,), dtype=np.float64, chunks=(1024,))
+            for name, field in data.items():
+                shape = np.shape(field)
+                f.create_dataset(name, shape=(0,)+shape, maxshape=(None,)+shape,
+                                 dtype=np.asarray(field).dtype,
+                                 chunks=(1,)+tuple(min(n, chunk) for n in shape),
+                                 compression='gzip', compression_opts=level, shuffle=True)
+            if attrs is not None:
+                for key, value in attrs.items():
+                    f.attrs[key] = value
+
+        # position of the snapshot, later snapshots of a restarted run are
+        # dropped
+        index = int(np.searchsorted(f['output'][:], output))
+        for name in ['output', 'time'] + list(data):
+            f[name].resize(index+1, axis=0)
+
+        f['output'][index] = output
+        f['time'][index] = time
+        for name, field in data.items():
+            f[name][index] = field
+
+#%%
+def read_index(filename):
+
+    '''
+    return the output numbers and times of the snapshots and the parameters
+    of the run
+
+    Output
+    ------
+    outputs : output numbers (n/freq) of the snapshots (T,)
+    times : times of the snapshots (T,)
+    attrs : dictionary of the attributes of the file
+    '''
+
+    with open_store(filename) as f:
+        outputs = f['output'][:]
+        times = f['time'][:]
+        attrs = dict(f.attrs)
+
+    return outputs, times, attrs
+
+#%%
+def find_snapshot(filename, output=None, time=None):
+
+    '''
+    return the index of the snapshot with the output number output, or of the
+    snapshot closest to time
+    '''
+
+    outputs, times, attrs = read_index(filename)
+    if output is not None:
+        index = np.flatnonzero(outputs == output)
+        if index.size == 0:
+            raise KeyError('output '+str(output)+' is not in '+filename)
+        return int(index[0])
+
+    return int(np.argmin(np.abs(times - time)))
+
+#%%
+def read_snapshot(filename, name, index=-1, box=None):
+
+    '''
+    read a field of one or several snapshots, only the chunks holding the
+    requested points are read
+
+    Inputs
+    ------
+    filename : HDF5 file of the store
+    name : field, one of jc, jcoarse, sgs, w, s
+    index : index of the snapshot (see find_snapshot), or a slice of snapshots
+    box : (slice in x, slice in y) of the sub-box to read (default: all points)
+
+    Output
+    ------
+    field : the field (nx+1,ny+1) or the sub-box, with a leading time axis for
+            a slice of snapshots
+    '''
+
+    if box is None:
+        box = (slice(None), slice(None))
+
+    with open_store(filename) as f:
+        field = f[name][(index,)+tuple(box)]
+
+    return field
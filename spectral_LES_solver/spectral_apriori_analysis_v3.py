@@ -19,7 +19,11 @@ import matplotlib.pyplot as plt
 import time as tm
 import matplotlib.ticker as ticker
 import os
+import sys
 from numba import jit
+from fft_plans import padded_size, set_threads, get_threads
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from snapshot_archive import ArchiveReader
 
 from mpl_toolkits.mplot3d import Axes3D
 import matplotlib.pyplot as plt
@@ -54,7 +58,7 @@ def wave2phy(nx,ny,uf):
     a = pyfftw.empty_aligned((nx,ny),dtype= 'complex128')
     b = pyfftw.empty_aligned((nx,ny),dtype= 'complex128')
     
-    fft_object_inv = pyfftw.FFTW(a, b,axes = (0,1), direction = 'FFTW_BACKWARD')
+    fft_object_inv = pyfftw.FFTW(a, b,axes = (0,1), direction = 'FFTW_BACKWARD', threads = get_threads())
 
     u[0:nx,0:ny] = np.real(fft_object_inv(uf))
     # periodic BC
@@ -82,14 +86,14 @@ def phy2wave(nx,ny,u):
     a = pyfftw.empty_aligned((nx,ny),dtype= 'complex128')
     b = pyfftw.empty_aligned((nx,ny),dtype= 'complex128')
     
-    fft_object = pyfftw.FFTW(a, b, axes = (0,1), direction = 'FFTW_FORWARD')
+    fft_object = pyfftw.FFTW(a, b, axes = (0,1), direction = 'FFTW_FORWARD', threads = get_threads())
 
     uf = np.real(fft_object(u[0:nx,0:ny]))
     
     return uf
 
 #%%
-def nonlineardealiased(nx,ny,w):    
+def nonlineardealiased(nx,ny,w,pad=1.5):    
     
     '''
     compute the Jacobian with 3/2 dealiasing 
@@ -100,6 +104,7 @@ def nonlineardealiased(nx,ny,w):
     kx,ky : wavenumber in x and y direction
     k2 : absolute wave number over 2D domain
     wf : vorticity field in frequency domain (excluding periodic boundaries)
+    pad : padding factor, at least 3/2 for the product to be free of aliasing
     
     Output
     ------
@@ -123,8 +128,8 @@ def nonlineardealiased(nx,ny,w):
     j3f = -1.0j*ky*wf/k2
     j4f = 1.0j*kx*wf
     
-    nxe = int(nx*2)
-    nye = int(ny*2)
+    nxe = padded_size(nx,pad)
+    nye = padded_size(ny,pad)
     
     j1f_padded = np.zeros((nxe,nye),dtype='complex128')
     j2f_padded = np.zeros((nxe,nye),dtype='complex128')
@@ -172,12 +177,12 @@ def nonlineardealiased(nx,ny,w):
     a4 = pyfftw.empty_aligned((nxe,nye),dtype= 'complex128')
     b4 = pyfftw.empty_aligned((nxe,nye),dtype= 'complex128')
     
-    fft_object = pyfftw.FFTW(a, b, axes = (0,1), direction = 'FFTW_FORWARD')
+    fft_object = pyfftw.FFTW(a, b, axes = (0,1), direction = 'FFTW_FORWARD', threads = get_threads())
     
-    fft_object_inv1 = pyfftw.FFTW(a1, b1,axes = (0,1), direction = 'FFTW_BACKWARD')
-    fft_object_inv2 = pyfftw.FFTW(a2, b2,axes = (0,1), direction = 'FFTW_BACKWARD')
-    fft_object_inv3 = pyfftw.FFTW(a3, b3,axes = (0,1), direction = 'FFTW_BACKWARD')
-    fft_object_inv4 = pyfftw.FFTW(a4, b4,axes = (0,1), direction = 'FFTW_BACKWARD')
+    fft_object_inv1 = pyfftw.FFTW(a1, b1,axes = (0,1), direction = 'FFTW_BACKWARD', threads = get_threads())
+    fft_object_inv2 = pyfftw.FFTW(a2, b2,axes = (0,1), direction = 'FFTW_BACKWARD', threads = get_threads())
+    fft_object_inv3 = pyfftw.FFTW(a3, b3,axes = (0,1), direction = 'FFTW_BACKWARD', threads = get_threads())
+    fft_object_inv4 = pyfftw.FFTW(a4, b4,axes = (0,1), direction = 'FFTW_BACKWARD', threads = get_threads())
     
     j1 = np.real(fft_object_inv1(j1f_padded))
     j2 = np.real(fft_object_inv2(j2f_padded))
@@ -1568,6 +1573,10 @@ ich = np.int64(l1[7][0])
 ipr = np.int64(l1[8][0])
 ndc = np.int64(l1[9][0])
 alpha = np.float64(l1[10][0])
+nthreads = np.int64(l1[11][0]) if len(l1) > 11 else 0
+
+# FFTW threads, nthreads = 0 takes PYFFTW_NUM_THREADS from the environment
+set_threads(nthreads)
 
 freq = int(nt/ns)
 
@@ -1600,11 +1609,23 @@ dyc = ly/np.float64(nyc)
 folder = 'data_'+str(nx)
 
 #%%
+# the fields are read from the memory-mapped archive if the solver wrote one
+# (iout = 3, in the output folder data_<nx>_v2 of spectral_solver_DHIT_v2.py),
+# else from the .csv files
+archive = None
+folder_archive = 'data_'+str(nx)+'_v2'
+if os.path.exists("spectral/"+folder_archive+"/archive/index.npy"):
+    archive = ArchiveReader("spectral/"+folder_archive)
+
 for n in range(ns-10,ns+1):
-    file_input = "spectral/"+folder+"/05_streamfunction/s_"+str(n)+".csv"
-    s = np.genfromtxt(file_input, delimiter=',')
-    file_input = "spectral/"+folder+"/04_vorticity/w_"+str(n)+".csv"
-    w = np.genfromtxt(file_input, delimiter=',')
+    if archive is not None:
+        s = archive.get('s', output=n)
+        w = archive.get('w', output=n)
+    else:
+        file_input = "spectral/"+folder+"/05_streamfunction/s_"+str(n)+".csv"
+        s = np.genfromtxt(file_input, delimiter=',')
+        file_input = "spectral/"+folder+"/04_vorticity/w_"+str(n)+".csv"
+        w = np.genfromtxt(file_input, delimiter=',')
     #u,v = compute_velocity(nx,ny,dx,dy,s)
     sx,sy = grad_spectral(nx,ny,s)
     u = sy
@@ -23,6 +23,22 @@ import matplotlib.pyplot as plt
 import time as tm
 import matplotlib.ticker as ticker
 import os
+import atexit
+import resource
+import subprocess
+import sys
+from fft_plans import get_plan, plan_stats, set_threads, get_threads, load_tuning
+from nonlinear_terms import nonlineardealiased, get_nonlinear, set_jit, StepJacobian
+import jit_kernels
+from checkpoint import save_checkpoint, load_checkpoint
+from async_writer import AsyncWriter
+from snapshot_store import write_snapshot, find_snapshot, read_snapshot
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from snapshot_archive import write_archive, ArchiveReader
+from spectrum import shell_spectrum
+from fftw_wisdom import load_wisdom, save_wisdom
+from diagnostics import DiagnosticsRecorder
+from integrators import get_integrator, CFLController
 
 from mpl_toolkits.mplot3d import Axes3D
 from matplotlib import cm
@@ -203,10 +219,7 @@ def decay_ic(nx,ny,dx,dy):
     es = c*(kk**4)*np.exp(-(kk/k0)**2)
     wf[:,:] = np.sqrt((kk*es/np.pi)) * phase[:,:]*(nx*ny)
             
-    a = pyfftw.empty_aligned((nx,ny),dtype= 'complex128')
-    b = pyfftw.empty_aligned((nx,ny),dtype= 'complex128')
-    
-    fft_object_inv = pyfftw.FFTW(a, b,axes = (0,1), direction = 'FFTW_BACKWARD')
+    fft_object_inv = get_plan((nx,ny), 'complex128', 'FFTW_BACKWARD')
     ut = np.real(fft_object_inv(wf)) 
     
     #periodicity
@@ -226,20 +239,23 @@ def wave2phy(nx,ny,uf):
     Inputs
     ------
     nx,ny : number of grid points in x and y direction
-    uf : solution field in frequency domain (excluding periodic boundaries)
+    uf : solution field in frequency domain (excluding periodic boundaries),
+         either the full (nx,ny) or the half (nx,ny/2+1) spectrum
     
     Output
     ------
-    u : solution in physical space (along with periodic boundaries)
+    u : solution in physical space (along with periodic boundaries), in the
+        precision of uf
     '''
     
-    u = np.empty((nx+1,ny+1))
-    a = pyfftw.empty_aligned((nx,ny),dtype= 'complex128')
-    b = pyfftw.empty_aligned((nx,ny),dtype= 'complex128')
+    u = np.empty((nx+1,ny+1), dtype=uf.real.dtype)
     
-    fft_object_inv = pyfftw.FFTW(a, b,axes = (0,1), direction = 'FFTW_BACKWARD')
-
-    u[0:nx,0:ny] = np.real(fft_object_inv(uf))
+    if uf.shape[1] == int(ny/2)+1:
+        fft_object_inv = get_plan((nx,ny), uf.real.dtype, 'FFTW_BACKWARD')
+        u[0:nx,0:ny] = fft_object_inv(uf)
+    else:
+        fft_object_inv = get_plan((nx,ny), uf.dtype, 'FFTW_BACKWARD')
+        u[0:nx,0:ny] = np.real(fft_object_inv(uf))
     # periodic BC
     u[:,ny] = u[:,0]
     u[nx,:] = u[0,:]
@@ -264,48 +280,55 @@ def energy_spectrum(nx,ny,w):
     n : maximum wavenumber
     '''
     
-    epsilon = 1.0e-6
-
-    kx = np.empty(nx)
-    ky = np.empty(ny)
+    # the shell average is done by shell_spectrum from the half spectrum of
+    # the real field
+    fft_object = get_plan((nx,ny), 'float64', 'FFTW_FORWARD')
+    wf = fft_object(w[0:nx,0:ny]) 
     
-    kx[0:int(nx/2)] = 2*np.pi/(np.float64(nx)*dx)*np.float64(np.arange(0,int(nx/2)))
-    kx[int(nx/2):nx] = 2*np.pi/(np.float64(nx)*dx)*np.float64(np.arange(-int(nx/2),0))
+    return shell_spectrum(nx,ny,wf)
 
-    ky[0:ny] = kx[0:ny]
+#%%
+def ensemble_spectrum(nx,ny,wf):
     
-    kx[0] = epsilon
-    ky[0] = epsilon
-
-    kx, ky = np.meshgrid(kx, ky, indexing='ij')
+    '''
+    Computation of the ensemble averaged energy spectrum from the vorticity
+    fields of the members in frequency domain
     
-    a = pyfftw.empty_aligned((nx,ny),dtype= 'complex128')
-    b = pyfftw.empty_aligned((nx,ny),dtype= 'complex128')
-
-    fft_object = pyfftw.FFTW(a, b, axes = (0,1), direction = 'FFTW_FORWARD')
-    wf = fft_object(w[0:nx,0:ny]) 
+    Inputs
+    ------
+    nx,ny : number of grid points in x and y direction
+    wf : vorticity fields of the B members in frequency domain (excluding periodic boundaries),
+         either the full (B,nx,ny) or the half (B,nx,ny/2+1) spectrum
     
-    es =  np.empty((nx,ny))
+    Output
+    ------
+    en : mean of the energy spectra (energy_spectrum) of the members
+    n : maximum wavenumber
+    '''
     
-    kk = np.sqrt(kx[:,:]**2 + ky[:,:]**2)
-    es[:,:] = np.pi*((np.abs(wf[:,:])/(nx*ny))**2)/kk
-    
-    n = int(np.sqrt(nx*nx + ny*ny)/2.0)-1
-    
-    en = np.zeros(n+1)
-    
-    for k in range(1,n+1):
-        en[k] = 0.0
-        ic = 0
-        ii,jj = np.where((kk[1:,1:]>(k-0.5)) & (kk[1:,1:]<(k+0.5)))
-        ic = ii.size
-        ii = ii+1
-        jj = jj+1
-        en[k] = np.sum(es[ii,jj])
-                    
-        en[k] = en[k]/ic
-        
-    return en, n
+    # the shell-averaged spectrum (shell index and np.bincount of spectrum.py)
+    # of every member is computed from a view of the member, without copying it
+    half = wf.shape[-1] == int(ny/2)+1
+    if not half:
+        # spectrum of the real part in physical space (as written by
+        # write_data): (wf(k) + conj(wf(-k)))/2, wf(-k) from the reversed
+        # views of the rows and columns 1,...,n-1 (index (-i)%n)
+        hw = np.empty(wf.shape[-2:], dtype=wf.dtype)
+        blocks = [(np.s_[0:1,0:1], np.s_[0:1,0:1]), (np.s_[0:1,1:], np.s_[0:1,:0:-1]),
+                  (np.s_[1:,0:1], np.s_[:0:-1,0:1]), (np.s_[1:,1:], np.s_[:0:-1,:0:-1])]
+    en = 0.0
+    for m in range(wf.shape[0]):
+        if half:
+            enm, n = shell_spectrum(nx,ny,wf[m])
+        else:
+            for dst, src in blocks:
+                np.conj(wf[m][src], out=hw[dst])
+            np.add(hw, wf[m], out=hw)
+            np.multiply(hw, 0.5, out=hw)
+            enm, n = shell_spectrum(nx,ny,hw)
+        en = en + enm
+    
+    return en/wf.shape[0], n
 
 
 #%%
@@ -320,222 +343,119 @@ def fps(nx,ny,dx,dy,k2,f):
     nx,ny : number of grid points in x and y direction
     dx,dy : grid spacing in x and y direction
     k2 : absolute wavenumber over 2D domain
-    f : right hand side of poisson equation in frequency domain (excluding periodic boundaries)
+    f : right hand side of poisson equation in frequency domain (excluding periodic boundaries),
+        either the full (nx,ny) or the half (nx,ny/2+1) spectrum
     
     Output
     ------
-    u : solution to the Poisson eqution in physical space (including periodic boundaries)
+    u : solution to the Poisson eqution in physical space (including periodic boundaries),
+        in the precision of f
     '''
     
-    u = np.zeros((nx+1,ny+1))
-         
-    a = pyfftw.empty_aligned((nx,ny),dtype= 'complex128')
-    b = pyfftw.empty_aligned((nx,ny),dtype= 'complex128')
-    
-    fft_object_inv = pyfftw.FFTW(a, b,axes = (0,1), direction = 'FFTW_BACKWARD')
+    u = np.zeros((nx+1,ny+1), dtype=f.real.dtype)
        
     # the donominator is based on the scheme used for discrtetizing the Poisson equation
     data1 = f/(-k2)
     
     # compute the inverse fourier transform
-    u[0:nx,0:ny] = np.real(fft_object_inv(data1))
+    if f.shape[1] == int(ny/2)+1:
+        fft_object_inv = get_plan((nx,ny), f.real.dtype, 'FFTW_BACKWARD')
+        u[0:nx,0:ny] = fft_object_inv(data1)
+    else:
+        fft_object_inv = get_plan((nx,ny), f.dtype, 'FFTW_BACKWARD')
+        u[0:nx,0:ny] = np.real(fft_object_inv(data1))
     pbc(nx,ny,u)
     
     return u
 
-
 #%%
-def coarsen(nx,ny,nxc,nyc,uf):  
+def vorticity_streamfunction(nx,ny,k2,wf):
     
     '''
-    coarsen the data along with the size of the data 
+    compute the vorticity and the streamfunction in physical space with one
+    batched inverse transform of wf and wf/k2 (the results of wave2phy and fps)
     
     Inputs
     ------
-    nx,ny : number of grid points in x and y direction on fine grid
-    nxc,nyc : number of grid points in x and y direction on coarse grid
-    uf : solution field on fine grid in frequency domain (excluding periodic boundaries)
+    nx,ny : number of grid points in x and y direction
+    k2 : absolute wavenumber over 2D domain
+    wf : vorticity field in frequency domain (excluding periodic boundaries),
+         either the full (nx,ny) or the half (nx,ny/2+1) spectrum
     
     Output
     ------
-    ufc : caorsened solution in frequency domain (excluding periodic boundaries)
+    w : vorticity in physical space (including periodic boundaries)
+    s : streamfunction in physical space (including periodic boundaries)
     '''
     
-    ufc = np.zeros((nxc,nyc),dtype='complex')
+    if wf.shape[1] == int(ny/2)+1:
+        fft_object_inv = get_plan((2,nx,ny), wf.real.dtype, 'FFTW_BACKWARD')
+    else:
+        fft_object_inv = get_plan((2,nx,ny), wf.dtype, 'FFTW_BACKWARD')
     
-    ufc[0:int(nxc/2),0:int(nyc/2)] = uf[0:int(nxc/2),0:int(nyc/2)]
-    ufc[int(nxc/2):,0:int(nyc/2)] = uf[int(nx-nxc/2):,0:int(nyc/2)]    
-    ufc[0:int(nxc/2),int(nyc/2):] = uf[0:int(nxc/2),int(ny-nyc/2):]
-    ufc[int(nxc/2):,int(nyc/2):] =  uf[int(nx-nxc/2):,int(ny-nyc/2):] 
+    data = fft_object_inv.input_array
+    data[0] = wf
+    np.divide(wf, k2, out=data[1])
+    ws = fft_object_inv()
     
-    ufc = ufc*(nxc*nyc)/(nx*ny)
+    w = np.empty((nx+1,ny+1), dtype=wf.real.dtype)
+    s = np.empty((nx+1,ny+1), dtype=wf.real.dtype)
+    w[0:nx,0:ny] = np.real(ws[0])
+    s[0:nx,0:ny] = np.real(ws[1])
+    pbc(nx,ny,w)
+    pbc(nx,ny,s)
     
-    return ufc
+    return w, s
 
-       
-#%%
-def nonlineardealiased(nx,ny,kx,ky,k2,wf):    
-    
-    '''
-    compute the Jacobian with 3/2 dealiasing 
-    
-    Inputs
-    ------
-    nx,ny : number of grid points in x and y direction on fine grid
-    kx,ky : wavenumber in x and y direction
-    k2 : absolute wave number over 2D domain
-    wf : vorticity field in frequency domain (excluding periodic boundaries)
-    
-    Output
-    ------
-    jf : jacobian in frequency domain (excluding periodic boundaries)
-         (d(psi)/dy*d(omega)/dx - d(psi)/dx*d(omega)/dy)
-    '''
-    
-    j1f = -1.0j*kx*wf/k2
-    j2f = 1.0j*ky*wf
-    j3f = -1.0j*ky*wf/k2
-    j4f = 1.0j*kx*wf
-    
-    nxe = int(nx*2)
-    nye = int(ny*2)
-    
-    j1f_padded = np.zeros((nxe,nye),dtype='complex128')
-    j2f_padded = np.zeros((nxe,nye),dtype='complex128')
-    j3f_padded = np.zeros((nxe,nye),dtype='complex128')
-    j4f_padded = np.zeros((nxe,nye),dtype='complex128')
-    
-    j1f_padded[0:int(nx/2),0:int(ny/2)] = j1f[0:int(nx/2),0:int(ny/2)]
-    j1f_padded[int(nxe-nx/2):,0:int(ny/2)] = j1f[int(nx/2):,0:int(ny/2)]    
-    j1f_padded[0:int(nx/2),int(nye-ny/2):] = j1f[0:int(nx/2),int(ny/2):]    
-    j1f_padded[int(nxe-nx/2):,int(nye-ny/2):] =  j1f[int(nx/2):,int(ny/2):] 
-    
-    j2f_padded[0:int(nx/2),0:int(ny/2)] = j2f[0:int(nx/2),0:int(ny/2)]
-    j2f_padded[int(nxe-nx/2):,0:int(ny/2)] = j2f[int(nx/2):,0:int(ny/2)]    
-    j2f_padded[0:int(nx/2),int(nye-ny/2):] = j2f[0:int(nx/2),int(ny/2):]    
-    j2f_padded[int(nxe-nx/2):,int(nye-ny/2):] =  j2f[int(nx/2):,int(ny/2):] 
-    
-    j3f_padded[0:int(nx/2),0:int(ny/2)] = j3f[0:int(nx/2),0:int(ny/2)]
-    j3f_padded[int(nxe-nx/2):,0:int(ny/2)] = j3f[int(nx/2):,0:int(ny/2)]    
-    j3f_padded[0:int(nx/2),int(nye-ny/2):] = j3f[0:int(nx/2),int(ny/2):]    
-    j3f_padded[int(nxe-nx/2):,int(nye-ny/2):] =  j3f[int(nx/2):,int(ny/2):] 
-    
-    j4f_padded[0:int(nx/2),0:int(ny/2)] = j4f[0:int(nx/2),0:int(ny/2)]
-    j4f_padded[int(nxe-nx/2):,0:int(ny/2)] = j4f[int(nx/2):,0:int(ny/2)]    
-    j4f_padded[0:int(nx/2),int(nye-ny/2):] = j4f[0:int(nx/2),int(ny/2):]    
-    j4f_padded[int(nxe-nx/2):,int(nye-ny/2):] =  j4f[int(nx/2):,int(ny/2):] 
-    
-    j1f_padded = j1f_padded*(nxe*nye)/(nx*ny)
-    j2f_padded = j2f_padded*(nxe*nye)/(nx*ny)
-    j3f_padded = j3f_padded*(nxe*nye)/(nx*ny)
-    j4f_padded = j4f_padded*(nxe*nye)/(nx*ny)
-    
-    
-    a = pyfftw.empty_aligned((nxe,nye),dtype= 'complex128')
-    b = pyfftw.empty_aligned((nxe,nye),dtype= 'complex128')
-    
-    a1 = pyfftw.empty_aligned((nxe,nye),dtype= 'complex128')
-    b1 = pyfftw.empty_aligned((nxe,nye),dtype= 'complex128')
-    
-    a2 = pyfftw.empty_aligned((nxe,nye),dtype= 'complex128')
-    b2 = pyfftw.empty_aligned((nxe,nye),dtype= 'complex128')
-    
-    a3 = pyfftw.empty_aligned((nxe,nye),dtype= 'complex128')
-    b3 = pyfftw.empty_aligned((nxe,nye),dtype= 'complex128')
-    
-    a4 = pyfftw.empty_aligned((nxe,nye),dtype= 'complex128')
-    b4 = pyfftw.empty_aligned((nxe,nye),dtype= 'complex128')
-    
-    fft_object = pyfftw.FFTW(a, b, axes = (0,1), direction = 'FFTW_FORWARD')
-    
-    fft_object_inv1 = pyfftw.FFTW(a1, b1,axes = (0,1), direction = 'FFTW_BACKWARD')
-    fft_object_inv2 = pyfftw.FFTW(a2, b2,axes = (0,1), direction = 'FFTW_BACKWARD')
-    fft_object_inv3 = pyfftw.FFTW(a3, b3,axes = (0,1), direction = 'FFTW_BACKWARD')
-    fft_object_inv4 = pyfftw.FFTW(a4, b4,axes = (0,1), direction = 'FFTW_BACKWARD')
-    
-    j1 = np.real(fft_object_inv1(j1f_padded))
-    j2 = np.real(fft_object_inv2(j2f_padded))
-    j3 = np.real(fft_object_inv3(j3f_padded))
-    j4 = np.real(fft_object_inv4(j4f_padded))
-    
-    jacp = j1*j2 - j3*j4
-    
-    jacpf = fft_object(jacp)
-    
-    jf = np.zeros((nx,ny),dtype='complex128')
-    
-    jf[0:int(nx/2),0:int(ny/2)] = jacpf[0:int(nx/2),0:int(ny/2)]
-    jf[int(nx/2):,0:int(ny/2)] = jacpf[int(nxe-nx/2):,0:int(ny/2)]    
-    jf[0:int(nx/2),int(ny/2):] = jacpf[0:int(nx/2),int(nye-ny/2):]    
-    jf[int(nx/2):,int(ny/2):] =  jacpf[int(nxe-nx/2):,int(nye-ny/2):]
-    
-    jf = jf*(nx*ny)/(nxe*nye)
-    
-    return jf
 
 #%%
-def nonlinear(nx,ny,kx,ky,k2,wf):  
+def coarsen(nx,ny,nxc,nyc,uf):  
     
     '''
-    compute the Jacobian without dealiasing 
+    coarsen the data along with the size of the data 
     
     Inputs
     ------
     nx,ny : number of grid points in x and y direction on fine grid
-    kx,ky : wavenumber in x and y direction
-    k2 : absolute wave number over 2D domain
-    wf : vorticity field in frequency domain (excluding periodic boundaries)
+    nxc,nyc : number of grid points in x and y direction on coarse grid
+    uf : solution field on fine grid in frequency domain (excluding periodic boundaries),
+         either the full (nx,ny) or the half (nx,ny/2+1) spectrum
     
     Output
     ------
-    jf : jacobian in frequency domain (excluding periodic boundaries)
-         (d(psi)/dy*d(omega)/dx - d(psi)/dx*d(omega)/dy)
+    ufc : caorsened solution in frequency domain (excluding periodic boundaries),
+          the full (nxc,nyc) spectrum for both layouts of uf, so that the
+          Nyquist modes kx = -nxc/2 and ky = -nyc/2 of the coarse grid are
+          kept the same way
     '''
     
-    j1f = 1.0j*kx*wf/k2
-    j2f = 1.0j*ky*wf
-    j3f = 1.0j*ky*wf/k2
-    j4f = 1.0j*kx*wf
-    
-    a = pyfftw.empty_aligned((nx,ny),dtype= 'complex128')
-    b = pyfftw.empty_aligned((nx,ny),dtype= 'complex128')
-    
-    a1 = pyfftw.empty_aligned((nx,ny),dtype= 'complex128')
-    b1 = pyfftw.empty_aligned((nx,ny),dtype= 'complex128')
-    
-    a2 = pyfftw.empty_aligned((nx,ny),dtype= 'complex128')
-    b2 = pyfftw.empty_aligned((nx,ny),dtype= 'complex128')
-    
-    a3 = pyfftw.empty_aligned((nx,ny),dtype= 'complex128')
-    b3 = pyfftw.empty_aligned((nx,ny),dtype= 'complex128')
-    
-    a4 = pyfftw.empty_aligned((nx,ny),dtype= 'complex128')
-    b4 = pyfftw.empty_aligned((nx,ny),dtype= 'complex128')
+    ufc = np.zeros((nxc,nyc),dtype=uf.dtype)
     
-    fft_object = pyfftw.FFTW(a, b, axes = (0,1), direction = 'FFTW_FORWARD')
-    
-    fft_object_inv1 = pyfftw.FFTW(a1, b1,axes = (0,1), direction = 'FFTW_BACKWARD')
-    fft_object_inv2 = pyfftw.FFTW(a2, b2,axes = (0,1), direction = 'FFTW_BACKWARD')
-    fft_object_inv3 = pyfftw.FFTW(a3, b3,axes = (0,1), direction = 'FFTW_BACKWARD')
-    fft_object_inv4 = pyfftw.FFTW(a4, b4,axes = (0,1), direction = 'FFTW_BACKWARD')
-    
-    j1 = np.real(fft_object_inv1(j1f))
-    j2 = np.real(fft_object_inv2(j2f))
-    j3 = np.real(fft_object_inv3(j3f))
-    j4 = np.real(fft_object_inv4(j4f))
-    
-    jac = j1*j2 - j3*j4
+    ufc[0:int(nxc/2),0:int(nyc/2)] = uf[0:int(nxc/2),0:int(nyc/2)]
+    ufc[int(nxc/2):,0:int(nyc/2)] = uf[int(nx-nxc/2):,0:int(nyc/2)]
+    if uf.shape[1] == int(ny/2)+1:
+        # modes ky < 0 from the symmetry uf(kx,ky) = conj(uf(-kx,-ky)) of the
+        # half spectrum of a real field
+        kxc = np.fft.fftfreq(nxc,1/nxc).astype(np.int64)
+        ix = (-kxc)%nx
+        iy = nyc - np.arange(int(nyc/2),nyc)
+        ufc[:,int(nyc/2):] = np.conj(uf[ix][:,iy])
+    else:
+        ufc[0:int(nxc/2),int(nyc/2):] = uf[0:int(nxc/2),int(ny-nyc/2):]
+        ufc[int(nxc/2):,int(nyc/2):] =  uf[int(nx-nxc/2):,int(ny-nyc/2):] 
     
-    jf = fft_object(jac)
+    ufc = ufc*(nxc*nyc)/(nx*ny)
     
-    return jf
-
+    return ufc
 
+       
 #%% coarsening
-def write_data(nx,ny,dx,dy,kx,ky,k2,nxc,nyc,dxc,dyc,wf,w0,n,freq,dt):
+def write_data(nx,ny,dx,dy,kx,ky,k2,nxc,nyc,dxc,dyc,wf,n,freq,dt,jacobian=nonlineardealiased,
+               folder=None,iout=0,attrs=None,jf=None):
     
     '''
-    write the data to .csv files for post-processing
+    write the data to .csv files, the snapshot store or the archive for
+    post-processing
     
     Inputs
     ------
@@ -545,9 +465,23 @@ def write_data(nx,ny,dx,dy,kx,ky,k2,nxc,nyc,dxc,dyc,wf,w0,n,freq,dt):
     k2 : absolute wave number over 2D domain
     nxc,nyc : number of grid points in x and y direction on caorse grid
     dxc,dyc : grid spacing in x and y direction for coarse grid
-    wf : vorticity field in frequency domain (excluding periodic boundaries)
+    wf : vorticity field in frequency domain (excluding periodic boundaries),
+         either the full (nx,ny) or the half (nx,ny/2+1) spectrum, or the
+         fields (B,nx,ny) of an ensemble
     n : time step
     freq : frequency at which to write the data
+    jacobian : function computing the Jacobian in frequency domain (see get_nonlinear)
+               of the output terms, the padded Jacobian (idealias = 2) whatever
+               the dealiasing of the time loop
+    folder : output folder in spectral/ (default: data_<nx>_v2), member m of an
+             ensemble is written to <folder>_m<m> and the ensemble averaged
+             energy spectrum to <folder>_ensemble
+    iout : [0] .csv files, [1] snapshot store <folder>/snapshots.h5, [2] both,
+           [3] memory-mapped archive <folder>/archive
+    attrs : parameters of the run (config), stored with the snapshot store
+    jf : Jacobian of wf in frequency domain computed by jacobian if it is
+         already computed (the first stage of the next time step with
+         idealias = 2, see StepJacobian)
     
     Output/ write
     ------
@@ -558,67 +492,78 @@ def write_data(nx,ny,dx,dy,kx,ky,k2,nxc,nyc,dxc,dyc,wf,w0,n,freq,dt):
     s : streamfunction in physical space for fine grid (including periodic boundaries) 
     '''
     
-    s = fps(nx,ny,dx,dy,k2,-wf)
-    w = wave2phy(nx,ny,wf)
+    if folder is None:
+        folder = 'data_'+str(nx) + '_v2'
+    
+    if wf.ndim == 3:
+        for m in range(wf.shape[0]):
+            # Reynolds number of the member
+            attrs_member = attrs
+            if attrs is not None and attrs['rens'][0] > 0.0:
+                attrs_member = dict(attrs, re=attrs['rens'][m])
+            write_data(nx,ny,dx,dy,kx,ky,k2,nxc,nyc,dxc,dyc,wf[m],n,freq,dt,jacobian,
+                       folder+'_m'+str(m),iout,attrs_member,None if jf is None else jf[m])
+        
+        en, nk = ensemble_spectrum(nx,ny,wf)
+        if not os.path.exists("spectral/"+folder+"_ensemble"):
+            os.makedirs("spectral/"+folder+"_ensemble")
+        filename = "spectral/"+folder+"_ensemble/energy_"+str(int(n/freq))+".csv"
+        np.savetxt(filename, en, delimiter=",")
+        return
+    
+    w, s = vorticity_streamfunction(nx,ny,k2,wf)
    
+    # the coarse fields are in the full spectrum for both layouts (coarsen)
     kxc = np.fft.fftfreq(nxc,1/nxc)
     kyc = np.fft.fftfreq(nyc,1/nyc)
-    kxc = kxc.reshape(nxc,1)
-    kyc = kyc.reshape(1,nyc)
+    kxc = kxc.reshape(nxc,1).astype(kx.dtype)
+    kyc = kyc.reshape(1,nyc).astype(ky.dtype)
     
     k2c = kxc*kxc + kyc*kyc
     k2c[0,0] = 1.0e-12
      
-    jf = nonlineardealiased(nx,ny,kx,ky,k2,wf)
-    j = wave2phy(nx,ny,jf) # jacobian for fine solution field
+    if jf is None:
+        jf = jacobian(nx,ny,kx,ky,k2,wf) # jacobian for fine solution field
 
     jc = np.zeros((nxc+1,nyc+1)) # coarsened(jacobian field)
     jfc = coarsen(nx,ny,nxc,nyc,jf) # coarsened(jacobian field) in frequency domain
     jc = wave2phy(nxc,nyc,jfc) # coarsened(jacobian field) physical space
        
     wfc = coarsen(nx,ny,nxc,nyc,wf)       
-    jcoarsef = nonlineardealiased(nxc,nyc,kxc,kyc,k2c,wfc) # jacobian(coarsened solution field) in frequency domain
+    jcoarsef = jacobian(nxc,nyc,kxc,kyc,k2c,wfc) # jacobian(coarsened solution field) in frequency domain
     jcoarse = wave2phy(nxc,nyc,jcoarsef) # jacobian(coarsened solution field) physical space
     
     sgs = jc - jcoarse
     
-    folder = 'data_'+str(nx) + '_v2'
-    if not os.path.exists("spectral/"+folder):
-        os.makedirs("spectral/"+folder)
-        os.makedirs("spectral/"+folder+"/01_coarsened_jacobian_field")
-        os.makedirs("spectral/"+folder+"/02_jacobian_coarsened_field")
-        os.makedirs("spectral/"+folder+"/03_subgrid_scale_term")
-        os.makedirs("spectral/"+folder+"/04_vorticity")
-        os.makedirs("spectral/"+folder+"/05_streamfunction")
-    
-    filename = "spectral/"+folder+"/01_coarsened_jacobian_field/J_fourier_"+str(int(n/freq))+".csv"
-    np.savetxt(filename, jc, delimiter=",")    
-    filename = "spectral/"+folder+"/02_jacobian_coarsened_field/J_coarsen_"+str(int(n/freq))+".csv"
-    np.savetxt(filename, jcoarse, delimiter=",")
-    filename = "spectral/"+folder+"/03_subgrid_scale_term/sgs_"+str(int(n/freq))+".csv"
-    np.savetxt(filename, sgs, delimiter=",")
-    filename = "spectral/"+folder+"/04_vorticity/w_"+str(int(n/freq))+".csv"
-    np.savetxt(filename, w, delimiter=",")
-    filename = "spectral/"+folder+"/05_streamfunction/s_"+str(int(n/freq))+".csv"
-    np.savetxt(filename, s, delimiter=",")
-    
-    if n%(50*freq) == 0:
-        fig, axs = plt.subplots(1,2,sharey=True,figsize=(9,5))
-
-        cs = axs[0].contourf(w0.T, 120, cmap = 'jet', interpolation='bilinear')
-        axs[0].text(0.4, -0.1, '$t = 0.0$', transform=axs[0].transAxes, fontsize=16, fontweight='bold', va='top')
-        
-        cs = axs[1].contourf(w.T, 120, cmap = 'jet', interpolation='bilinear')
-        axs[1].text(0.4, -0.1, '$t = '+str(dt*n)+'$', transform=axs[1].transAxes, fontsize=16, fontweight='bold', va='top')
-        
-        fig.tight_layout() 
-        fig.subplots_adjust(bottom=0.15)
+    # single precision fields are written with the digits float32 resolves
+    fmt = '%.8e' if w.dtype == np.float32 else '%.18e'
+    
+    if iout == 0 or iout == 2:
+        if not os.path.exists("spectral/"+folder+"/01_coarsened_jacobian_field"):
+            os.makedirs("spectral/"+folder+"/01_coarsened_jacobian_field")
+            os.makedirs("spectral/"+folder+"/02_jacobian_coarsened_field")
+            os.makedirs("spectral/"+folder+"/03_subgrid_scale_term")
+            os.makedirs("spectral/"+folder+"/04_vorticity")
+            os.makedirs("spectral/"+folder+"/05_streamfunction")
         
-        cbar_ax = fig.add_axes([0.22, -0.05, 0.6, 0.04])
-        fig.colorbar(cs, cax=cbar_ax, orientation='horizontal')
-            
-        filename = "spectral/"+folder+"/field_spectral_"+str(int(n/freq))+".png"
-        fig.savefig(filename, bbox_inches = 'tight')
+        filename = "spectral/"+folder+"/01_coarsened_jacobian_field/J_fourier_"+str(int(n/freq))+".csv"
+        np.savetxt(filename, jc, delimiter=",", fmt=fmt)    
+        filename = "spectral/"+folder+"/02_jacobian_coarsened_field/J_coarsen_"+str(int(n/freq))+".csv"
+        np.savetxt(filename, jcoarse, delimiter=",", fmt=fmt)
+        filename = "spectral/"+folder+"/03_subgrid_scale_term/sgs_"+str(int(n/freq))+".csv"
+        np.savetxt(filename, sgs, delimiter=",", fmt=fmt)
+        filename = "spectral/"+folder+"/04_vorticity/w_"+str(int(n/freq))+".csv"
+        np.savetxt(filename, w, delimiter=",", fmt=fmt)
+        filename = "spectral/"+folder+"/05_streamfunction/s_"+str(int(n/freq))+".csv"
+        np.savetxt(filename, s, delimiter=",", fmt=fmt)
+    
+    if iout == 1 or iout == 2:
+        filename = "spectral/"+folder+"/snapshots.h5"
+        write_snapshot(filename, int(n/freq), dt*n,
+                       {'jc': jc, 'jcoarse': jcoarse, 'sgs': sgs, 'w': w, 's': s}, attrs)
+    elif iout == 3:
+        write_archive("spectral/"+folder, int(n/freq), n, dt*n, attrs['re'],
+                      {'jc': jc, 'jcoarse': jcoarse, 'sgs': sgs, 'w': w, 's': s}, attrs['ns'])
     
     
 #%% 
@@ -640,6 +585,62 @@ ipr = np.int64(l1[8][0])
 ndc = np.int64(l1[9][0])
 ichkp = np.int64(l1[10][0])
 istart = np.int64(l1[11][0])
+irfft = np.int64(l1[12][0]) if len(l1) > 12 else 0
+pad = np.float64(l1[13][0]) if len(l1) > 13 else 1.5
+idealias = np.int64(l1[14][0]) if len(l1) > 14 else 2
+nthreads = np.int64(l1[15][0]) if len(l1) > 15 else 0
+precision = np.int64(l1[16][0]) if len(l1) > 16 else 0
+icfl = np.int64(l1[17][0]) if len(l1) > 17 else 0
+cfl = np.float64(l1[18][0]) if len(l1) > 18 else 0.5
+ncfl = np.int64(l1[19][0]) if len(l1) > 19 else 1
+itint = np.int64(l1[20][0]) if len(l1) > 20 else 0
+nens = np.int64(l1[21][0]) if len(l1) > 21 else 1
+rens = np.array(l1[22][0].split(','), dtype=np.float64) if len(l1) > 22 else np.zeros(1)
+iseed = np.int64(l1[23][0]) if len(l1) > 23 else 1
+ijit = np.int64(l1[24][0]) if len(l1) > 24 else 1
+nchkp = np.int64(l1[25][0]) if len(l1) > 25 else 0
+nasync = np.int64(l1[26][0]) if len(l1) > 26 else 0
+iout = np.int64(l1[27][0]) if len(l1) > 27 else 0
+irender = np.int64(l1[28][0]) if len(l1) > 28 else 50
+ndiag = np.int64(l1[29][0]) if len(l1) > 29 else 10
+mdiag = np.int64(l1[30][0]) if len(l1) > 30 else 50
+idiag = np.int64(l1[31][0]) if len(l1) > 31 else 0
+
+# seed of the random initial field of the decay problem
+seed(iseed)
+
+# Reynolds numbers of the members of an ensemble (rens = 0: all members at re)
+# as an array (nens,1,1) that broadcasts with the (nens,nx,ny) fields
+if nens > 1 and rens[0] > 0.0:
+    if rens.size != nens:
+        raise ValueError('rens needs one Reynolds number per member: '+str(nens))
+    re_member = rens.reshape(nens,1,1)
+else:
+    re_member = re
+
+# [0] double precision, [1] single precision for fields, plans and output,
+# [2] mixed precision: Jacobian in single, time integration and output in double
+jacobian_dtype = None
+if precision == 1:
+    real_dtype, complex_dtype = 'float32', 'complex64'
+else:
+    real_dtype, complex_dtype = 'float64', 'complex128'
+    if precision == 2:
+        jacobian_dtype = 'float32'
+
+# FFTW threads, nthreads = 0 takes PYFFTW_NUM_THREADS from the environment
+set_threads(nthreads)
+
+# fused Numba kernels of the dealiased Jacobian (NumPy if Numba is not
+# installed), with as many threads as FFTW
+set_jit(ijit == 1)
+jit_kernels.set_threads(get_threads())
+
+# FFTW wisdom and the backend/planner effort chosen by tune_fft.py, the wisdom
+# is saved again at exit so that new plans are remembered for the next run
+load_wisdom()
+load_tuning()
+atexit.register(save_wisdom)
 
 freq = int(nt/ns)
 
@@ -664,97 +665,289 @@ dxc = lx/np.float64(nxc)
 dyc = ly/np.float64(nyc)
 
 ifile = 0
-time = ichkp*freq*istart*dt
-folder = 'data_'+str(nx)
+folder = 'data_'+str(nx)+'_v2'
+
+# ichkp = 1 restarts from the vorticity written at output istart (from the
+# snapshot store with iout = 1, the archive with iout = 3), ichkp = 2
+# from the binary checkpoint written every nchkp time steps
+nstart = int(istart*freq) if ichkp == 1 else 0
+time = nstart*dt
+file_checkpoint = "spectral/"+folder+"/checkpoint.npz"
+
+# parameters stored with the checkpoint and the snapshot store
+config = {'nd': int(nd), 'nt': int(nt), 're': float(re), 'dt': float(dt), 'ns': int(ns),
+          'ndc': int(ndc), 'ipr': int(ipr), 'irfft': int(irfft), 'pad': float(pad),
+          'idealias': int(idealias), 'precision': int(precision), 'icfl': int(icfl),
+          'cfl': float(cfl), 'ncfl': int(ncfl), 'itint': int(itint), 'nens': int(nens),
+          'rens': rens.tolist(), 'iseed': int(iseed)}
 
 #%%
-# set the initial condition based on the problem selected
-if (ipr == 1):
-    w0 = tgv_ic(nx,ny) # taylor-green vortex problem
-elif (ipr == 2):
-    w0 = vm_ic(nx,ny) # vortex-merger problem
-elif (ipr == 3):
-    w0 = decay_ic(nx,ny,dx,dy) # decaying homegeneous isotropic turbulence problem
+# set the initial condition based on the problem selected, the members of an
+# ensemble (nens > 1) are held in one (nens,nx+1,ny+1) array, for the decay
+# problem they are successive realizations of the random field, the first one
+# being the field of a single run
+w0 = np.empty((nens,nx+1,ny+1))
+for m in range(nens):
+    if (ipr == 1):
+        w0[m] = tgv_ic(nx,ny) # taylor-green vortex problem
+    elif (ipr == 2):
+        w0[m] = vm_ic(nx,ny) # vortex-merger problem
+    elif (ipr == 3):
+        w0[m] = decay_ic(nx,ny,dx,dy) # decaying homegeneous isotropic turbulence problem
+if nens == 1:
+    w0 = w0[0]
 
 #%%  
-if ichkp == 0:
+if ichkp == 0 or ichkp == 2:
     w = np.copy(w0)
 elif ichkp == 1:
     print(istart)
-    file_input = "spectral/"+folder+"/04_vorticity/w_"+str(istart)+".csv"
-    w = np.genfromtxt(file_input, delimiter=',')
+    if nens == 1 and iout == 1:
+        file_input = "spectral/"+folder+"/snapshots.h5"
+        w = read_snapshot(file_input, 'w', find_snapshot(file_input, output=istart)).astype(real_dtype)
+    elif nens == 1 and iout == 3:
+        w = ArchiveReader("spectral/"+folder).get('w', output=istart).astype(real_dtype)
+    elif nens == 1:
+        file_input = "spectral/"+folder+"/04_vorticity/w_"+str(istart)+".csv"
+        w = np.genfromtxt(file_input, delimiter=',').astype(real_dtype)
+    else:
+        w = np.empty((nens,nx+1,ny+1), dtype=real_dtype)
+        for m in range(nens):
+            if iout == 1:
+                file_input = "spectral/"+folder+"_m"+str(m)+"/snapshots.h5"
+                w[m] = read_snapshot(file_input, 'w', find_snapshot(file_input, output=istart))
+            elif iout == 3:
+                w[m] = ArchiveReader("spectral/"+folder+"_m"+str(m)).get('w', output=istart)
+            else:
+                file_input = "spectral/"+folder+"_m"+str(m)+"/04_vorticity/w_"+str(istart)+".csv"
+                w[m] = np.genfromtxt(file_input, delimiter=',')
     
 #%%
 # compute frequencies, vorticity field in frequency domain
+# with irfft = 1 only the half spectrum (nx,ny/2+1) of the real field is stored,
+# the members of an ensemble are transformed by one plan batched over the
+# leading axis
 kx = np.fft.fftfreq(nx,1/nx)
-ky = np.fft.fftfreq(ny,1/ny)
-
-kx = kx.reshape(nx,1)
-ky = ky.reshape(1,ny)
-    
-data = np.empty((nx,ny), dtype='complex128')
-
-data = np.vectorize(complex)(w[0:nx,0:ny],0.0)
-
-a = pyfftw.empty_aligned((nx,ny),dtype= 'complex128')
-b = pyfftw.empty_aligned((nx,ny),dtype= 'complex128')
-
-fft_object = pyfftw.FFTW(a, b, axes = (0,1), direction = 'FFTW_FORWARD')
-
-wnf = fft_object(data) # fourier space forward
+if irfft == 1:
+    ky = np.fft.rfftfreq(ny,1/ny)
+else:
+    ky = np.fft.fftfreq(ny,1/ny)
+
+kx = kx.reshape(nx,1).astype(real_dtype)
+ky = ky.reshape(1,ky.size).astype(real_dtype)
+
+if irfft == 1:
+    fft_object = get_plan(w.shape[:-2]+(nx,ny), real_dtype, 'FFTW_FORWARD')
+    
+    wnf = np.copy(fft_object(w[...,0:nx,0:ny])) # fourier space forward
+else:
+    data = np.empty((nx,ny), dtype='complex128')
+    
+    data = np.vectorize(complex)(w[...,0:nx,0:ny],0.0)
+    
+    fft_object = get_plan(w.shape[:-2]+(nx,ny), complex_dtype, 'FFTW_FORWARD')
+    
+    wnf = np.copy(fft_object(data)) # fourier space forward
+
+if ichkp == 2:
+    # exact restart: the spectral field and the state of the time loop are
+    # taken as they were written
+    wnf_checkpoint, state, config_checkpoint, rng = load_checkpoint(file_checkpoint)
+    if wnf_checkpoint.shape != wnf.shape or wnf_checkpoint.dtype != wnf.dtype:
+        raise ValueError('the checkpoint does not match the grid, spectrum layout, precision '
+                         'or ensemble of input.txt')
+    # the parameters of the trajectory have to be those of the run that wrote
+    # the checkpoint, nt and ns may only change with the same output interval
+    if config_checkpoint.get('icfl') != config['icfl']:
+        raise ValueError('the checkpoint was written with icfl = '+str(config_checkpoint.get('icfl'))+
+                         ', it cannot be restarted with icfl = '+str(config['icfl']))
+    keys = ['nd', 're', 'dt', 'ipr', 'irfft', 'pad', 'idealias', 'precision', 'itint', 'nens', 'rens']
+    if icfl == 1:
+        keys += ['cfl', 'ncfl']
+    changed = [key for key in keys if config_checkpoint.get(key) != config[key]]
+    if int(config_checkpoint['nt']/config_checkpoint['ns']) != freq:
+        changed.append('nt/ns')
+    if changed:
+        raise ValueError('the checkpoint was written with other '+', '.join(changed)+
+                         ' than input.txt')
+    wnf[...] = wnf_checkpoint
+    np.random.set_state(rng)
+    nstart = state['step']
+    time = state['time']
+    print('restart from the checkpoint at step ', nstart, ' time ', time)
 
 #%%
 # initialize variables for time integration
-a1, a2, a3 = 8.0/15.0, 2.0/15.0, 1.0/3.0
-g1, g2, g3 = 8.0/15.0, 5.0/12.0, 3.0/4.0
-r2, r3 = -17.0/60.0, -5.0/12.0
-
 k2 = kx*kx + ky*ky
 k2[0,0] = 1.0e-12
 
-z = 0.5*dt*k2/re
-d1 = a1*z
-d2 = a2*z
-d3 = a3*z
-
-w1f = np.empty((nx,ny), dtype='complex128')
-w2f = np.empty((nx,ny), dtype='complex128')
+# Jacobian with the dealiasing strategy selected in input.txt for the time
+# loop, the output terms of write_data keep the padded Jacobian, so that the
+# LES data does not depend on idealias (the Jacobian of the time loop is
+# shared with the output for idealias = 2 only)
+jacobian = get_nonlinear(idealias,pad,jacobian_dtype)
+rhs = lambda wf,jf: jacobian(nx,ny,kx,ky,k2,wf,jf)
+jacobian_output = jacobian if idealias == 2 else get_nonlinear(2,pad,jacobian_dtype)
+
+# time integrator selected in input.txt, its factor and stage arrays are
+# allocated once, all members of an ensemble are advanced together
+integrator = get_integrator(itint,k2,re_member,dt,wnf.dtype,wnf.shape)
+
+# the Jacobian of the state wnf is kept until the next time step, so that the
+# output and the first stage of the next step share it
+step_jacobian = StepJacobian(rhs,wnf,integrator.jnf,nstart)
+
+# plans and scratch arrays of the Jacobian are created by the first call
+step_jacobian(wnf,integrator.jnf)
+
+# peak resident memory in MB (ru_maxrss is in kB on Linux)
+rss_init = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024.0
+
+# with nasync > 0 write_data runs in a background thread, the time loop hands
+# it a copy of wnf through a queue of nasync outputs
+if nasync > 0:
+    writer = AsyncWriter(write_data, nasync)
+    output = writer.submit
+else:
+    output = write_data
+
+# the frames of every irender-th output are drawn from the output of
+# write_data by render_frames.py in a background process (member 0 of an
+# ensemble), so that the time loop does not wait for matplotlib
+if irender > 0:
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)),'render_frames.py')
+    renderer = subprocess.Popen([sys.executable, script, "spectral/"+folder+("_m0" if nens > 1 else ""),
+                                 '--every', str(irender), '--tout', str(freq*dt),
+                                 '--follow', str(os.getpid()), '--ns', str(ns), '--poll', '1'])
+
+# energy, enstrophy, palinstrophy and dissipation rate every ndiag time steps,
+# the maximum vorticity and CFL number every mdiag time steps, written at the
+# outputs to diagnostics.csv (idiag = 0) or diagnostics.bin (idiag = 1)
+if ndiag > 0:
+    diagnostics = DiagnosticsRecorder("spectral/"+folder+("_ensemble" if nens > 1 else "")+
+                                      "/diagnostics"+(".bin" if idiag == 1 else ".csv"),
+                                      nx,ny,dx,dy,kx,ky,re_member,wnf.dtype,wnf.shape,mdiag,
+                                      start=time if ichkp > 0 else None)
 
 #%%
 clock_time_init = tm.time()
+if ndiag > 0:
+    diagnostics.record(nstart,time,dt,wnf)
 # time integration using hybrid third-order Runge-Kutta implicit Crank-Nicolson scheme
-# refer to Orlandi: Fluid flow phenomenon
-for n in range(int(ichkp*istart*freq)+1,nt+1):
-    time = time + dt
-    # 1st step
-    jnf = nonlineardealiased(nx,ny,kx,ky,k2,wnf)    
-    w1f[:,:] = ((1.0 - d1)/(1.0 + d1))*wnf[:,:] + (g1*dt*jnf[:,:])/(1.0 + d1)
-    w1f[0,0] = 0.0
-    
-    # 2nd step
-    j1f = nonlineardealiased(nx,ny,kx,ky,k2,w1f)
-    w2f[:,:] = ((1.0 - d2)/(1.0 + d2))*w1f[:,:] + (r2*dt*jnf[:,:]+ g2*dt*j1f[:,:])/(1.0 + d2)
-    w2f[0,0] = 0.0
-    
-    # 3rd step
-    j2f = nonlineardealiased(nx,ny,kx,ky,k2,w2f)
-    wnf[:,:] = ((1.0 - d3)/(1.0 + d3))*w2f[:,:] + (r3*dt*j1f[:,:] + g3*dt*j2f[:,:])/(1.0 + d3)
-    wnf[0,0] = 0.0
-    
-    if (n%freq == 0):
-        write_data(nx,ny,dx,dy,kx,ky,k2,nxc,nyc,dxc,dyc,wnf,w0,n,freq,dt)
-        print(n, " ", time, " ",wnf.shape[0], " ", wnf.shape[1])
-    
-w = wave2phy(nx,ny,wnf) # final vorticity field in physical space            
+# refer to Orlandi: Fluid flow phenomenon (itint = 0), or the integrating factor
+# and exponential time differencing schemes of integrators.py
+if icfl == 0:
+    for n in range(nstart+1,nt+1):
+        time = time + dt
+        integrator.step(wnf,step_jacobian)
+        step_jacobian.set_step(n)
+        
+        if ndiag > 0 and n%ndiag == 0:
+            diagnostics.record(n,time,dt,wnf)
+        
+        if (n%freq == 0):
+            if ndiag > 0:
+                diagnostics.flush()
+            jnf = None
+            if idealias == 2:
+                jnf = step_jacobian.state_jacobian()
+                jnf = np.copy(jnf) if nasync > 0 else jnf
+            output(nx,ny,dx,dy,kx,ky,k2,nxc,nyc,dxc,dyc,np.copy(wnf) if nasync > 0 else wnf,
+                   n,freq,dt,jacobian_output,iout=iout,attrs=config,jf=jnf)
+            print(n, " ", time, " ",wnf.shape[-2], " ", wnf.shape[-1])
+        
+        if nchkp > 0 and n%nchkp == 0:
+            save_checkpoint(file_checkpoint, wnf, {'step': n, 'time': time, 'dt': float(dt)}, config)
+else:
+    # adaptive time step for the target CFL number, the output is written at
+    # the same physical times t = ifile*tout as with the fixed time step dt
+    controller = CFLController(nx,ny,dx,dy,kx,ky,k2,cfl,ncfl,wnf.dtype,wnf.shape)
+    tout = freq*dt
+    ifile = int(istart) if ichkp == 1 else 0
+    n = 0
+    if ichkp == 2:
+        ifile = state['ifile']
+        n = nstart
+        controller.dt = state['dt_cfl']
+    ifile_start = ifile
+    while ifile < ns:
+        n = n + 1
+        # the last step before an output time ends at the output time
+        tnext = (ifile+1)*tout
+        dtn = min(controller(n,wnf), tnext - time)
+        integrator.set_dt(dtn)
+        
+        time = time + dtn
+        integrator.step(wnf,step_jacobian)
+        step_jacobian.set_step(n)
+        
+        last = time >= tnext - 1.0e-9*tout
+        if last:
+            time = tnext
+        
+        if ndiag > 0 and n%ndiag == 0:
+            diagnostics.record(n,time,dtn,wnf)
+        
+        if last:
+            ifile = ifile + 1
+            if ndiag > 0:
+                diagnostics.flush()
+            # write_data names the files by n/freq and labels plots by dt*n
+            jnf = None
+            if idealias == 2:
+                jnf = step_jacobian.state_jacobian()
+                jnf = np.copy(jnf) if nasync > 0 else jnf
+            output(nx,ny,dx,dy,kx,ky,k2,nxc,nyc,dxc,dyc,np.copy(wnf) if nasync > 0 else wnf,
+                   ifile*freq,freq,dt,jacobian_output,iout=iout,attrs=config,jf=jnf)
+            print(n, " ", time, " ", controller.dt, " ",wnf.shape[-2], " ", wnf.shape[-1])
+        
+        if nchkp > 0 and n%nchkp == 0:
+            save_checkpoint(file_checkpoint, wnf, {'step': n, 'time': time, 'dt': integrator.dt,
+                                                   'ifile': ifile, 'dt_cfl': controller.dt}, config)
+    
+    print('Time steps: ', n, ' (fixed dt: ', int(nt - ifile_start*freq), '), factor updates: ',
+          integrator.nfactors)
+
+# the run ends when all outputs are written
+if ndiag > 0:
+    diagnostics.flush()
+    print('Diagnostics: records ', diagnostics.nrecords, ' in [s] ', diagnostics.wall_time, ' (',
+          100.0*diagnostics.wall_time/(tm.time() - clock_time_init), ' % of the time loop)')
+
+if nasync > 0:
+    drain_time = writer.close()
+    print('Background writer: outputs ', writer.noutputs, ', waited for the queue [s] ',
+          writer.wait_time, ', drained in [s] ', drain_time)
+
+if irender > 0:
+    render_time_init = tm.time()
+    renderer.wait()
+    print('Waited for the frames [s] ', tm.time() - render_time_init)
+    
+w = wave2phy(nx,ny,wnf[0] if nens > 1 else wnf) # final vorticity field in physical space            
 
 total_clock_time = tm.time() - clock_time_init
 print('Total clock time=', total_clock_time)  
 
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024.0
+print('Peak RSS [MB] before time integration: ', rss_init, ' after: ', rss)
+
+stats = plan_stats()
+print('FFTW plans: ', stats['plans'], ' threads: ', get_threads(), ' hits: ', stats['hits'], ' misses: ', stats['misses'])
+print('Jacobians shared between the output and the next time step: ', step_jacobian.hits)
+
 #%%
-# compute the exact, initial and final energy spectrum for DHIT problem
+# compute the exact, initial and final energy spectrum for DHIT problem, for
+# an ensemble the mean over the members (the plots show the first member)
 if (ipr == 3):
-    en, n = energy_spectrum(nx,ny,w)
-    en0, n = energy_spectrum(nx,ny,w0)
+    if nens > 1:
+        en, n = ensemble_spectrum(nx,ny,wnf)
+        en0 = np.zeros(n+1)
+        for m in range(nens):
+            en0 += energy_spectrum(nx,ny,w0[m])[0]/nens
+    else:
+        en, n = energy_spectrum(nx,ny,w)
+        en0, n = energy_spectrum(nx,ny,w0)
     k = np.linspace(1,n,n)
     
     k0 = 10.0
@@ -763,6 +956,9 @@ if (ipr == 3):
     
     np.savetxt("spectral/energy_spectral_"+str(nd)+"_"+str(int(re))+".csv", en, delimiter=",")
 
+if nens > 1:
+    w0 = w0[0]
+
 #%%
 # contour plot for initial and final vorticity
 fig, axs = plt.subplots(1,2,sharey=True,figsize=(9,5))
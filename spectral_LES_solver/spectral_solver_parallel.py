@@ -0,0 +1,384 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Slab-decomposed parallel version of spectral_solver_DHIT_v2.py.
+
+The vorticity spectrum is distributed over P processes in slabs of ny/P
+columns and the dealiased Jacobian is computed with the slab-decomposed FFT of
+slab_fft.py, so every process only holds 1/P of the padded arrays. The
+processes run on one node with shared memory, or with MPI if mpi4py is
+installed:
+
+    python spectral_solver_parallel.py -np 4
+    mpiexec -n 4 python spectral_solver_parallel.py --mpi
+
+The solver reads the same input.txt as the serial solver and writes the
+vorticity and streamfunction to spectral/data_<nx>_parallel every nt/ns time
+steps. It only has the fixed time step, the full complex spectrum, dealiasing
+by padding and double precision for a single run started at t=0 without
+checkpoints, other settings of input.txt are refused (ValueError). The
+background writer (nasync), the frames (irender) and the diagnostics (ndiag)
+of the serial solver are not part of it, these lines are ignored. The
+initial condition is computed on rank 0 with the seed iseed as in the serial
+solver, so the parallel result matches the serial one to rounding, and every
+other rank only receives its slab of it.
+
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+import time as tm
+import numpy as np
+from numpy.random import seed
+from multiprocessing import shared_memory
+from fft_plans import get_plan, set_threads
+from integrators import get_integrator
+from slab_fft import SharedComm, MPIComm, SlabFFT, buffer_size
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from snapshot_archive import write_archive
+
+#%%
+def tgv_ic(nx,ny):
+    
+    '''
+    compute initial condition for TGV problem
+    
+    Inputs
+    ------
+    nx,ny : number of grid points in x and y direction
+    
+    Output
+    ------
+    w : initial condiition for vorticity for TGV problem
+    '''
+    
+    w = np.empty((nx+1,ny+1))
+    nq = 4.0
+    x = np.linspace(0.0,2.0*np.pi,nx+1)
+    y = np.linspace(0.0,2.0*np.pi,ny+1)
+    x, y = np.meshgrid(x, y, indexing='ij')
+    
+    w = 2.0*nq*np.cos(nq*x)*np.cos(nq*y)
+
+    return w
+
+#%%
+def vm_ic(nx,ny):
+    
+    '''
+    compute initial condition for vortex-merger problem
+    
+    Inputs
+    ------
+    nx,ny : number of grid points in x and y direction
+    
+    Output
+    ------
+    w : initial condiition for vorticity for vortex-merger problem
+    '''
+    
+    w = np.empty((nx+1,ny+1))
+
+    sigma = np.pi
+    xc1 = np.pi-np.pi/4.0
+    yc1 = np.pi
+    xc2 = np.pi+np.pi/4.0
+    yc2 = np.pi
+    
+    x = np.linspace(0.0,2.0*np.pi,nx+1)
+    y = np.linspace(0.0,2.0*np.pi,ny+1)
+    
+    x, y = np.meshgrid(x, y, indexing='ij')
+    
+    w = np.exp(-sigma*((x-xc1)**2 + (y-yc1)**2)) \
+            + np.exp(-sigma*((x-xc2)**2 + (y-yc2)**2))
+
+    return w
+
+#%%
+# set initial condition for decay of turbulence problem
+def decay_ic(nx,ny,dx,dy):
+    
+    '''
+    assign initial condition for vorticity for DHIT problem
+    
+    Inputs
+    ------
+    nx,ny : number of grid points in x and y direction
+    dx,dy : grid spacing in x and y direction
+    
+    Output
+    ------
+    w : initial condition for vorticity for DHIT problem
+    '''
+    
+    w = np.empty((nx+1,ny+1))
+    
+    epsilon = 1.0e-6
+    
+    kx = np.empty(nx)
+    ky = np.empty(ny)
+    
+    kx[0:int(nx/2)] = 2*np.pi/(np.float64(nx)*dx)*np.float64(np.arange(0,int(nx/2)))
+    kx[int(nx/2):nx] = 2*np.pi/(np.float64(nx)*dx)*np.float64(np.arange(-int(nx/2),0))
+
+    ky[0:ny] = kx[0:ny]
+    
+    kx[0] = epsilon
+    ky[0] = epsilon
+
+    kx, ky = np.meshgrid(kx, ky, indexing='ij')
+    
+    ksi = 2.0*np.pi*np.random.random_sample((int(nx/2+1), int(ny/2+1)))
+    eta = 2.0*np.pi*np.random.random_sample((int(nx/2+1), int(ny/2+1)))
+    
+    phase = np.zeros((nx,ny), dtype='complex128')
+    wf =  np.empty((nx,ny), dtype='complex128')
+    
+    phase[1:int(nx/2),1:int(ny/2)] = np.vectorize(complex)(np.cos(ksi[1:int(nx/2),1:int(ny/2)] +
+                                    eta[1:int(nx/2),1:int(ny/2)]), np.sin(ksi[1:int(nx/2),1:int(ny/2)] +
+                                    eta[1:int(nx/2),1:int(ny/2)]))
+
+    phase[nx-1:int(nx/2):-1,1:int(ny/2)] = np.vectorize(complex)(np.cos(-ksi[1:int(nx/2),1:int(ny/2)] +
+                                            eta[1:int(nx/2),1:int(ny/2)]), np.sin(-ksi[1:int(nx/2),1:int(ny/2)] +
+                                            eta[1:int(nx/2),1:int(ny/2)]))
+
+    phase[1:int(nx/2),ny-1:int(ny/2):-1] = np.vectorize(complex)(np.cos(ksi[1:int(nx/2),1:int(ny/2)] -
+                                           eta[1:int(nx/2),1:int(ny/2)]), np.sin(ksi[1:int(nx/2),1:int(ny/2)] -
+                                           eta[1:int(nx/2),1:int(ny/2)]))
+
+    phase[nx-1:int(nx/2):-1,ny-1:int(ny/2):-1] = np.vectorize(complex)(np.cos(-ksi[1:int(nx/2),1:int(ny/2)] -
+                                                 eta[1:int(nx/2),1:int(ny/2)]), np.sin(-ksi[1:int(nx/2),1:int(ny/2)] -
+                                                eta[1:int(nx/2),1:int(ny/2)]))
+
+    k0 = 10.0
+    c = 4.0/(3.0*np.sqrt(np.pi)*(k0**5))           
+    
+    kk = np.sqrt(kx[:,:]**2 + ky[:,:]**2)
+    es = c*(kk**4)*np.exp(-(kk/k0)**2)
+    wf[:,:] = np.sqrt((kk*es/np.pi)) * phase[:,:]*(nx*ny)
+            
+    fft_object_inv = get_plan((nx,ny), 'complex128', 'FFTW_BACKWARD')
+    ut = np.real(fft_object_inv(wf)) 
+    
+    #periodicity
+    w[0:nx,0:ny] = ut
+    w[:,ny] = w[:,0]
+    w[nx,:] = w[0,:]
+    w[nx,ny] = w[0,0] 
+    
+    return w
+
+#%%
+def read_input(filename='input.txt'):
+    
+    '''
+    read the entries of input.txt used by the parallel solver
+    
+    Output
+    ------
+    params : dictionary of the input parameters
+    '''
+    
+    l1 = []
+    with open(filename) as f:
+        for l in f:
+            l1.append((l.strip()).split("\t"))
+    
+    params = {}
+    params['nd'] = int(l1[0][0])
+    params['nt'] = int(l1[1][0])
+    params['re'] = float(l1[2][0])
+    params['dt'] = float(l1[3][0])
+    params['ns'] = int(l1[4][0])
+    params['ipr'] = int(l1[8][0])
+    params['pad'] = float(l1[13][0]) if len(l1) > 13 else 1.5
+    params['itint'] = int(l1[20][0]) if len(l1) > 20 else 0
+    params['iseed'] = int(l1[23][0]) if len(l1) > 23 else 1
+    params['iout'] = int(l1[27][0]) if len(l1) > 27 else 0
+    
+    # settings of the serial solver the parallel solver does not have:
+    # (line of input.txt, name, supported values)
+    unsupported = [(10, 'ichkp', [0]), (12, 'irfft', [0]), (14, 'idealias', [2]),
+                   (16, 'precision', [0]), (17, 'icfl', [0]), (21, 'nens', [1]),
+                   (25, 'nchkp', [0]), (27, 'iout', [0, 3])]
+    for i, name, values in unsupported:
+        if len(l1) > i and int(l1[i][0]) not in values:
+            raise ValueError(name+' = '+l1[i][0]+' in '+filename+' is not supported by the '
+                             'parallel solver ('+name+' = '+' or '.join(map(str,values))+')')
+    
+    return params
+
+#%%
+def write_fields(nx,ny,k2,wf,n,freq,dt,re,ns,iout=0):
+    
+    '''
+    write the vorticity and streamfunction in physical space (including
+    periodic boundaries) computed from the full spectrum wf, to .csv files or
+    with iout = 3 to the memory-mapped archive (snapshot_archive) of ns outputs
+    '''
+    
+    fft_object_inv = get_plan((nx,ny), 'complex128', 'FFTW_BACKWARD')
+    
+    w = np.empty((nx+1,ny+1))
+    w[0:nx,0:ny] = np.real(fft_object_inv(wf))
+    w[:,ny] = w[:,0]
+    w[nx,:] = w[0,:]
+    
+    s = np.empty((nx+1,ny+1))
+    s[0:nx,0:ny] = np.real(fft_object_inv(wf/k2))
+    s[:,ny] = s[:,0]
+    s[nx,:] = s[0,:]
+    
+    folder = "spectral/data_"+str(nx)+"_parallel"
+    if iout == 3:
+        write_archive(folder, int(n/freq), n, dt*n, re, {'w': w, 's': s}, ns)
+        return
+    
+    if not os.path.exists(folder):
+        os.makedirs(folder+"/04_vorticity")
+        os.makedirs(folder+"/05_streamfunction")
+    
+    np.savetxt(folder+"/04_vorticity/w_"+str(int(n/freq))+".csv", w, delimiter=",")
+    np.savetxt(folder+"/05_streamfunction/s_"+str(int(n/freq))+".csv", s, delimiter=",")
+
+#%%
+def solve(comm,params,write=True):
+    
+    '''
+    run the slab-decomposed solver on one rank
+    
+    Inputs
+    ------
+    comm : SharedComm or MPIComm
+    params : input parameters (see read_input)
+    write : write the fields every nt/ns time steps
+    
+    Output
+    ------
+    wf : final vorticity spectrum (nx,ny) on rank 0, None on the other ranks
+    clock_time : wall time of the time integration
+    '''
+    
+    nx = ny = params['nd']
+    nt, ns, dt, re = params['nt'], params['ns'], params['dt'], params['re']
+    freq = int(nt/ns)
+    lx = ly = 2.0*np.pi
+    dx, dy = lx/nx, ly/ny
+    
+    slab = SlabFFT(comm,nx,ny,params['pad'])
+    nxl, nyl = slab.nxl, slab.nyl
+    
+    # initial condition on rank 0 (same random numbers as the serial solver),
+    # the other ranks only hold their slab of nxl rows of it
+    w0 = None
+    if comm.rank == 0:
+        seed(params['iseed'])
+        if (params['ipr'] == 1):
+            w0 = tgv_ic(nx,ny)
+        elif (params['ipr'] == 2):
+            w0 = vm_ic(nx,ny)
+        elif (params['ipr'] == 3):
+            w0 = decay_ic(nx,ny,dx,dy)
+        w0 = w0[0:nx,0:ny].reshape(comm.size,nxl,ny)
+    w0 = comm.scatter(w0, np.empty((nxl,ny)))
+    
+    wnf = slab.forward(w0.astype('complex128'))
+    del w0
+    
+    rhs = lambda wf,jf: slab.jacobian(wf,jf)
+    integrator = get_integrator(params['itint'],slab.k2,re,dt,wnf.dtype)
+    
+    comm.wait()
+    clock_time_init = tm.time()
+    for n in range(1,nt+1):
+        integrator.step(wnf,rhs)
+        
+        if write and (n%freq == 0):
+            wf = comm.gather(wnf)
+            if comm.rank == 0:
+                wf = wf.transpose(1,0,2).reshape(nx,ny)
+                k2 = np.fft.fftfreq(nx,1/nx).reshape(nx,1)**2 + np.fft.fftfreq(ny,1/ny).reshape(1,ny)**2
+                k2[0,0] = 1.0e-12
+                write_fields(nx,ny,k2,wf,n,freq,dt,re,ns,params['iout'])
+                print(n, " ", n*dt)
+    
+    comm.wait()
+    clock_time = tm.time() - clock_time_init
+    
+    wf = comm.gather(wnf)
+    if comm.rank == 0:
+        wf = wf.transpose(1,0,2).reshape(nx,ny)
+    
+    return wf, clock_time
+
+#%%
+def worker(rank,size,name,barrier,params,write,threads,queue):
+    
+    '''
+    one process of the shared memory run, rank 0 puts the result in the queue
+    '''
+    
+    set_threads(threads)
+    comm = SharedComm(rank,size,name,barrier)
+    wf, clock_time = solve(comm,params,write)
+    comm.close()
+    
+    if rank == 0:
+        queue.put((wf, clock_time))
+
+#%%
+def run_shared(nprocs,params,write=True,threads=1):
+    
+    '''
+    run the solver with nprocs processes on this node
+    
+    Output
+    ------
+    wf : final vorticity spectrum (nx,ny)
+    clock_time : wall time of the time integration
+    '''
+    
+    nd = params['nd']
+    ctx = multiprocessing.get_context('spawn')
+    shm = shared_memory.SharedMemory(create=True, size=buffer_size(nd,nd,nprocs,params['pad']))
+    barrier = ctx.Barrier(nprocs)
+    queue = ctx.Queue()
+    
+    processes = [ctx.Process(target=worker, args=(rank,nprocs,shm.name,barrier,params,write,threads,queue))
+                 for rank in range(nprocs)]
+    try:
+        for p in processes:
+            p.start()
+        wf, clock_time = queue.get()
+        for p in processes:
+            p.join()
+    finally:
+        shm.close()
+        shm.unlink()
+    
+    return wf, clock_time
+
+#%%
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='slab-decomposed parallel spectral solver')
+    parser.add_argument('-np', type=int, default=2, help='number of processes (shared memory)')
+    parser.add_argument('-t', type=int, default=1, help='FFTW threads per process')
+    parser.add_argument('--mpi', action='store_true', help='run with mpi4py (start with mpiexec)')
+    args = parser.parse_args()
+    
+    params = read_input()
+    
+    if args.mpi:
+        set_threads(args.t)
+        comm = MPIComm()
+        wf, clock_time = solve(comm,params)
+        rank = comm.rank
+    else:
+        wf, clock_time = run_shared(args.np,params,threads=args.t)
+        rank = 0
+    
+    if rank == 0:
+        print('Total clock time=', clock_time)
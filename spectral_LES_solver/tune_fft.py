@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+One-off tuning of the FFTs used by the spectral solver.
+
+For every grid size the forward and backward transforms of the nx X ny grid
+and of the padded grid of the dealiased Jacobian are benchmarked with pyfftw
+(FFTW_ESTIMATE, FFTW_MEASURE and FFTW_PATIENT), scipy.fft with workers and
+numpy.fft, both for complex and real (half spectrum) transforms. The fastest
+combination is written to fft_tuning.json and the FFTW wisdom gathered while
+planning to fftw_wisdom.dat. The solver loads both files at startup, so the
+expensive planning is not repeated in production runs.
+
+usage: python tune_fft.py [-n 1024 2048] [-p 1.5] [-t 8] [-r 10]
+       (the grid size, padding factor and threads default to input.txt)
+
+"""
+
+import argparse
+import json
+import os
+import sys
+import time as tm
+import numpy as np
+from fft_plans import get_plan, clear_plans, padded_size, set_threads, get_threads, \
+                      set_effort, set_backend, tuning_key
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from fftw_wisdom import load_wisdom, save_wisdom
+
+#%%
+def benchmark(shape,dtype,backend,effort,nrep):
+    
+    '''
+    return the planning time and the time of one forward plus one backward
+    transform for the given backend and planner effort
+    '''
+    
+    clear_plans()
+    set_backend(backend)
+    set_effort(effort)
+    
+    t0 = tm.time()
+    fft_object = get_plan(shape, dtype, 'FFTW_FORWARD')
+    fft_object_inv = get_plan(shape, dtype, 'FFTW_BACKWARD')
+    t_plan = tm.time() - t0
+    
+    fft_object.input_array[...] = np.random.random_sample(fft_object.input_array.shape)
+    
+    fft_object_inv(fft_object())
+    t0 = tm.time()
+    for i in range(nrep):
+        fft_object_inv(fft_object())
+    t_exec = (tm.time() - t0)/nrep
+    
+    return t_plan, t_exec
+
+#%%
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='select the fastest FFT backend and planner effort')
+    parser.add_argument('-n', type=int, nargs='+', default=None, help='grid sizes')
+    parser.add_argument('-p', type=float, default=None, help='padding factor')
+    parser.add_argument('-t', type=int, default=0, help='number of threads')
+    parser.add_argument('-r', type=int, default=10, help='number of repetitions')
+    parser.add_argument('--efforts', nargs='+', default=['FFTW_ESTIMATE','FFTW_MEASURE','FFTW_PATIENT'],
+                        help='FFTW planner efforts')
+    parser.add_argument('--backends', nargs='+', default=['pyfftw','scipy','numpy'], help='FFT backends')
+    parser.add_argument('--tuning', default='fft_tuning.json', help='tuning file')
+    parser.add_argument('--wisdom', default='fftw_wisdom.dat', help='FFTW wisdom file')
+    args = parser.parse_args()
+    
+    # defaults from input.txt of the spectral solver
+    if os.path.exists('input.txt'):
+        l1 = []
+        with open('input.txt') as f:
+            for l in f:
+                l1.append((l.strip()).split("\t"))
+        if args.n is None:
+            args.n = [int(l1[0][0])]
+        if args.p is None and len(l1) > 13:
+            args.p = float(l1[13][0])
+        if args.t == 0 and len(l1) > 15:
+            args.t = int(l1[15][0])
+    if args.n is None:
+        args.n = [1024]
+    if args.p is None:
+        args.p = 1.5
+    
+    set_threads(args.t)
+    load_wisdom(args.wisdom)
+    
+    tuning = {}
+    if os.path.exists(args.tuning):
+        with open(args.tuning) as f:
+            tuning = json.load(f)
+    
+    candidates = []
+    for backend in args.backends:
+        if backend == 'pyfftw':
+            candidates += [(backend, effort) for effort in args.efforts]
+        else:
+            candidates.append((backend, 'FFTW_ESTIMATE'))
+    
+    print('threads: ', get_threads())
+    print('%-24s %-8s %-14s %10s %10s' % ('transform', 'backend', 'effort', 'plan [s]', 'exec [s]'))
+    for n in args.n:
+        for ne in sorted(set([n, padded_size(n,args.p)])):
+            for dtype in ['complex128', 'float64']:
+                best = None
+                for backend, effort in candidates:
+                    t_plan, t_exec = benchmark((ne,ne),dtype,backend,effort,args.r)
+                    print('%-24s %-8s %-14s %10.4f %10.5f' % (tuning_key((ne,ne),dtype), backend,
+                          effort if backend == 'pyfftw' else '-', t_plan, t_exec))
+                    if best is None or t_exec < best[2]:
+                        best = (backend, effort, t_exec)
+                
+                tuning[tuning_key((ne,ne),dtype)] = {'backend': best[0], 'effort': best[1],
+                                                     'threads': get_threads(), 'time': best[2]}
+                print('%-24s -> %s %s' % (tuning_key((ne,ne),dtype), best[0], best[1]))
+    
+    with open(args.tuning, 'w') as f:
+        json.dump(tuning, f, indent=2, sort_keys=True)
+    save_wisdom(args.wisdom)
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Validation of the half spectrum layout (irfft = 1) of the spectral solver
+against the full spectrum layout (irfft = 0).
+
+First the Jacobian of one random real field is computed in both layouts for
+every dealiasing strategy (idealias), with the NumPy and the Numba kernels,
+and the half spectrum is compared with the half spectrum of the real part of
+the full spectrum result (the field seen on the grid). They agree to round-off.
+
+Then the solver is run for decaying turbulence in both layouts, every run in
+its own directory below the output directory, and the fields written by
+write_data (J_fourier, J_coarsen, sgs, w, s) are compared output by output.
+The runs do not agree to round-off: the full spectrum keeps a component of
+the Nyquist modes kx = -nx/2 and ky = -ny/2 that is zero on the grid (the
+imaginary part dropped by the inverse transform) but enters the Jacobian of
+the next stages, and the half spectrum of a real field cannot hold it. The
+difference grows with the energy at the Nyquist modes, it is reported
+together with the tolerance.
+
+usage: python validate_layouts.py [-n 64] [--nt 40] [--dt 5.0e-4] [--re 4000]
+                                  [--tol 1.0e-2] [-o layout_validation]
+
+"""
+
+import argparse
+import os
+import sys
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import nonlinear_terms
+from validate_precision import run_solver
+
+#%%
+def jacobian_error(n,idealias,jit):
+
+    '''
+    relative difference of the Jacobian of a random real field computed in the
+    half spectrum and the half spectrum of the real part of the Jacobian
+    computed in the full spectrum
+
+    Inputs
+    ------
+    n : grid size
+    idealias : [0] none, [1] 2/3 truncation, [2] padding, [3] phase shift
+    jit : Numba kernels for idealias = 2
+
+    Output
+    ------
+    error : maximum relative difference
+    '''
+
+    nonlinear_terms.set_jit(jit)
+    jacobian = nonlinear_terms.get_nonlinear(idealias)
+
+    kx = np.fft.fftfreq(n,1/n).reshape(n,1)
+    ky = np.fft.fftfreq(n,1/n).reshape(1,n)
+    kyh = np.fft.rfftfreq(n,1/n).reshape(1,int(n/2)+1)
+    k2 = kx*kx + ky*ky
+    k2[0,0] = 1.0e-12
+    k2h = kx*kx + kyh*kyh
+    k2h[0,0] = 1.0e-12
+
+    w = np.random.RandomState(1).randn(n,n)
+    jf = jacobian(n,n,kx,ky,k2,np.fft.fft2(w))
+    jfh = jacobian(n,n,kx,kyh,k2h,np.fft.rfft2(w))
+
+    jf = np.fft.rfft2(np.real(np.fft.ifft2(jf)))
+
+    return np.abs(jfh - jf).max()/np.abs(jf).max()
+
+#%%
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='half versus full spectrum layout of the spectral solver')
+    parser.add_argument('-n', type=int, default=64, help='grid size')
+    parser.add_argument('--nc', type=int, default=32, help='coarse grid size of the output')
+    parser.add_argument('--nt', type=int, default=40, help='number of time steps')
+    parser.add_argument('--ns', type=int, default=4, help='number of outputs')
+    parser.add_argument('--dt', type=float, default=5.0e-4, help='time step')
+    parser.add_argument('--re', type=float, default=4000.0, help='Reynolds number')
+    parser.add_argument('--tol', type=float, default=1.0e-2, help='tolerance of the solver runs')
+    parser.add_argument('-o', default='layout_validation', help='output directory')
+    args = parser.parse_args()
+
+    n, ns = args.n, args.ns
+    passed = True
+
+    # Jacobian of the same field: round-off
+    print('%10s %6s %14s' % ('idealias', 'jit', 'error'))
+    for idealias in [0, 1, 2, 3]:
+        for jit in ([False, True] if idealias == 2 else [False]):
+            error = jacobian_error(n,idealias,jit)
+            passed = passed and error < 1.0e-12
+            print('%10d %6d %14.4e' % (idealias, jit, error))
+
+    # solver runs: maximum relative difference of the written fields
+    folder = 'data_'+str(n)+'_v2'
+    for irfft in [0, 1]:
+        run_solver(os.path.join(args.o, 'irfft_'+str(irfft)),
+                   {0: n, 1: args.nt, 2: args.re, 3: args.dt, 4: ns, 8: 3, 9: args.nc, 10: 0,
+                    12: irfft, 28: 0})
+
+    fields = [('01_coarsened_jacobian_field', 'J_fourier'), ('02_jacobian_coarsened_field', 'J_coarsen'),
+              ('03_subgrid_scale_term', 'sgs'), ('04_vorticity', 'w'), ('05_streamfunction', 's')]
+    print('%8s' % 'output' + ''.join(['%14s' % name for _, name in fields]))
+    for i in range(1,ns+1):
+        errors = []
+        for sub, name in fields:
+            u = [np.loadtxt(os.path.join(args.o, 'irfft_'+str(irfft), 'spectral', folder, sub,
+                                         name+'_'+str(i)+'.csv'), delimiter=',') for irfft in [0, 1]]
+            errors.append(np.abs(u[1] - u[0]).max()/np.abs(u[0]).max())
+        passed = passed and max(errors) < args.tol
+        print('%8d' % i + ''.join(['%14.4e' % e for e in errors]))
+
+    print('passed' if passed else 'failed')
+    sys.exit(0 if passed else 1)
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Validation of the single and mixed precision modes of the spectral solver.
+
+The solver is run for the Taylor-Green vortex and for decaying turbulence in
+double ([0]), single ([1]) and mixed ([2], Jacobian in single precision)
+precision (precision entry of input.txt), every run in its own directory below
+the output directory. For the TGV case the error of the final vorticity with
+respect to the exact solution (exact_tgv) is reported, for the decay case the
+drift of the final energy spectrum from the double precision run. The wall
+time of the time integration and the speedup over double precision are
+reported for every precision.
+
+usage: python validate_precision.py [-n 256] [--nt 400] [--dt 1.0e-3] [--re 4000]
+                                    [-o precision_validation]
+
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import numpy as np
+
+solver = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'spectral_solver_DHIT_v2.py')
+input_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'input.txt')
+
+#%%
+def exact_tgv(nx,ny,time,re):
+
+    '''
+    compute exact solution for TGV problem (as in spectral_solver_DHIT_v2.py)
+    '''
+
+    x = np.linspace(0.0,2.0*np.pi,nx+1)
+    y = np.linspace(0.0,2.0*np.pi,ny+1)
+    x, y = np.meshgrid(x, y, indexing='ij')
+
+    nq = 4.0
+    ue = 2.0*nq*np.cos(nq*x)*np.cos(nq*y)*np.exp(-2.0*nq*nq*time/re)
+
+    return ue
+
+#%%
+def run_solver(folder,values):
+
+    '''
+    run the solver in folder with input.txt changed by values
+
+    Inputs
+    ------
+    folder : run directory
+    values : dictionary {line number (starting from 0): value} of input.txt
+
+    Output
+    ------
+    clock_time : wall time of the time integration in seconds
+    '''
+
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+
+    with open(input_file) as f:
+        lines = f.readlines()
+    for i, value in values.items():
+        lines[i] = str(value) + '\t' + lines[i].split('\t',1)[1]
+    with open(os.path.join(folder,'input.txt'), 'w') as f:
+        f.writelines(lines)
+
+    env = dict(os.environ, MPLBACKEND='Agg')
+    result = subprocess.run([sys.executable, solver], cwd=folder, env=env,
+                            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+    if result.returncode != 0:
+        print('warning: solver in '+folder+' exited with code '+str(result.returncode))
+
+    clock_time = np.nan
+    for l in result.stdout.splitlines():
+        if l.startswith('Total clock time='):
+            clock_time = float(l.split('=')[1])
+
+    return clock_time
+
+#%%
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='single and mixed versus double precision of the spectral solver')
+    parser.add_argument('-n', type=int, default=256, help='grid size')
+    parser.add_argument('--nc', type=int, default=64, help='coarse grid size of the output')
+    parser.add_argument('--nt', type=int, default=400, help='number of time steps')
+    parser.add_argument('--dt', type=float, default=1.0e-3, help='time step')
+    parser.add_argument('--re', type=float, default=4000.0, help='Reynolds number')
+    parser.add_argument('-o', default='precision_validation', help='output directory')
+    args = parser.parse_args()
+
+    n, ns = args.n, 1
+    folder = 'data_'+str(n)+'_v2'
+    names = ['double', 'single', 'mixed']
+
+    print('%6s %10s %12s %10s %14s' % ('case', 'precision', 'time [s]', 'speedup', 'error'))
+
+    # TGV: error with respect to the exact solution
+    for precision in [0, 1, 2]:
+        path = os.path.join(args.o, 'tgv_'+str(precision))
+        clock_time = run_solver(path, {0: n, 1: args.nt, 2: args.re, 3: args.dt, 4: ns, 8: 1,
+                                       9: args.nc, 10: 0, 16: precision})
+        if precision == 0:
+            clock_time_double = clock_time
+        w = np.loadtxt(os.path.join(path,'spectral',folder,'04_vorticity','w_'+str(ns)+'.csv'),
+                       delimiter=',')
+        we = exact_tgv(n,n,args.nt*args.dt,args.re)
+        error = np.abs(w - we).max()/np.abs(we).max()
+        print('%6s %10s %12.3f %10.2f %14.4e' % ('tgv', names[precision], clock_time,
+                                                 clock_time_double/clock_time, error))
+
+    # decay: maximum relative drift of the energy spectrum from the double
+    # precision run over the wavenumbers k < n/3 that are not affected by the
+    # truncation
+    kmax = int(n/3)
+    for precision in [0, 1, 2]:
+        path = os.path.join(args.o, 'decay_'+str(precision))
+        clock_time = run_solver(path, {0: n, 1: args.nt, 2: args.re, 3: args.dt, 4: ns, 8: 3,
+                                       9: args.nc, 10: 0, 16: precision})
+        en = np.loadtxt(os.path.join(path,'spectral','energy_spectral_'+str(n)+'_'+
+                                     str(int(args.re))+'.csv'))
+        if precision == 0:
+            clock_time_double, en_double = clock_time, en
+        drift = np.abs(en[1:kmax] - en_double[1:kmax])/en_double[1:kmax]
+        print('%6s %10s %12.3f %10.2f %14.4e' % ('decay', names[precision], clock_time,
+                                                 clock_time_double/clock_time, drift.max()))
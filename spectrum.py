@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Shell-averaged energy and enstrophy spectra of the vorticity field.
+
+The energy spectrum of the solvers is the mean over the modes of the shell
+k-0.5 < |k| < k+0.5 of
+
+    es = pi*|wf/(nx*ny)|^2/|k|
+
+without the modes of kx = 0 and ky = 0 (the first row and column of the
+spectrum), for k = 1 to n = int(sqrt(nx^2+ny^2)/2)-1. The enstrophy spectrum
+is the mean of |k|^2*es over the same shells.
+
+Instead of searching the modes of every shell (np.where over the grid for
+every k), the shell of every mode is computed once per grid and kept
+(get_shells), and the spectrum is one weighted np.bincount over the modes.
+The factor pi/(nx*ny)^2/|k| is part of the kept weights.
+
+The spectrum is computed from the vorticity in frequency domain, in the full
+(nx,ny) or the half (nx,ny/2+1) layout of a real field. In the half layout the
+modes 0 < ky < ny/2 stand for themselves and for the modes of -ky (|wf(-k)| =
+|wf(k)| for a real field) and are counted twice.
+
+The module is shared by the spectral solver (spectral_LES_solver) and the
+finite difference solver (finite_diff_LES_solver), which put the repository
+folder on sys.path to import it.
+
+"""
+
+import numpy as np
+
+_shells = {}
+
+#%%
+class Shells(object):
+
+    '''
+    shell index and weights of the modes of a grid
+
+    Inputs
+    ------
+    nx,ny : number of grid points in x and y direction
+    half : half spectrum (nx,ny/2+1) of a real field, else the full (nx,ny)
+
+    Attributes
+    ----------
+    n : maximum wavenumber of the spectrum
+    index : shell of every mode (flattened), n+1 for the modes left out
+    energy, enstrophy : weights of |wf|^2 of every mode (flattened) for the
+                        energy and the enstrophy spectrum
+    count : number of modes of every shell (0 to n)
+    '''
+
+    def __init__(self, nx, ny, half=False):
+        self.nx, self.ny, self.half = nx, ny, half
+        self.n = int(np.sqrt(nx*nx + ny*ny)/2.0)-1
+
+        kx = np.fft.fftfreq(nx,1/nx).reshape(nx,1)
+        if half:
+            ky = np.fft.rfftfreq(ny,1/ny).reshape(1,int(ny/2)+1)
+        else:
+            ky = np.fft.fftfreq(ny,1/ny).reshape(1,ny)
+        kk = np.sqrt(kx*kx + ky*ky)
+
+        # kk of two integers is never a half-integer, so rounding gives the
+        # shell k-0.5 < kk < k+0.5
+        index = np.rint(kk).astype(np.intp)
+        index[0,:] = self.n+1
+        index[:,0] = self.n+1
+        index[index > self.n] = self.n+1
+
+        # number of modes of the full spectrum every mode stands for
+        multiplicity = np.ones(kk.shape)
+        if half:
+            multiplicity[:,1:int((ny+1)/2)] = 2.0
+
+        kk[0,0] = 1.0
+        self.index = index.ravel()
+        self.energy = (multiplicity*np.pi/((nx*ny)**2)/kk).ravel()
+        self.enstrophy = (multiplicity*np.pi/((nx*ny)**2)*kk).ravel()
+        self.count = np.bincount(self.index, weights=multiplicity.ravel(), minlength=self.n+2)[0:self.n+1]
+
+#%%
+def get_shells(nx, ny, half=False):
+
+    '''
+    return the cached Shells of the grid and layout
+    '''
+
+    key = (nx, ny, bool(half))
+    shells = _shells.get(key)
+    if shells is None:
+        shells = Shells(nx, ny, half)
+        _shells[key] = shells
+
+    return shells
+
+#%%
+def shell_spectrum(nx, ny, wf, kind='energy', power=False):
+
+    '''
+    compute the shell-averaged spectrum from the vorticity in frequency domain
+
+    Inputs
+    ------
+    nx,ny : number of grid points in x and y direction
+    wf : vorticity field in frequency domain (excluding periodic boundaries),
+         either the full (nx,ny) or the half (nx,ny/2+1) spectrum
+    kind : 'energy' or 'enstrophy' spectrum
+    power : wf is |wf|^2 already (e.g. summed over the members of an ensemble)
+
+    Output
+    ------
+    en : energy (or enstrophy) spectrum, en[0] = 0
+    n : maximum wavenumber
+    '''
+
+    shells = get_shells(nx, ny, wf.shape[-1] == int(ny/2)+1)
+
+    if power:
+        pw = np.asarray(wf, dtype=np.float64).ravel()
+    else:
+        pw = (wf.real.astype(np.float64)**2 + wf.imag.astype(np.float64)**2).ravel()
+
+    weights = shells.energy if kind == 'energy' else shells.enstrophy
+    en = np.bincount(shells.index, weights=pw*weights, minlength=shells.n+2)[0:shells.n+1]
+    en[1:] = en[1:]/shells.count[1:]
+    en[0] = 0.0
+
+    return en, shells.n
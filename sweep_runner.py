@@ -0,0 +1,509 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Parameter sweeps of the spectral and finite difference solvers.
+
+A sweep is a directory holding one job per point of the parameter grid
+(solver, nd, Re, dt, seed, ipr). Every job runs in its own directory below
+runs/ with an input.txt written from the input.txt of the solver, so the
+output layout of the solvers is unchanged. Further lines of input.txt are set
+with --set line=value for the jobs of all solvers, or solver:line=value for
+the jobs of one solver (e.g. spectral:28=3). All jobs share the FFTW wisdom
+file fftw_wisdom.dat of the sweep (FFTW_WISDOM of the job).
+
+The jobs are queued as files in queue/pending, queue/running, queue/done and
+queue/failed. A runner claims a job by renaming it from pending to running,
+which is atomic (the file is touched before, so that its heartbeat is never
+stale), so several runners (e.g. on several nodes sharing the
+filesystem) can pull jobs from the same sweep. Every runner starts up to -j
+solver processes with -t FFTW/BLAS/Numba threads each (PYFFTW_NUM_THREADS,
+OMP_NUM_THREADS and NUMBA_NUM_THREADS of the job), so that the cores are not oversubscribed, and
+records the status of its jobs in the local state file state_<host>.json.
+
+A job whose input.txt cannot be written (e.g. a line that does not exist in
+the input.txt of its solver) fails like a run that fails.
+
+After a crash the jobs left in queue/running by a runner of this host that is
+no longer alive (or whose heartbeat is older than --stale seconds for other
+hosts) are returned to pending. A partial spectral job is restarted from its
+binary checkpoint (ichkp = 2, written with nchkp > 0 in --set) or else from its
+last written output (ichkp = 1, istart), a partial finite difference job from
+the beginning. Finished jobs are skipped.
+
+usage:
+    python sweep_runner.py create SWEEP --solver spectral fdm --nd 128 256 --re 1000 4000
+                                        --dt 5.0e-4 --seed 1 2 3 --ipr 3
+                                        [--set 1=8000 4=400 spectral:28=3]
+    python sweep_runner.py run SWEEP [-j 4] [-t 1] [--stale 600] [--retry-failed]
+    python sweep_runner.py status SWEEP
+
+"""
+
+import argparse
+import glob
+import itertools
+import json
+import os
+import socket
+import subprocess
+import sys
+import time as tm
+import numpy as np
+
+try:
+    import h5py
+except ImportError:
+    h5py = None
+
+root = os.path.dirname(os.path.abspath(__file__))
+
+# solver script, input.txt and the lines (starting from 0) of input.txt of
+# the parameters of a sweep
+solvers = {
+    'spectral': {'script': os.path.join(root,'spectral_LES_solver','spectral_solver_DHIT_v2.py'),
+                 'input': os.path.join(root,'spectral_LES_solver','input.txt'),
+                 'lines': {'nd': 0, 'nt': 1, 're': 2, 'dt': 3, 'ns': 4, 'ipr': 8, 'ichkp': 10,
+                           'istart': 11, 'nthreads': 15, 'seed': 23},
+                 'output': 'spectral/data_{nd}_v2'},
+    'fdm': {'script': os.path.join(root,'finite_diff_LES_solver','fdm_solver_DHIT.py'),
+            'input': os.path.join(root,'finite_diff_LES_solver','input.txt'),
+            'lines': {'nd': 0, 'nt': 1, 're': 2, 'dt': 3, 'ns': 4, 'ipr': 8, 'nthreads': 12,
+                      'seed': 13},
+            'output': 'fdm/data'},
+}
+
+subfolders = ['01_coarsened_jacobian_field', '02_jacobian_coarsened_field',
+              '03_subgrid_scale_term', '04_vorticity', '05_streamfunction']
+
+states = ['pending', 'running', 'done', 'failed']
+
+host = socket.gethostname()
+
+#%%
+def write_json(filename, data):
+
+    '''
+    write data to filename atomically (temporary file and rename), so that a
+    crash never leaves a partial file
+    '''
+
+    tmp = filename + '.' + host + '.' + str(os.getpid()) + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(data, f, indent=1)
+    os.replace(tmp, filename)
+
+#%%
+def read_json(filename):
+    with open(filename) as f:
+        return json.load(f)
+
+#%%
+def job_name(job):
+
+    '''
+    name of the job directory and queue file of a point of the grid
+    '''
+
+    return (job['solver'] + '_n' + str(job['nd']) + '_re' + '%g' % job['re'] + '_dt' +
+            '%g' % job['dt'] + '_s' + str(job['seed']) + '_p' + str(job['ipr']))
+
+#%%
+def find_job(sweep, name):
+
+    '''
+    return the queue state of the job name (None if it is not in the sweep)
+    '''
+
+    for state in states:
+        if os.path.exists(os.path.join(sweep,'queue',state,name+'.json')):
+            return state
+
+    return None
+
+#%%
+def create_sweep(sweep, grid, values):
+
+    '''
+    create the sweep directory and queue a job for every point of the grid
+
+    Inputs
+    ------
+    sweep : sweep directory
+    grid : dictionary {parameter: list of values} with the parameters solver,
+           nd, re, dt, seed and ipr
+    values : dictionary {solver: {line number: value}} of further changes of
+             input.txt for the jobs of every solver
+
+    Output
+    ------
+    njobs : number of jobs added (points already in the sweep are kept)
+    '''
+
+    # a line that is not in the input.txt of a solver is refused before any
+    # job is queued
+    for solver in grid['solver']:
+        nlines = len(read_input(solvers[solver]['input']))
+        for i in values.get(solver, {}):
+            if not 0 <= int(i) < nlines:
+                raise ValueError('line '+str(i)+' is not in the input.txt of the '+solver+
+                                 ' solver ('+str(nlines)+' lines), use --set solver:line=value')
+
+    for state in states:
+        os.makedirs(os.path.join(sweep,'queue',state), exist_ok=True)
+    os.makedirs(os.path.join(sweep,'runs'), exist_ok=True)
+
+    keys = ['solver', 'nd', 're', 'dt', 'seed', 'ipr']
+    njobs = 0
+    for point in itertools.product(*[grid[key] for key in keys]):
+        job = dict(zip(keys, point))
+        job['values'] = values.get(job['solver'], {})
+        name = job_name(job)
+        if find_job(sweep, name) is None:
+            write_json(os.path.join(sweep,'queue','pending',name+'.json'), job)
+            njobs += 1
+
+    return njobs
+
+#%%
+def write_input(template, filename, values):
+
+    '''
+    write input.txt with the lines of the template changed by values
+    {line number: value}
+    '''
+
+    with open(template) as f:
+        lines = f.readlines()
+    for i, value in values.items():
+        lines[int(i)] = str(value) + '\t' + lines[int(i)].split('\t',1)[1]
+    with open(filename, 'w') as f:
+        f.writelines(lines)
+
+#%%
+def read_input(filename):
+    l1 = []
+    with open(filename) as f:
+        for l in f:
+            l1.append((l.strip()).split("\t"))
+    return l1
+
+#%%
+def last_output(folder):
+
+    '''
+    return the number of the last complete output of a run (0 if none), the
+    streamfunction is the last file written by write_data, or the last
+    snapshot of the snapshot store or of the archive (iout > 0)
+    '''
+
+    files = glob.glob(os.path.join(folder,'05_streamfunction','s_*.csv'))
+    numbers = [int(os.path.basename(f)[2:-4]) for f in files]
+
+    filename = os.path.join(folder,'snapshots.h5')
+    if h5py is not None and os.path.exists(filename):
+        try:
+            with h5py.File(filename,'r') as f:
+                numbers += [int(i) for i in f['output'][-1:]]
+        except (OSError, KeyError):
+            pass
+
+    # the archive has a slot for every output, step = -1 if it is not written
+    filename = os.path.join(folder,'archive','index.npy')
+    if os.path.exists(filename):
+        index = np.load(filename)
+        numbers += [int(i) for i in index['output'][index['step'] >= 0]]
+
+    return max(numbers) if numbers else 0
+
+#%%
+def prepare_job(sweep, name, job):
+
+    '''
+    write input.txt of the job to its run directory, continuing a partial
+    spectral run from its checkpoint or last output
+
+    Output
+    ------
+    folder : run directory
+    ns : number of outputs of the complete run
+    output : output folder of the solver in the run directory
+    '''
+
+    solver = solvers[job['solver']]
+    lines = solver['lines']
+
+    folder = os.path.join(sweep,'runs',name)
+    output = os.path.join(folder, solver['output'].format(nd=job['nd']))
+    if job['solver'] == 'fdm':
+        # the finite difference solver expects the output folders
+        for sub in subfolders:
+            os.makedirs(os.path.join(output,sub), exist_ok=True)
+    else:
+        os.makedirs(folder, exist_ok=True)
+
+    values = {int(i): value for i, value in job['values'].items()}
+    for key in ['nd', 're', 'dt', 'seed', 'ipr']:
+        values[lines[key]] = job[key]
+    # the threads of the job are set by PYFFTW_NUM_THREADS
+    values[lines['nthreads']] = 0
+
+    l1 = read_input(solver['input'])
+    ns = int(values.get(lines['ns'], l1[lines['ns']][0]))
+
+    istart = last_output(output)
+    if job['solver'] == 'spectral' and os.path.exists(os.path.join(output,'checkpoint.npz')):
+        values[lines['ichkp']] = 2
+    elif job['solver'] == 'spectral' and 0 < istart < ns:
+        values[lines['ichkp']] = 1
+        values[lines['istart']] = istart
+    elif 'ichkp' in lines:
+        values[lines['ichkp']] = 0
+
+    write_input(solver['input'], os.path.join(folder,'input.txt'), values)
+
+    return folder, ns, output
+
+#%%
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+#%%
+def recover_jobs(sweep, stale):
+
+    '''
+    return the jobs left in running by a crashed runner to pending: runners
+    of this host that are no longer alive, or any runner whose heartbeat
+    (modification time of the queue file) is older than stale seconds
+
+    Output
+    ------
+    names : names of the recovered jobs
+    '''
+
+    names = []
+    for filename in glob.glob(os.path.join(sweep,'queue','running','*.json')):
+        try:
+            job = read_json(filename)
+            age = tm.time() - os.path.getmtime(filename)
+        except (OSError, ValueError):
+            continue
+        claim = job.get('claim', {})
+        if claim.get('host') == host:
+            crashed = not pid_alive(claim.get('pid', -1))
+        else:
+            crashed = age > stale
+        if crashed:
+            name = os.path.basename(filename)[:-5]
+            try:
+                os.rename(filename, os.path.join(sweep,'queue','pending',name+'.json'))
+                names.append(name)
+            except FileNotFoundError:
+                pass
+
+    return names
+
+#%%
+def claim_job(sweep):
+
+    '''
+    move the first pending job to running, None if no job is left (a job
+    taken by another runner at the same time is skipped)
+    '''
+
+    for filename in sorted(glob.glob(os.path.join(sweep,'queue','pending','*.json'))):
+        name = os.path.basename(filename)[:-5]
+        running = os.path.join(sweep,'queue','running',name+'.json')
+        # heartbeat before the rename (which keeps the modification time), so
+        # that recover_jobs never sees the age of the pending file
+        try:
+            os.utime(filename, None)
+            os.rename(filename, running)
+        except FileNotFoundError:
+            continue
+        job = read_json(running)
+        job['claim'] = {'host': host, 'pid': os.getpid(), 'time': tm.time()}
+        write_json(running, job)
+        return name, job
+
+    return None
+
+#%%
+class SweepState(object):
+
+    '''
+    status of the jobs run on this host, saved to state_<host>.json after
+    every change
+    '''
+
+    def __init__(self, sweep):
+        self.filename = os.path.join(sweep,'state_'+host+'.json')
+        self.jobs = read_json(self.filename) if os.path.exists(self.filename) else {}
+
+    def update(self, name, **record):
+        self.jobs.setdefault(name, {}).update(record)
+        write_json(self.filename, self.jobs)
+
+#%%
+def run_sweep(sweep, njobs, threads, stale=600.0, poll=5.0, retry_failed=False):
+
+    '''
+    run the jobs of the sweep until the queue is empty
+
+    Inputs
+    ------
+    sweep : sweep directory
+    njobs : number of solver processes run at the same time
+    threads : FFTW and BLAS threads of every solver process
+    stale : age in seconds of the heartbeat after which a job of another host
+            is taken as crashed
+    poll : time in seconds between two checks of the running jobs
+    retry_failed : return the failed jobs to the queue first
+    '''
+
+    state = SweepState(sweep)
+
+    if retry_failed:
+        for filename in glob.glob(os.path.join(sweep,'queue','failed','*.json')):
+            os.rename(filename, os.path.join(sweep,'queue','pending',os.path.basename(filename)))
+
+    for name in recover_jobs(sweep, stale):
+        print('recovered', name)
+
+    # all jobs share one FFTW wisdom file
+    env = dict(os.environ, MPLBACKEND='Agg',
+               FFTW_WISDOM=os.path.abspath(os.path.join(sweep,'fftw_wisdom.dat')))
+    for key in ['PYFFTW_NUM_THREADS', 'OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS',
+                'NUMBA_NUM_THREADS']:
+        env[key] = str(threads)
+
+    active = {}
+    while True:
+        # start jobs in the free slots
+        while len(active) < njobs:
+            claimed = claim_job(sweep)
+            if claimed is None:
+                break
+            name, job = claimed
+            # a job that cannot be prepared or started fails like a failed run
+            try:
+                folder, ns, output = prepare_job(sweep, name, job)
+                log = open(os.path.join(folder,'run.log'), 'a')
+                process = subprocess.Popen([sys.executable, solvers[job['solver']]['script']],
+                                           cwd=folder, env=env, stdout=log, stderr=subprocess.STDOUT)
+            except (OSError, ValueError, IndexError, KeyError) as error:
+                os.rename(os.path.join(sweep,'queue','running',name+'.json'),
+                          os.path.join(sweep,'queue','failed',name+'.json'))
+                state.update(name, status='failed', end=tm.time(), error=repr(error))
+                print('failed', name, '('+repr(error)+')')
+                continue
+            active[name] = (process, log, ns, output)
+            state.update(name, status='running', start=tm.time(), threads=threads,
+                         restart=last_output(output))
+            print('started', name)
+
+        if not active:
+            # jobs of crashed runners on other hosts become pending when
+            # their heartbeat is stale
+            if recover_jobs(sweep, stale):
+                continue
+            break
+
+        tm.sleep(poll)
+
+        for name in list(active):
+            process, log, ns, output = active[name]
+            running = os.path.join(sweep,'queue','running',name+'.json')
+            returncode = process.poll()
+            if returncode is None:
+                # heartbeat
+                try:
+                    os.utime(running, None)
+                except FileNotFoundError:
+                    pass
+                continue
+
+            log.close()
+            del active[name]
+
+            # the run is complete when the last output is written, also if the
+            # plots at the end of the solver fail
+            complete = last_output(output) >= ns
+            status = 'done' if complete else 'failed'
+            os.rename(running, os.path.join(sweep,'queue',status,name+'.json'))
+            state.update(name, status=status, end=tm.time(), returncode=returncode)
+            print(status, name, '(exit code '+str(returncode)+')')
+
+#%%
+def sweep_status(sweep):
+
+    '''
+    print the number of jobs in every queue state and the unfinished jobs
+    '''
+
+    for state in states:
+        names = sorted(os.path.basename(f)[:-5]
+                       for f in glob.glob(os.path.join(sweep,'queue',state,'*.json')))
+        print('%8s %6d' % (state, len(names)))
+        if state in ['running', 'failed']:
+            for name in names:
+                print('         ', name)
+
+#%%
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='parameter sweeps of the spectral and fdm solvers')
+    subparsers = parser.add_subparsers(dest='command')
+
+    parser_create = subparsers.add_parser('create', help='create a sweep or add jobs to it')
+    parser_create.add_argument('sweep', help='sweep directory')
+    parser_create.add_argument('--solver', nargs='+', default=['spectral'], choices=list(solvers))
+    parser_create.add_argument('--nd', type=int, nargs='+', default=[256], help='grid sizes')
+    parser_create.add_argument('--re', type=float, nargs='+', default=[4000.0], help='Reynolds numbers')
+    parser_create.add_argument('--dt', type=float, nargs='+', default=[5.0e-4], help='time steps')
+    parser_create.add_argument('--seed', type=int, nargs='+', default=[1], help='seeds of the decay problem')
+    parser_create.add_argument('--ipr', type=int, nargs='+', default=[3], help='problems')
+    parser_create.add_argument('--set', nargs='*', default=[],
+                               help='further input.txt lines, line=value for all jobs or '
+                                    'solver:line=value for the jobs of one solver (line from 0)')
+
+    parser_run = subparsers.add_parser('run', help='run jobs of a sweep')
+    parser_run.add_argument('sweep', help='sweep directory')
+    parser_run.add_argument('-t', type=int, default=1, help='FFTW threads per job')
+    parser_run.add_argument('-j', type=int, default=None, help='jobs at the same time (default: cores/t)')
+    parser_run.add_argument('--stale', type=float, default=600.0,
+                            help='seconds without heartbeat after which a job of another host is rerun')
+    parser_run.add_argument('--poll', type=float, default=5.0, help='seconds between checks of the jobs')
+    parser_run.add_argument('--retry-failed', action='store_true', help='queue the failed jobs again')
+
+    parser_status = subparsers.add_parser('status', help='show the jobs of a sweep')
+    parser_status.add_argument('sweep', help='sweep directory')
+
+    args = parser.parse_args()
+
+    if args.command == 'create':
+        grid = {'solver': args.solver, 'nd': args.nd, 're': args.re, 'dt': args.dt,
+                'seed': args.seed, 'ipr': args.ipr}
+        values = {solver: {} for solver in solvers}
+        for item in args.set:
+            line, value = item.split('=',1)
+            if ':' in line:
+                solver, line = line.split(':',1)
+                if solver not in solvers:
+                    parser.error('unknown solver in --set '+item)
+                values[solver][line] = value
+            else:
+                for solver in solvers:
+                    values[solver][line] = value
+        print('jobs added:', create_sweep(args.sweep, grid, values))
+    elif args.command == 'run':
+        njobs = args.j if args.j is not None else max(1, int((os.cpu_count() or 1)/args.t))
+        run_sweep(args.sweep, njobs, args.t, args.stale, args.poll, args.retry_failed)
+    elif args.command == 'status':
+        sweep_status(args.sweep)
+    else:
+        parser.print_help()